@@ -0,0 +1,136 @@
+"""Лента изменений документов: монотонный seq на каждое добавление/изменение/удаление документа.
+Состояние (seq, отпечатки файлов, последний seq по doc_key) хранится в DATA_PATH/changes.json (Settings.changes_path)."""
+import json
+import logging
+import os
+import threading
+import uuid
+from pathlib import Path
+from typing import Any
+
+from datastore.docs import iter_documents_from_files, list_document_files
+
+log = logging.getLogger(__name__)
+
+
+def _doc_key(doc: dict[str, Any]) -> str:
+    """Ключ, под которым документ индексирует MCP-server (path, по умолчанию doc_id)."""
+    return doc.get("path") or doc.get("doc_id") or ""
+
+
+class ChangeLog:
+    """Компактная лента: по каждому doc_key хранится только последнее изменение.
+    sync() сверяет папку по отпечаткам файлов (mtime_ns, size) и выдаёт новый seq только изменившимся документам;
+    вызывается при старте и после записи (upload/delete). changes() отдаёт страницы из сохранённой ленты и делает
+    sync, только если сменилась папка-источник или её mtime (файл добавлен, удалён или переименован извне).
+    epoch меняется при потере состояния — потребитель по нему понимает, что курсор надо сбросить."""
+
+    def __init__(self, path: Path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._state: dict[str, Any] | None = None
+        # (папка, её mtime_ns) на момент последнего sync.
+        self._synced: tuple[str, int] | None = None
+
+    def _load(self) -> dict[str, Any]:
+        if self._state is None:
+            if self._path.exists():
+                self._state = json.loads(self._path.read_text(encoding="utf-8"))
+            else:
+                self._state = {"epoch": uuid.uuid4().hex, "seq": 0, "files": {}, "docs": {}}
+        return self._state
+
+    def _persist(self, state: dict[str, Any]) -> None:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(state, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self._path)
+
+    def _record(self, state: dict[str, Any], key: str, *, file: str, deleted: bool) -> None:
+        state["seq"] += 1
+        state["docs"][key] = {"seq": state["seq"], "file": file, "deleted": deleted}
+
+    @staticmethod
+    def _mark(folder: Path) -> tuple[str, int]:
+        try:
+            return str(folder), folder.stat().st_mtime_ns
+        except FileNotFoundError:
+            return str(folder), -1
+
+    def sync(self, folder: Path) -> dict[str, Any]:
+        """Сверить состояние с папкой-источником; изменения получают новый seq. Возвращает состояние."""
+        with self._lock:
+            # Отметка — до обхода: изменение папки во время обхода заметит следующий refresh.
+            self._synced = self._mark(folder)
+            state = self._load()
+            files, docs = state["files"], state["docs"]
+            changed = False
+            current: set[str] = set()
+            for f in list_document_files(folder):
+                name = str(f)
+                current.add(name)
+                st = f.stat()
+                fp = [st.st_mtime_ns, st.st_size]
+                known = files.get(name)
+                if known is not None and known["fp"] == fp:
+                    continue
+                keys = [k for k in (_doc_key(d) for d in iter_documents_from_files([f])) if k]
+                for key in keys:
+                    self._record(state, key, file=name, deleted=False)
+                for key in (known or {}).get("docs", []):
+                    if key not in keys and docs.get(key, {}).get("file") == name:
+                        self._record(state, key, file=name, deleted=True)
+                files[name] = {"fp": fp, "docs": keys}
+                changed = True
+            for name in [n for n in files if n not in current]:
+                for key in files.pop(name)["docs"]:
+                    entry = docs.get(key)
+                    if entry is not None and entry["file"] == name and not entry["deleted"]:
+                        self._record(state, key, file=name, deleted=True)
+                changed = True
+            if changed:
+                self._persist(state)
+                log.info("changes synced: seq=%d docs=%d", state["seq"], len(docs))
+            return state
+
+    def refresh(self, folder: Path) -> dict[str, Any]:
+        """sync, если со времени прошлого сменилась папка-источник или её mtime; иначе — сохранённое состояние.
+        Правка существующего файла на месте mtime папки не меняет: такие изменения — через upload или sync."""
+        with self._lock:
+            if self._synced == self._mark(folder):
+                return self._load()
+        return self.sync(folder)
+
+    def changes(self, folder: Path, since: int, limit: int) -> dict[str, Any]:
+        """Изменения с seq > since по возрастанию seq, не больше limit; изменённые документы — целиком."""
+        state = self.refresh(folder)
+        with self._lock:
+            pending = sorted(
+                (entry["seq"], key, entry["file"], entry["deleted"])
+                for key, entry in state["docs"].items()
+                if entry["seq"] > since
+            )
+        page = pending[:limit]
+        by_file: dict[str, dict[str, dict[str, Any]]] = {}
+        for _, key, file, deleted in page:
+            if not deleted and file not in by_file:
+                try:
+                    by_file[file] = {_doc_key(d): d for d in iter_documents_from_files([Path(file)])}
+                except FileNotFoundError:
+                    by_file[file] = {}
+        out: list[dict[str, Any]] = []
+        for seq, key, file, deleted in page:
+            item: dict[str, Any] = {"seq": seq, "doc_key": key, "deleted": deleted}
+            if not deleted:
+                doc = by_file.get(file, {}).get(key)
+                if doc is None:
+                    # Файл изменился между sync и чтением: изменение придёт со следующим seq.
+                    continue
+                item["document"] = doc
+            out.append(item)
+        return {
+            "epoch": state["epoch"],
+            "changes": out,
+            "last_seq": page[-1][0] if page else since,
+            "has_more": len(pending) > limit,
+        }
@@ -3,7 +3,7 @@ import json
 import logging
 import re
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterable, Iterator
 
 log = logging.getLogger(__name__)
 
@@ -57,28 +57,35 @@ def _parse_json_docs(data: Any) -> list[dict[str, Any]]:
     return out
 
 
-def read_documents_from_folder(
-    folder: Path,
-    doc_key: str | None = None,
-) -> list[dict[str, Any]]:
-    """
-    Читает документы из папки: glob *.json, парсинг одиночного объекта или массива documents,
-    нормализация в формат loader.
-    Если doc_key задан — возвращает только документ с этим doc_key (или пустой список).
-    """
+def list_document_files(folder: Path) -> list[Path]:
+    """JSON-файлы папки в порядке имени (имя файла — курсор постраничной выдачи)."""
     if not folder.exists() or not folder.is_dir():
         return []
+    return sorted(folder.glob("*.json"))
 
-    out: list[dict[str, Any]] = []
-    for f in sorted(folder.glob("*.json")):
+
+def iter_documents_from_files(files: Iterable[Path]) -> Iterator[dict[str, Any]]:
+    """Документы из файлов по одному: в памяти только текущий файл."""
+    for f in files:
         raw = f.read_text(encoding="utf-8")
         try:
             data = json.loads(raw)
         except json.JSONDecodeError:
             log.warning("Skipping invalid JSON file: %s", f.name)
             continue
-        out.extend(_parse_json_docs(data))
+        yield from _parse_json_docs(data)
 
+
+def read_documents_from_folder(
+    folder: Path,
+    doc_key: str | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Читает документы из папки: glob *.json, парсинг одиночного объекта или массива documents,
+    нормализация в формат loader.
+    Если doc_key задан — возвращает только документ с этим doc_key (или пустой список).
+    """
+    out = list(iter_documents_from_files(list_document_files(folder)))
     if doc_key is not None:
         out = [d for d in out if d.get("doc_id") == doc_key]
     return out
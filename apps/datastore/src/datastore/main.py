@@ -1,24 +1,33 @@
 """Точка входа FastAPI."""
 import json
 import logging
+from contextlib import asynccontextmanager
 from pathlib import Path
 
 from fastapi import FastAPI, File, HTTPException, Query, UploadFile
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 
-from datastore.docs import read_documents_from_folder
+from datastore.changes import ChangeLog
+from datastore.docs import iter_documents_from_files, list_document_files, read_documents_from_folder
 from datastore.schemas import DocumentIn
 from datastore.settings import Settings
 
 log = logging.getLogger(__name__)
 
-app = FastAPI(title="Datastore", description="Хранилище документов для RAG (upload/read/delete)")
+_change_log: ChangeLog | None = None
 
 
 def _get_settings() -> Settings:
     return Settings()
 
 
+def _get_change_log(settings: Settings) -> ChangeLog:
+    global _change_log
+    if _change_log is None:
+        _change_log = ChangeLog(settings.changes_path)
+    return _change_log
+
+
 def _source_folder(settings: Settings) -> Path:
     """Папка-источник: knowledge_base если не пуста, иначе demo."""
     kb = settings.knowledge_base_path
@@ -27,6 +36,21 @@ def _source_folder(settings: Settings) -> Path:
     return settings.demo_path
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Лента сверяется с папкой один раз при старте; дальше — после upload/delete, GET /changes читает сохранённую.
+    settings = _get_settings()
+    _get_change_log(settings).sync(_source_folder(settings))
+    yield
+
+
+app = FastAPI(
+    title="Datastore",
+    description="Хранилище документов для RAG (upload/read/delete)",
+    lifespan=lifespan,
+)
+
+
 # ---- GET /read ----
 @app.get("/read", response_model=None)
 def read(
@@ -41,6 +65,43 @@ def read(
     return JSONResponse(content={"documents": documents})
 
 
+# ---- GET /read/stream ----
+@app.get("/read/stream", response_model=None)
+def read_stream(
+    after: str | None = Query(None, description="Курсор: имя последнего файла предыдущей страницы"),
+    limit: int = Query(100, ge=1, le=1000, description="Файлов на страницу"),
+):
+    """
+    Постраничная выдача в NDJSON (по документу в строке), документы читаются и отдаются по одному.
+    Заголовок X-Next-Cursor — курсор следующей страницы; его нет на последней странице.
+    """
+    settings = _get_settings()
+    files = [f for f in list_document_files(_source_folder(settings)) if after is None or f.name > after]
+    page = files[:limit]
+    headers = {"X-Next-Cursor": page[-1].name} if len(files) > limit else {}
+
+    def _lines():
+        for doc in iter_documents_from_files(page):
+            yield json.dumps(doc, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(_lines(), media_type="application/x-ndjson", headers=headers)
+
+
+# ---- GET /changes ----
+@app.get("/changes")
+def changes(
+    since: int = Query(0, ge=0, description="Последний обработанный seq (0 — с начала)"),
+    limit: int = Query(100, ge=1, le=1000, description="Изменений на страницу"),
+):
+    """
+    Лента изменений: {"epoch", "changes": [{"seq", "doc_key", "deleted", "document"?}], "last_seq", "has_more"}.
+    По каждому doc_key — только последнее изменение; удалённые документы приходят с deleted=true.
+    Смена epoch означает, что состояние ленты потеряно и курсор потребителя нужно сбросить в 0.
+    """
+    settings = _get_settings()
+    return _get_change_log(settings).changes(_source_folder(settings), since, limit)
+
+
 # ---- POST /upload ----
 @app.post("/upload")
 def upload(files: list[UploadFile] = File(...)):
@@ -79,6 +140,8 @@ def upload(files: list[UploadFile] = File(...)):
             encoding="utf-8",
         )
         saved.append(doc.doc_key)
+    if saved:
+        _get_change_log(settings).sync(_source_folder(settings))
     if errors:
         log.warning("upload validation failed: %s", "; ".join(errors))
         raise HTTPException(status_code=400, detail="; ".join(errors))
@@ -100,6 +163,7 @@ def delete(
         path = kb / f"{doc_key}.json"
         if path.exists():
             path.unlink()
+            _get_change_log(settings).sync(_source_folder(settings))
             log.info("deleted document: %s", doc_key)
             return {"deleted": [doc_key]}
         return {"deleted": []}
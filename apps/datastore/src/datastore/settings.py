@@ -6,6 +6,7 @@ from pydantic_settings import BaseSettings, SettingsConfigDict
 # Имена подпапок под DATA_PATH
 KNOWLEDGE_BASE_DIR = "knowledge_base"
 DEMO_DIR = "demo"
+CHANGES_FILE = "changes.json"
 
 
 class Settings(BaseSettings):
@@ -26,3 +27,7 @@ class Settings(BaseSettings):
     @property
     def demo_path(self) -> Path:
         return Path(self.data_path) / DEMO_DIR
+
+    @property
+    def changes_path(self) -> Path:
+        return Path(self.data_path) / CHANGES_FILE
@@ -12,8 +12,8 @@ _settings = Settings()
 
 
 @router.post("/upload")
-async def post_upload(files: list[UploadFile] = File(...)):
-    """Проксировать upload в orchestrator."""
+async def post_upload(files: list[UploadFile] = File(...), wait: bool = Query(default=False)):
+    """Проксировать upload в orchestrator. По умолчанию не ждать ingest: в ответе ingest_job_id."""
     url = (_settings.orchestrator_url or "").rstrip("/") + "/rag/upload"
     parts = []
     for uf in files:
@@ -22,16 +22,40 @@ async def post_upload(files: list[UploadFile] = File(...)):
         parts.append(("files", (name, body, "application/json")))
     try:
         async with httpx.AsyncClient(timeout=120.0) as client:
-            resp = await client.post(url, files=parts)
+            resp = await client.post(url, files=parts, params={"wait": wait})
     except httpx.RequestError as e:
         raise HTTPException(status_code=502, detail=f"orchestrator: {e}") from e
     return Response(content=resp.content, status_code=resp.status_code, media_type=resp.headers.get("content-type"))
 
 
 @router.post("/ingest")
-async def post_ingest():
-    """Проксировать ingest в orchestrator."""
+async def post_ingest(full: bool = Query(default=False), wait: bool = Query(default=False)):
+    """Проксировать ingest в orchestrator. По умолчанию не ждать завершения: 202 с job_id, статус — GET /ingest/{job_id}."""
     url = (_settings.orchestrator_url or "").rstrip("/") + "/rag/ingest"
+    try:
+        async with httpx.AsyncClient(timeout=120.0) as client:
+            resp = await client.post(url, params={"full": full, "wait": wait})
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=502, detail=f"orchestrator: {e}") from e
+    return Response(content=resp.content, status_code=resp.status_code, media_type=resp.headers.get("content-type"))
+
+
+@router.get("/ingest/{job_id}")
+async def get_ingest_job(job_id: str):
+    """Проксировать статус задачи ingest в orchestrator."""
+    url = (_settings.orchestrator_url or "").rstrip("/") + f"/rag/ingest/{job_id}"
+    try:
+        async with httpx.AsyncClient(timeout=120.0) as client:
+            resp = await client.get(url)
+    except httpx.RequestError as e:
+        raise HTTPException(status_code=502, detail=f"orchestrator: {e}") from e
+    return Response(content=resp.content, status_code=resp.status_code, media_type=resp.headers.get("content-type"))
+
+
+@router.post("/ingest/{job_id}/cancel")
+async def post_ingest_cancel(job_id: str):
+    """Проксировать отмену задачи ingest в orchestrator."""
+    url = (_settings.orchestrator_url or "").rstrip("/") + f"/rag/ingest/{job_id}/cancel"
     try:
         async with httpx.AsyncClient(timeout=120.0) as client:
             resp = await client.post(url)
@@ -5,6 +5,9 @@ from typing import Any
 from audit import audit_event
 
 MAX_QUERY_LEN = 1000
+MAX_BATCH_QUERIES = 8
+MAX_CHUNK_IDS = 20
+MAX_EXPAND_WINDOW = 3
 K_MIN, K_MAX = 1, 10
 ALLOWED_FILTER_KEYS = frozenset({"doc_type", "language"})
 SQL_MAX_ROWS = 200
@@ -33,6 +36,18 @@ def validate_k(k: int) -> None:
         raise PolicyError(f"k must be between {K_MIN} and {K_MAX}, got {k}")
 
 
+def validate_expand(expand: int) -> None:
+    if not isinstance(expand, int) or not (0 <= expand <= MAX_EXPAND_WINDOW):
+        audit_event("policy.blocked", reason=f"expand must be between 0 and {MAX_EXPAND_WINDOW}, got {expand}", validator="validate_expand")
+        raise PolicyError(f"expand must be between 0 and {MAX_EXPAND_WINDOW}, got {expand}")
+
+
+def validate_job_id(job_id: str) -> None:
+    if not job_id or not isinstance(job_id, str) or not job_id.strip():
+        audit_event("policy.blocked", reason="job_id is required and must be non-empty string", validator="validate_job_id")
+        raise PolicyError("job_id is required and must be non-empty string")
+
+
 def validate_query(query: str) -> None:
     if not query or not isinstance(query, str):
         audit_event("policy.blocked", reason="query is required and must be non-empty string", validator="validate_query")
@@ -42,6 +57,30 @@ def validate_query(query: str) -> None:
         raise PolicyError(f"query must be at most {MAX_QUERY_LEN} characters")
 
 
+def validate_queries(queries: list[str]) -> None:
+    if not queries or not isinstance(queries, list):
+        audit_event("policy.blocked", reason="queries is required and must be non-empty list", validator="validate_queries")
+        raise PolicyError("queries is required and must be non-empty list")
+    if len(queries) > MAX_BATCH_QUERIES:
+        audit_event("policy.blocked", reason=f"queries must contain at most {MAX_BATCH_QUERIES} items", validator="validate_queries")
+        raise PolicyError(f"queries must contain at most {MAX_BATCH_QUERIES} items")
+    for q in queries:
+        validate_query(q)
+
+
+def validate_chunk_ids(chunk_ids: list[str]) -> None:
+    if not chunk_ids or not isinstance(chunk_ids, list):
+        audit_event("policy.blocked", reason="chunk_ids is required and must be non-empty list", validator="validate_chunk_ids")
+        raise PolicyError("chunk_ids is required and must be non-empty list")
+    if len(chunk_ids) > MAX_CHUNK_IDS:
+        audit_event("policy.blocked", reason=f"chunk_ids must contain at most {MAX_CHUNK_IDS} items", validator="validate_chunk_ids")
+        raise PolicyError(f"chunk_ids must contain at most {MAX_CHUNK_IDS} items")
+    for cid in chunk_ids:
+        if not cid or not isinstance(cid, str) or not cid.strip():
+            audit_event("policy.blocked", reason="chunk_id is required and must be non-empty string", validator="validate_chunk_ids")
+            raise PolicyError("chunk_id is required and must be non-empty string")
+
+
 def validate_filters(filters: dict[str, Any] | None) -> dict[str, Any]:
     if filters is None:
         return {}
@@ -0,0 +1,94 @@
+"""In-process LRU payload'ов чанков (kb_get_chunk / kb_get_chunks) с инвалидацией по doc_id при переиндексации."""
+import threading
+from typing import Any
+
+from mcp_server.rag.lru import LRUCache
+from mcp_server.settings import Settings
+
+_settings = Settings()
+
+
+class ChunkCache:
+    """chunk_id -> payload; дополнительно doc_id -> {chunk_id} для сброса всех чанков документа.
+    Поколения: invalidate_doc запоминает номер сброса документа, put с payload, прочитанным до сброса
+    (generation() взят раньше), отбрасывается — параллельный get_chunks не вернёт в кэш старый текст."""
+
+    def __init__(self, maxsize: int):
+        self._lru = LRUCache(maxsize)
+        self._by_doc: dict[str, set[str]] = {}
+        self._generation = 0
+        self._doc_generation: dict[str, int] = {}
+        self._cleared_generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, chunk_id: str) -> dict[str, Any] | None:
+        return self._lru.get(chunk_id)
+
+    def generation(self) -> int:
+        """Текущее поколение: берётся перед чтением из store и передаётся в put."""
+        with self._lock:
+            return self._generation
+
+    def put(self, chunk_id: str, payload: dict[str, Any], generation: int | None = None) -> None:
+        doc_id = str(payload.get("doc_id", ""))
+        with self._lock:
+            if generation is not None and max(self._cleared_generation, self._doc_generation.get(doc_id, 0)) > generation:
+                return
+            evicted = self._lru.put(chunk_id, payload)
+            if doc_id:
+                self._by_doc.setdefault(doc_id, set()).add(chunk_id)
+            for cid, old in evicted:
+                self._unlink(str(old.get("doc_id", "")), cid)
+
+    def _unlink(self, doc_id: str, chunk_id: str) -> None:
+        chunk_ids = self._by_doc.get(doc_id)
+        if chunk_ids is not None:
+            chunk_ids.discard(chunk_id)
+            if not chunk_ids:
+                del self._by_doc[doc_id]
+
+    def invalidate_doc(self, doc_id: str) -> None:
+        """Сбросить чанки документа; вызывать после commit записи, чтобы читатели не закэшировали старую версию."""
+        doc_id = str(doc_id)
+        with self._lock:
+            self._generation += 1
+            self._doc_generation[doc_id] = self._generation
+            chunk_ids = self._by_doc.pop(doc_id, set())
+            for cid in chunk_ids:
+                self._lru.pop(cid)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._cleared_generation = self._generation
+            self._doc_generation.clear()
+            self._by_doc.clear()
+            self._lru.clear()
+
+    def stats(self) -> dict[str, int]:
+        return self._lru.stats()
+
+
+_chunk_cache = ChunkCache(_settings.rag_chunk_cache_size)
+
+
+def get_chunk_cache() -> ChunkCache:
+    return _chunk_cache
+
+
+def get_chunks(store: Any, chunk_ids: list[str]) -> dict[str, dict[str, Any]]:
+    """Payload'ы чанков: из кэша, промахи — одним store.get_by_ids. Ненайденные id в ответ не попадают."""
+    out: dict[str, dict[str, Any]] = {}
+    missing: list[str] = []
+    for cid in chunk_ids:
+        cached = _chunk_cache.get(cid)
+        if cached is not None:
+            out[cid] = cached
+        elif cid not in missing:
+            missing.append(cid)
+    if missing:
+        generation = _chunk_cache.generation()
+        for cid, payload in store.get_by_ids(missing).items():
+            _chunk_cache.put(cid, payload, generation)
+            out[cid] = payload
+    return out
@@ -1,16 +1,125 @@
-"""Общий синглтон модели эмбеддингов для RAG (retrieve + ingest)."""
+"""Общий синглтон модели эмбеддингов для RAG (retrieve + ingest) и LRU-кэш эмбеддингов запросов."""
+import logging
+import threading
 from typing import Any
 
+from mcp_server.rag.embedding_batcher import EmbeddingBatcher
+from mcp_server.rag.lru import LRUCache
 from mcp_server.settings import Settings
 
+log = logging.getLogger(__name__)
 _settings = Settings()
 _model: Any = None
+_model_name: str | None = None
+_model_lock = threading.Lock()
+_batcher: EmbeddingBatcher | None = None
+
+
+def normalize_query(query: str) -> str:
+    """Нормализация текста запроса для ключа кэша: обрезка и схлопывание пробелов."""
+    return " ".join(query.split())
+
+
+_query_cache = LRUCache(_settings.rag_query_cache_size, _settings.rag_query_cache_ttl_s)
+
+
+def model_identity(name: str | None = None, backend: str | None = None) -> str:
+    """Идентификатор модели для ключей кэшей: имя + backend (векторы разных backend не смешиваются)."""
+    return f"{name or _settings.rag_embedding_model}:{backend or _settings.rag_embedding_backend}"
+
+
+def load_embedding_model(name: str, backend: str = "torch") -> Any:
+    """Загрузить SentenceTransformer с заданным backend: torch | onnx | onnx_int8.
+    Контракт encode() одинаковый для всех backend (retrieve.py, indexer.py не меняются)."""
+    from sentence_transformers import SentenceTransformer
+    if backend == "torch":
+        return SentenceTransformer(name)
+    if backend == "onnx":
+        return SentenceTransformer(name, backend="onnx")
+    if backend == "onnx_int8":
+        return _load_onnx_int8(name)
+    raise ValueError(f"unknown rag_embedding_backend: {backend!r} (expected torch | onnx | onnx_int8)")
+
+
+def _load_onnx_int8(name: str) -> Any:
+    """ONNX int8 (dynamic quantization). Квантованная модель кэшируется в rag_onnx_cache_dir."""
+    from pathlib import Path
+
+    from sentence_transformers import SentenceTransformer, export_dynamic_quantized_onnx_model
+
+    config = _settings.rag_onnx_quantization
+    file_name = f"onnx/model_qint8_{config}.onnx"
+    local_dir = Path(_settings.rag_onnx_cache_dir) / name.replace("/", "__")
+    if not (local_dir / file_name).exists():
+        log.info("[RAG] exporting int8 ONNX model name=%s config=%s dir=%s", name, config, local_dir)
+        fp32 = SentenceTransformer(name, backend="onnx")
+        fp32.save(str(local_dir))
+        export_dynamic_quantized_onnx_model(fp32, config, str(local_dir))
+    return SentenceTransformer(str(local_dir), backend="onnx", model_kwargs={"file_name": file_name})
 
 
 def get_embedding_model() -> Any:
-    """Возвращает единственный экземпляр SentenceTransformer в процессе."""
-    global _model
-    if _model is None:
-        from sentence_transformers import SentenceTransformer
-        _model = SentenceTransformer(_settings.rag_embedding_model)
+    """Возвращает единственный экземпляр модели эмбеддингов в процессе.
+    Модель и backend читаются из настроек при старте: их смена требует перезапуска процесса."""
+    global _model, _model_name
+    if _model is not None:
+        return _model
+    with _model_lock:
+        if _model is None:
+            _model = load_embedding_model(_settings.rag_embedding_model, _settings.rag_embedding_backend)
+            _model_name = model_identity()
     return _model
+
+
+def get_query_cache() -> LRUCache:
+    return _query_cache
+
+
+def get_batcher() -> EmbeddingBatcher:
+    """Синглтон микробатчера запросов (общий воркер encode для всех потоков)."""
+    global _batcher
+    if _batcher is None:
+        with _model_lock:
+            if _batcher is None:
+                _batcher = EmbeddingBatcher(
+                    get_embedding_model,
+                    max_batch_size=_settings.rag_embed_batch_max_size,
+                    max_wait_ms=_settings.rag_embed_batch_max_wait_ms,
+                    torch_threads=_settings.rag_embed_torch_threads,
+                )
+    return _batcher
+
+
+def encode_queries(queries: list[str]) -> list[tuple[list[float], bool]]:
+    """Эмбеддинги нескольких запросов через кэш; промахи кодируются одним батчем.
+    Возвращает [(вектор, cache_hit)] в порядке queries."""
+    texts = [normalize_query(q) for q in queries]
+    model = get_embedding_model()
+    name = _model_name or ""
+    out: list[tuple[list[float], bool] | None] = [None] * len(texts)
+    missing: list[str] = []
+    for i, text in enumerate(texts):
+        cached = _query_cache.get((name, text))
+        if cached is not None:
+            out[i] = (cached, True)
+        elif text not in missing:
+            missing.append(text)
+    if missing:
+        if _settings.rag_embed_batching:
+            batcher = get_batcher()
+            futures = [batcher.submit(t) for t in missing]
+            vectors = [f.result() for f in futures]
+        else:
+            vectors = model.encode(missing, show_progress_bar=False).tolist()
+        encoded = dict(zip(missing, vectors))
+        for text, vector in encoded.items():
+            _query_cache.put((name, text), vector)
+        for i, text in enumerate(texts):
+            if out[i] is None:
+                out[i] = (encoded[text], False)
+    return out  # type: ignore[return-value]
+
+
+def encode_query(query: str) -> tuple[list[float], bool]:
+    """Эмбеддинг одного запроса через кэш. Возвращает (вектор, cache_hit)."""
+    return encode_queries([query])[0]
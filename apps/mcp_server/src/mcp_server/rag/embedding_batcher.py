@@ -0,0 +1,104 @@
+"""Микробатчинг эмбеддингов запросов: очередь -> батч в окне max_wait -> один воркер -> вектор каждому вызывающему."""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable
+
+log = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class EmbeddingBatcher:
+    """Склеивает одиночные encode-запросы из разных потоков в батчи и кодирует их в одном выделенном потоке."""
+
+    def __init__(
+        self,
+        model_getter: Callable[[], Any],
+        *,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        torch_threads: int = 0,
+    ):
+        self._model_getter = model_getter
+        self._max_batch_size = max(1, max_batch_size)
+        self._max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self._torch_threads = torch_threads
+        self._queue: queue.Queue = queue.Queue()
+        self._worker: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    def _ensure_worker(self) -> None:
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+
+    def submit(self, text: str) -> Future:
+        self._ensure_worker()
+        fut: Future = Future()
+        self._queue.put((text, fut))
+        return fut
+
+    def encode(self, text: str, timeout: float | None = None) -> list[float]:
+        """Блокирующий encode одного текста через общий батч."""
+        return self.submit(text).result(timeout=timeout)
+
+    def shutdown(self) -> None:
+        worker = self._worker
+        if worker is None:
+            return
+        self._queue.put(_STOP)
+        worker.join(timeout=5)
+        self._worker = None
+
+    def _collect(self, first: Any) -> tuple[list[tuple[str, Future]], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self._max_wait_s
+        while len(batch) < self._max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self) -> None:
+        if self._torch_threads > 0:
+            try:
+                import torch
+                torch.set_num_threads(self._torch_threads)
+            except ImportError:
+                pass
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch, stop = self._collect(first)
+            batch = [(t, f) for t, f in batch if f.set_running_or_notify_cancel()]
+            if batch:
+                self._encode_batch(batch)
+            if stop:
+                return
+
+    def _encode_batch(self, batch: list[tuple[str, Future]]) -> None:
+        texts = [t for t, _ in batch]
+        try:
+            vectors = self._model_getter().encode(
+                texts, batch_size=len(texts), show_progress_bar=False
+            ).tolist()
+        except Exception as e:
+            log.exception("[RAG] embedding batch failed size=%d: %s", len(texts), e)
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        log.debug("[RAG] embedding batch size=%d", len(texts))
+        for (_, fut), vec in zip(batch, vectors):
+            fut.set_result(vec)
@@ -0,0 +1,83 @@
+"""Сравнение backend эмбеддингов: parity (косинус к torch-векторам) и latency/throughput.
+
+Запуск: python -m mcp_server.rag.embedding_bench --backends torch onnx onnx_int8
+"""
+import argparse
+import statistics
+import sys
+import time
+from typing import Any
+
+import numpy as np
+
+from mcp_server.rag.embedding import load_embedding_model
+from mcp_server.settings import Settings
+
+SAMPLE_TEXTS = [
+    "how to fix pgbouncer connection exhaustion",
+    "Stripe webhook backlog: retries and idempotency keys",
+    "kubectl rollout status stuck at 1 of 3 replicas",
+    "Elasticsearch cluster red after disk watermark exceeded",
+    "Redis evictions maxmemory-policy allkeys-lru cart cache",
+    "как откатить миграцию, которая вызвала простой",
+    "чеклист прод-деплоя: миграции, feature flags, мониторинг",
+    "онбординг: локальный запуск FastAPI сервисов",
+]
+
+
+def check_parity(reference: Any, candidate: Any, texts: list[str]) -> dict[str, float]:
+    """Косинусная близость векторов candidate к reference на одних и тех же текстах."""
+    ref = np.asarray(reference.encode(texts, show_progress_bar=False), dtype=np.float32)
+    cand = np.asarray(candidate.encode(texts, show_progress_bar=False), dtype=np.float32)
+    ref /= np.linalg.norm(ref, axis=1, keepdims=True)
+    cand /= np.linalg.norm(cand, axis=1, keepdims=True)
+    cos = (ref * cand).sum(axis=1)
+    return {"cos_min": float(cos.min()), "cos_mean": float(cos.mean())}
+
+
+def measure(model: Any, texts: list[str], iterations: int, batch_size: int) -> dict[str, float]:
+    """Latency одиночного запроса (p50/p95, мс) и throughput батчевого encode (текстов/с)."""
+    model.encode(texts[:1], show_progress_bar=False)
+    latencies = []
+    for i in range(iterations):
+        t0 = time.perf_counter()
+        model.encode([texts[i % len(texts)]], show_progress_bar=False)
+        latencies.append((time.perf_counter() - t0) * 1000)
+    batch = (texts * (batch_size // len(texts) + 1))[:batch_size]
+    t0 = time.perf_counter()
+    model.encode(batch, batch_size=batch_size, show_progress_bar=False)
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies), 2),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 2),
+        "throughput_per_s": round(batch_size / elapsed, 1),
+    }
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--model", default=Settings().rag_embedding_model)
+    parser.add_argument("--backends", nargs="+", default=["torch", "onnx", "onnx_int8"])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--min-cos", type=float, default=0.99, help="порог parity (cos_min) для не-torch backend")
+    args = parser.parse_args(argv)
+
+    reference = load_embedding_model(args.model, "torch")
+    ok = True
+    for backend in args.backends:
+        model = reference if backend == "torch" else load_embedding_model(args.model, backend)
+        row: dict[str, Any] = {"backend": backend}
+        row.update(measure(model, SAMPLE_TEXTS, args.iterations, args.batch_size))
+        if backend != "torch":
+            parity = check_parity(reference, model, SAMPLE_TEXTS)
+            row.update({k: round(v, 5) for k, v in parity.items()})
+            if parity["cos_min"] < args.min_cos:
+                ok = False
+        print(" ".join(f"{k}={v}" for k, v in row.items()))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
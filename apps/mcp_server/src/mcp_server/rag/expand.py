@@ -0,0 +1,99 @@
+"""Расширение hits соседними чанками: chunk_index ± window того же doc_id одним scroll,
+пересекающиеся окна склеиваются в один фрагмент без дублирования overlap (его длину чанкер пишет в payload)."""
+from typing import Any
+
+from mcp_server.rag.formats import truncate_preview
+from mcp_server.settings import Settings
+
+_settings = Settings()
+
+Hit = tuple[str, float, dict[str, Any]]
+
+_PASSAGE_FIELDS = ["doc_id", "doc_key", "title", "chunk_id", "chunk_index", "overlap", "text"]
+_MIN_PASSAGE_CHARS = 64
+# Чанки без поля overlap (проиндексированы раньше): совпадение короче этого — случайное, не перекрытие.
+_MIN_GUESSED_OVERLAP = 16
+
+
+def stitch(left: str, right: str, overlap: int | None, max_overlap: int = 0) -> str:
+    """Склеить соседние чанки. overlap — сколько первых символов right повторяют конец left (из payload чанка);
+    None — неизвестно (старый payload): самый длинный суффикс left, совпадающий с префиксом right, не короче
+    _MIN_GUESSED_OVERLAP и не длиннее max_overlap. Без перекрытия — через перевод строки."""
+    if overlap is not None:
+        if 0 < overlap <= len(right) and left.endswith(right[:overlap]):
+            return left + right[overlap:]
+        return left + "\n" + right
+    for n in range(min(len(left), len(right), max_overlap), _MIN_GUESSED_OVERLAP - 1, -1):
+        if left.endswith(right[:n]):
+            return left + right[n:]
+    return left + "\n" + right
+
+
+def _merge_ranges(spans: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged: list[tuple[int, int]] = []
+    for lo, hi in sorted(spans):
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+
+def expand_hits(store: Any, hits: list[Hit], window: int, max_chars: int | None = None) -> list[dict[str, Any]]:
+    """Фрагменты вокруг hits в порядке первого попадания. Общий объём текста — не больше max_chars;
+    фрагмент, не влезающий целиком, обрезается (truncated=True), остальные отбрасываются."""
+    budget = max_chars if max_chars is not None else _settings.rag_expand_max_chars
+    located: list[tuple[str, int, str]] = []
+    spans: dict[str, list[tuple[int, int]]] = {}
+    for cid, _, payload in hits:
+        doc_id, idx = payload.get("doc_id"), payload.get("chunk_index")
+        if doc_id is None or not isinstance(idx, int):
+            continue
+        located.append((str(doc_id), idx, cid))
+        spans.setdefault(str(doc_id), []).append((max(0, idx - window), idx + window))
+    # Порядок фрагментов — по первому hit внутри окна.
+    ranges: list[tuple[str, int, int]] = []
+    for doc_id, idx, _ in located:
+        for lo, hi in _merge_ranges(spans[doc_id]):
+            if lo <= idx <= hi and (doc_id, lo, hi) not in ranges:
+                ranges.append((doc_id, lo, hi))
+    hit_index = {(doc_id, idx): cid for doc_id, idx, cid in located}
+    by_doc: dict[str, dict[int, dict[str, Any]]] = {}
+    for payload in store.get_chunk_ranges(ranges, payload_fields=_PASSAGE_FIELDS):
+        by_doc.setdefault(str(payload.get("doc_id", "")), {})[int(payload["chunk_index"])] = payload
+    passages: list[dict[str, Any]] = []
+    for doc_id, lo, hi in ranges:
+        if budget < _MIN_PASSAGE_CHARS:
+            break
+        chunks = [by_doc.get(doc_id, {}).get(i) for i in range(lo, hi + 1)]
+        chunks = [c for c in chunks if c is not None]
+        if not chunks:
+            continue
+        text = ""
+        prev_index = None
+        for c in chunks:
+            piece = str(c.get("text", ""))
+            if text:
+                # Перекрытие есть только у непосредственного соседа; пропавший чанк между ними — склейка без него.
+                adjacent = c["chunk_index"] == prev_index + 1
+                overlap = c.get("overlap") if adjacent else 0
+                text = stitch(text, piece, overlap, _settings.rag_chunk_overlap * 2)
+            else:
+                text = piece
+            prev_index = c["chunk_index"]
+        truncated = len(text) > budget
+        if truncated:
+            text = truncate_preview(text, budget)
+        budget -= len(text)
+        passages.append({
+            "doc_id": doc_id,
+            "doc_key": chunks[0].get("doc_key"),
+            "title": chunks[0].get("title"),
+            "chunk_index_from": chunks[0]["chunk_index"],
+            "chunk_index_to": chunks[-1]["chunk_index"],
+            "chunk_ids": [c.get("chunk_id") for c in chunks],
+            "hit_ids": [hit_index[(doc_id, c["chunk_index"])] for c in chunks if (doc_id, c["chunk_index"]) in hit_index],
+            "text": text,
+            "truncated": truncated,
+        })
+    return passages
@@ -1,6 +1,8 @@
 """Нормализация и очистка текста перед чанкингом и перед отправкой в LLM."""
 import re
 
+PREVIEW_MAX_CHARS = 300
+
 
 def normalize_text(text: str) -> str:
     t = text.strip()
@@ -9,7 +11,7 @@ def normalize_text(text: str) -> str:
     return t.strip()
 
 
-def truncate_preview(text: str, max_chars: int = 300) -> str:
+def truncate_preview(text: str, max_chars: int = PREVIEW_MAX_CHARS) -> str:
     normalized = normalize_text(text)
     if len(normalized) <= max_chars:
         return normalized
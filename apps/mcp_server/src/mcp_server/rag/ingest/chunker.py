@@ -1,53 +1,321 @@
-"""Чанкинг текста с перекрытием."""
-from mcp_server.rag.store.models import ChunkMeta, make_chunk_id
+"""Чанкинг текста: окна символов с перекрытием (chars) или по структуре markdown в токенах модели (structured).
+iter_* — ленивые генераторы компактных ChunkRecord (ingest); chunk_* — списки ChunkMeta поверх них."""
+import math
+import re
+import threading
+from collections import Counter
+from typing import Callable, Iterable, Iterator
+
+from mcp_server.rag.store.models import ChunkMeta, ChunkRecord, make_chunk_id
 from mcp_server.settings import Settings
 
 _settings = Settings()
 
+# Счётчик токенов пачки текстов (без special tokens).
+TokenCounter = Callable[[list[str]], list[int]]
 
-def chunk_text(
-    text: str,
-    *,
-    doc_id: str,
-    title: str,
-    path: str = "",
-    document_type: str = "",
-    created_at: str = "",
-    section: str = "",
-    chunk_size: int | None = None,
-    overlap: int | None = None,
-) -> list[ChunkMeta]:
-    if not doc_id:
-        return []
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_FENCE_RE = re.compile(r"^(```|~~~)")
+# Уровни дробления блока, не влезающего в лимит: строки (списки, код), затем предложения.
+_SPLITTERS = [("\n", re.compile(r"\n+")), (" ", re.compile(r"(?<=[.!?…;])\s+"))]
+
+_tokenizer_lock = threading.Lock()
+
+
+def iter_text_chunks(text: str, *, chunk_size: int | None = None, overlap: int | None = None) -> Iterator[ChunkRecord]:
+    """Окна chunk_size символов с перекрытием overlap."""
     cs = chunk_size if chunk_size is not None else _settings.rag_chunk_size
     ov = overlap if overlap is not None else _settings.rag_chunk_overlap
     if ov >= cs:
         ov = max(0, cs - 1)
-    chunks: list[ChunkMeta] = []
     start = 0
     index = 0
+    prev_end = 0
     while start < len(text):
         end = start + cs
         piece = text[start:end]
         if not piece.strip():
             start = end - ov
             continue
-        chunk_id = make_chunk_id(doc_id, index)
-        meta = ChunkMeta(
-            chunk_id=chunk_id,
+        # Границы чанка после strip в исходном тексте: перекрытие с предыдущим считается по позициям, а не по совпадению строк.
+        lo = start + len(piece) - len(piece.lstrip())
+        hi = start + len(piece.rstrip())
+        yield ChunkRecord(chunk_index=index, text=text[lo:hi], overlap=max(0, min(prev_end, hi) - lo) if index else 0)
+        prev_end = hi
+        index += 1
+        start = end - ov
+
+
+def _to_meta(
+    records: Iterable[ChunkRecord],
+    *,
+    doc_id: str,
+    title: str,
+    path: str,
+    document_type: str,
+    created_at: str,
+    section: str = "",
+) -> list[ChunkMeta]:
+    return [
+        ChunkMeta(
+            chunk_id=make_chunk_id(doc_id, r.chunk_index),
             doc_id=doc_id,
             title=title,
             path=path,
             document_type=document_type,
             created_at=created_at,
-            section=section,
-            chunk_index=index,
-            text=piece.strip(),
+            section=r.section or section,
+            chunk_index=r.chunk_index,
+            text=r.text,
+            tokens=r.tokens,
         )
-        chunks.append(meta)
-        index += 1
-        start = end - ov
-    return chunks
+        for r in records
+    ]
+
+
+def chunk_text(
+    text: str,
+    *,
+    doc_id: str,
+    title: str,
+    path: str = "",
+    document_type: str = "",
+    created_at: str = "",
+    section: str = "",
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+) -> list[ChunkMeta]:
+    if not doc_id:
+        return []
+    return _to_meta(
+        iter_text_chunks(text, chunk_size=chunk_size, overlap=overlap),
+        doc_id=doc_id, title=title, path=path, document_type=document_type, created_at=created_at, section=section,
+    )
+
+
+def model_token_counter() -> tuple[TokenCounter, int]:
+    """Токенизатор модели эмбеддингов и лимит чанка по умолчанию (max_seq_length без [CLS]/[SEP]).
+    Быстрые токенизаторы HF не допускают параллельных вызовов из потоков — вызовы под lock."""
+    from mcp_server.rag.embedding import get_embedding_model
+
+    model = get_embedding_model()
+    tokenizer = model.tokenizer
+
+    def count(texts: list[str]) -> list[int]:
+        if not texts:
+            return []
+        with _tokenizer_lock:
+            ids = tokenizer(texts, add_special_tokens=False)["input_ids"]
+        return [len(x) for x in ids]
+
+    return count, max(16, int(model.max_seq_length or 512) - 2)
+
+
+def _sections(text: str) -> Iterator[tuple[str, list[str]]]:
+    """Markdown -> (путь заголовков, блоки) по секциям. Блок — абзац или fenced-код целиком; строка заголовка
+    прикрепляется к первому блоку секции. Единственный заголовок 1-го уровня — название документа, в путь не входит."""
+    single_h1 = sum(1 for ln in text.splitlines() if ln.startswith("# ")) == 1
+    path: list[tuple[int, str]] = []
+    blocks: list[str] = []
+    para: list[str] = []
+    heading: str | None = None
+    fence: str | None = None
+
+    def name() -> str:
+        return " > ".join(t for lvl, t in path if not (single_h1 and lvl == 1))
+
+    def flush_para() -> None:
+        nonlocal heading
+        block = "\n".join(para).strip()
+        para.clear()
+        if not block:
+            return
+        if heading is not None:
+            block = f"{heading}\n{block}"
+            heading = None
+        blocks.append(block)
+
+    def flush_section() -> tuple[str, list[str]] | None:
+        nonlocal heading
+        flush_para()
+        if heading is not None:
+            blocks.append(heading)
+            heading = None
+        if not blocks:
+            return None
+        section = (name(), list(blocks))
+        blocks.clear()
+        return section
+
+    for line in text.splitlines():
+        stripped = line.strip()
+        if fence is not None:
+            para.append(line)
+            if stripped.startswith(fence):
+                fence = None
+                flush_para()
+            continue
+        m = _FENCE_RE.match(stripped)
+        if m:
+            flush_para()
+            fence = m.group(1)
+            para.append(line)
+            continue
+        h = _HEADING_RE.match(stripped)
+        if h:
+            section = flush_section()
+            if section is not None:
+                yield section
+            level = len(h.group(1))
+            path = [p for p in path if p[0] < level] + [(level, h.group(2))]
+            heading = stripped
+            continue
+        if not stripped:
+            flush_para()
+            continue
+        para.append(line)
+    section = flush_section()
+    if section is not None:
+        yield section
+
+
+def _split_oversized(text: str, tokens: int, max_tokens: int) -> list[tuple[str, str]]:
+    """Блок больше лимита -> части (текст, разделитель при склейке): строки, предложения, в крайнем случае группы слов."""
+    for joiner, rx in _SPLITTERS:
+        parts = [p.strip() for p in rx.split(text) if p.strip()]
+        if len(parts) > 1:
+            return [(p, joiner) for p in parts]
+    words = text.split()
+    size = max(1, math.ceil(len(words) / math.ceil(tokens / max_tokens)))
+    return [(" ".join(words[i:i + size]), " ") for i in range(0, len(words), size)]
+
+
+def _units(
+    pieces: list[tuple[str, str]],
+    max_tokens: int,
+    count_tokens: TokenCounter,
+) -> Iterator[tuple[str, str, int]]:
+    """Единицы упаковки (текст, разделитель, токены), каждая не больше max_tokens (кроме неделимого слова)."""
+    for (text, sep), n in zip(pieces, count_tokens([t for t, _ in pieces])):
+        parts = _split_oversized(text, n, max_tokens) if n > max_tokens else []
+        if len(parts) <= 1:
+            yield text, sep, n
+            continue
+        first = True
+        for piece, joiner, m in _units(parts, max_tokens, count_tokens):
+            yield piece, sep if first else joiner, m
+            first = False
+
+
+def _pack(
+    units: Iterable[tuple[str, str, str, int]],
+    max_tokens: int,
+    min_tokens: int,
+    overlap_tokens: int,
+) -> Iterator[tuple[str, str, int, int]]:
+    """Жадная упаковка единиц (секция, текст, разделитель, токены) в чанки (секция, текст, токены, overlap) до max_tokens.
+    Граница секции закрывает чанк, если он уже не меньше min_tokens (короткие секции сливаются со следующей);
+    секция чанка — та, на которую приходится больше токенов. overlap_tokens — хвост предыдущего чанка той же секции;
+    overlap — длина этого хвоста в символах (он же — суффикс текста предыдущего чанка)."""
+    cur: list[tuple[str, str, str, int]] = []
+    cur_tokens = 0
+    carried = 0
+
+    def build() -> tuple[str, str, int, int]:
+        weight: Counter[str] = Counter()
+        text = ""
+        overlap = 0
+        for i, (section, piece, sep, n) in enumerate(cur):
+            weight[section] += n
+            text = piece if i == 0 else f"{text}{sep}{piece}"
+            if i + 1 == carried:
+                overlap = len(text)
+        return weight.most_common(1)[0][0], text, cur_tokens, overlap
+
+    for unit in units:
+        section, _, _, n = unit
+        boundary = section != cur[-1][0] and cur_tokens >= min_tokens if cur else False
+        if cur and (cur_tokens + n > max_tokens or boundary):
+            yield build()
+            tail: list[tuple[str, str, str, int]] = []
+            tail_tokens = 0
+            if overlap_tokens > 0 and not boundary:
+                for prev in reversed(cur[1:]):
+                    size = tail_tokens + prev[3]
+                    if prev[0] != section or size > overlap_tokens or size + n > max_tokens:
+                        break
+                    tail.insert(0, prev)
+                    tail_tokens += prev[3]
+            cur, cur_tokens, carried = tail, tail_tokens, len(tail)
+        cur.append(unit)
+        cur_tokens += n
+    if cur:
+        yield build()
+
+
+def iter_structured_chunks(
+    text: str,
+    *,
+    max_tokens: int | None = None,
+    min_tokens: int | None = None,
+    overlap_tokens: int | None = None,
+    count_tokens: TokenCounter | None = None,
+) -> Iterator[ChunkRecord]:
+    """Чанки по структуре: секции markdown -> абзацы/код -> строки -> предложения, размер — в токенах модели.
+    Чанк не рвёт предложение (если оно само не длиннее лимита); section — путь заголовков, tokens — оценка длины.
+    Токены считаются посекционно: в памяти — не больше одной секции."""
+    limit = max_tokens if max_tokens is not None else _settings.rag_chunk_max_tokens
+    if count_tokens is None or limit <= 0:
+        counter, model_limit = model_token_counter()
+        count_tokens = count_tokens or counter
+        if limit <= 0:
+            limit = model_limit
+    min_t = min_tokens if min_tokens is not None else _settings.rag_chunk_min_tokens
+    ov = overlap_tokens if overlap_tokens is not None else _settings.rag_chunk_overlap_tokens
+    counter_fn = count_tokens
+    units = (
+        (section, piece, sep, n)
+        for section, blocks in _sections(text)
+        for piece, sep, n in _units([(b, "\n\n") for b in blocks], limit, counter_fn)
+    )
+    for index, (section, piece, tokens, overlap) in enumerate(_pack(units, limit, min(min_t, limit), ov)):
+        yield ChunkRecord(chunk_index=index, text=piece, section=section, tokens=tokens, overlap=overlap)
+
+
+def chunk_structured(
+    text: str,
+    *,
+    doc_id: str,
+    title: str,
+    path: str = "",
+    document_type: str = "",
+    created_at: str = "",
+    max_tokens: int | None = None,
+    min_tokens: int | None = None,
+    overlap_tokens: int | None = None,
+    count_tokens: TokenCounter | None = None,
+) -> list[ChunkMeta]:
+    if not doc_id:
+        return []
+    return _to_meta(
+        iter_structured_chunks(
+            text, max_tokens=max_tokens, min_tokens=min_tokens, overlap_tokens=overlap_tokens, count_tokens=count_tokens,
+        ),
+        doc_id=doc_id, title=title, path=path, document_type=document_type, created_at=created_at,
+    )
+
+
+def iter_document_chunks(
+    doc: dict,
+    *,
+    chunk_size: int | None = None,
+    overlap: int | None = None,
+) -> Iterator[ChunkRecord]:
+    """Ленивые чанки документа в режиме rag_chunker (chunk_size/overlap — только для chars)."""
+    content = doc.get("content") or ""
+    if _settings.rag_chunker == "structured":
+        return iter_structured_chunks(content)
+    return iter_text_chunks(content, chunk_size=chunk_size, overlap=overlap)
 
 
 def chunk_document(
@@ -56,15 +324,14 @@ def chunk_document(
     chunk_size: int | None = None,
     overlap: int | None = None,
 ) -> list[ChunkMeta]:
-    content = doc.get("content") or ""
-    return chunk_text(
-        content,
+    """Чанки документа списком ChunkMeta (для ingest — iter_document_chunks)."""
+    if not doc.get("doc_id"):
+        return []
+    return _to_meta(
+        iter_document_chunks(doc, chunk_size=chunk_size, overlap=overlap),
         doc_id=doc.get("doc_id") or "",
         title=doc.get("title") or "",
         path=doc.get("path") or "",
         document_type=doc.get("document_type") or "",
         created_at=doc.get("created_at") or "",
-        section="",
-        chunk_size=chunk_size,
-        overlap=overlap,
     )
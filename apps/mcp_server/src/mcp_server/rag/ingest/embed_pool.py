@@ -0,0 +1,84 @@
+"""Эмбеддинги при индексации: батчи из чанков нескольких документов, сортировка по длине, опционально пул процессов."""
+import logging
+import os
+import threading
+from typing import Any
+
+log = logging.getLogger(__name__)
+
+
+def resolve_workers(workers: int) -> int:
+    """0 -> число ядер, иначе как задано (минимум 1)."""
+    if workers <= 0:
+        return os.cpu_count() or 1
+    return workers
+
+
+class IngestEmbedder:
+    """Context manager: encode(texts) -> векторы в исходном порядке.
+    При workers > 1 поднимает multi-process пул SentenceTransformer при первом непустом encode (прогон без изменений
+    пул не запускает) и гасит его на выходе."""
+
+    def __init__(self, model: Any, *, workers: int = 1, batch_size: int = 64):
+        self._model = model
+        self._workers = resolve_workers(workers)
+        self._batch_size = max(1, batch_size)
+        self._pool: dict[str, Any] | None = None
+        self._pool_lock = threading.Lock()
+
+    def __enter__(self) -> "IngestEmbedder":
+        return self
+
+    def _ensure_pool(self) -> None:
+        if self._workers <= 1 or self._pool is not None:
+            return
+        with self._pool_lock:
+            if self._pool is not None:
+                return
+            # Каждый процесс пула — один intra-op поток, иначе N процессов x N потоков дерутся за ядра.
+            saved = {k: os.environ.get(k) for k in ("OMP_NUM_THREADS", "MKL_NUM_THREADS")}
+            os.environ.update({k: "1" for k in saved})
+            try:
+                self._pool = self._model.start_multi_process_pool(target_devices=["cpu"] * self._workers)
+            finally:
+                for k, v in saved.items():
+                    if v is None:
+                        os.environ.pop(k, None)
+                    else:
+                        os.environ[k] = v
+            log.info("[INGESTION] embedding pool started workers=%d", self._workers)
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        with self._pool_lock:
+            if self._pool is not None:
+                self._model.stop_multi_process_pool(self._pool)
+                self._pool = None
+                log.info("[INGESTION] embedding pool stopped")
+
+    def encode(self, texts: list[str]) -> list[list[float]]:
+        if not texts:
+            return []
+        # Сортировка по длине: соседние тексты попадают в один батч и паддинг минимален.
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        sorted_texts = [texts[i] for i in order]
+        self._ensure_pool()
+        if self._pool is not None:
+            chunk_size = max(self._batch_size, -(-len(sorted_texts) // self._workers))
+            vectors = self._model.encode(
+                sorted_texts,
+                pool=self._pool,
+                batch_size=self._batch_size,
+                chunk_size=chunk_size,
+                show_progress_bar=False,
+            ).tolist()
+        else:
+            vectors = self._model.encode(
+                sorted_texts, batch_size=self._batch_size, show_progress_bar=False
+            ).tolist()
+        out: list[list[float]] = [[] for _ in texts]
+        for pos, i in enumerate(order):
+            out[i] = vectors[pos]
+        return out
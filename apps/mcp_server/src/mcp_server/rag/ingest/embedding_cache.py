@@ -0,0 +1,40 @@
+"""Персистентный кэш эмбеддингов чанков (llm.kb_embedding_cache): ключ — sha256 текста + модель.
+Повторный ingest неизменённых чанков (правка одного абзаца, полная переиндексация, новая коллекция) не кодирует их заново."""
+import hashlib
+from typing import Any, Callable
+
+import numpy as np
+
+from db.queries import put_cached_embeddings, touch_cached_embeddings
+
+
+def text_sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def encode_with_cache(
+    conn: Any,
+    model_key: str,
+    texts: list[str],
+    encode: Callable[[list[str]], list[list[float]]],
+) -> tuple[list[list[float]], int]:
+    """Векторы texts: найденные в кэше — одним запросом, промахи (без дублей) — одним encode и в кэш.
+    Возвращает (векторы в порядке texts, число попаданий). Commit делает вызывающий."""
+    if not texts:
+        return [], 0
+    keys = [text_sha256(t) for t in texts]
+    cached = touch_cached_embeddings(conn, model_key, list(dict.fromkeys(keys)))
+    found: dict[str, list[float]] = {k: np.frombuffer(v, dtype=np.float32).tolist() for k, v in cached.items()}
+    missing: dict[str, str] = {}
+    for key, text in zip(keys, texts):
+        if key not in found and key not in missing:
+            missing[key] = text
+    if missing:
+        vectors = encode(list(missing.values()))
+        rows: list[tuple[str, bytes]] = []
+        for key, vector in zip(missing, vectors):
+            found[key] = vector
+            rows.append((key, np.asarray(vector, dtype=np.float32).tobytes()))
+        put_cached_embeddings(conn, model_key, rows)
+    hits = sum(1 for k in keys if k in cached)
+    return [found[k] for k in keys], hits
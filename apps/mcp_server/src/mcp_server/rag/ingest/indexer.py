@@ -1,124 +1,556 @@
-"""Индексация: загрузка документов -> sha256 -> Postgres -> чанкинг -> эмбеддинги -> Qdrant."""
+"""Индексация конвейером: загрузка документов -> sha256 + ленивый чанкинг -> эмбеддинги батчами фиксированного размера ->
+Postgres + Qdrant. По умолчанию инкрементально: из datastore приходят только изменения с сохранённого курсора (GET /changes)."""
 import hashlib
 import logging
+import threading
 import time
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable, Iterator
+from uuid import UUID
 
 from db.connection import get_pool
 from db.queries import (
-    delete_chunks_by_doc_id,
-    get_document_by_doc_key,
-    insert_chunk,
-    insert_document,
-    update_document_sha256,
+    copy_chunks,
+    delete_chunks_by_doc_ids,
+    delete_document_by_doc_key,
+    get_chunk_fingerprints,
+    get_documents_by_doc_keys,
+    get_ingest_cursor,
+    make_chunk_uuid,
+    make_doc_uuid,
+    prune_embedding_cache,
+    save_ingest_cursor,
+    write_documents,
 )
-from mcp_server.rag.embedding import get_embedding_model
-from mcp_server.rag.ingest.chunker import chunk_document
-from mcp_server.rag.ingest.loader import load_documents
-from mcp_server.rag.store.qdrant_store import QdrantStore
+from mcp_server.rag import sparse
+from mcp_server.rag.chunk_cache import get_chunk_cache
+from mcp_server.rag.embedding import get_embedding_model, model_identity
+from mcp_server.rag.formats import PREVIEW_MAX_CHARS, truncate_preview
+from mcp_server.rag.ingest.chunker import iter_document_chunks
+from mcp_server.rag.ingest.embed_pool import IngestEmbedder, resolve_workers
+from mcp_server.rag.ingest.embedding_cache import encode_with_cache, text_sha256
+from mcp_server.rag.ingest.loader import ChangeFeedUnavailable, iter_changes, iter_documents
+from mcp_server.rag.ingest.pipeline import Pipeline
+from mcp_server.rag.kb_version import bump_kb_version
+from mcp_server.rag.store.factory import VectorStore, get_ingest_store
+from mcp_server.rag.store.models import ChunkRecord
 from mcp_server.settings import Settings
 
 _settings = Settings()
 log = logging.getLogger(__name__)
 
+_GATE_POLL_S = 0.1
+
+
+def _doc_key(doc: dict[str, Any]) -> str:
+    return doc.get("path") or doc.get("doc_id") or ""
+
 
 def _sha256_content(content: str) -> str:
     return hashlib.sha256(content.encode("utf-8")).hexdigest()
 
 
-def _index_one_document(
-    conn: Any,
-    doc: dict,
-    store: QdrantStore,
-    model: Any,
+def _plan_documents(conn: Any, docs: list[dict[str, Any]]) -> list[dict[str, Any]]:
+    """Пачка документов: один SELECT по doc_key -> пропуск неизменённых по sha256 -> для обновлённых документов
+    отпечатки существующих чанков (один SELECT на пачку). Чанки здесь не строятся — их лениво режет _iter_batches."""
+    by_key: dict[str, dict[str, Any]] = {}
+    for doc in docs:
+        doc_key = _doc_key(doc)
+        if doc_key:
+            by_key[doc_key] = doc
+    existing = get_documents_by_doc_keys(conn, list(by_key))
+    plans: list[dict[str, Any]] = []
+    for doc_key, doc in by_key.items():
+        new_sha = _sha256_content(doc.get("content") or "")
+        known = existing.get(doc_key)
+        if known is not None and known[1] == new_sha:
+            log.info("[INGESTION] skip doc: unchanged sha doc_key=%s", doc_key[:50])
+            continue
+        # Новый doc_id детерминирован: повтор после сбоя (Postgres откатился, точки в store остались) даёт те же id.
+        doc_id = known[0] if known is not None else make_doc_uuid(doc_key)
+        plans.append({
+            "base": {
+                "doc_id": str(doc_id),
+                "doc_key": doc_key,
+                "title": doc.get("title") or "",
+                "doc_type": doc.get("document_type") or "general",
+                "language": doc.get("language") or "ru",
+            },
+            "sha256": new_sha,
+            "is_new": known is None,
+            "doc": doc,
+        })
+    fingerprints = get_chunk_fingerprints(conn, [UUID(p["base"]["doc_id"]) for p in plans if not p["is_new"]])
+    for plan in plans:
+        plan["existing"] = fingerprints.get(UUID(plan["base"]["doc_id"]), {})
+    return plans
+
+
+def _new_part(plan: dict[str, Any], no: int) -> dict[str, Any]:
+    return {
+        "base": plan["base"],
+        "sha256": plan["sha256"],
+        "is_new": plan["is_new"],
+        "part": no,
+        "last": False,
+        "chunks": [],
+        "stale": [],
+        "removed": [],
+        "unchanged": 0,
+    }
+
+
+def _complete(part: dict[str, Any]) -> bool:
+    """Документ целиком в одной части (обычный случай) — его изменения пишутся одной транзакцией."""
+    return part["part"] == 0 and part["last"]
+
+
+def _iter_batches(
+    plans: list[dict[str, Any]],
     chunk_size: int,
     overlap: int,
-) -> tuple[int, int]:
-    doc_key = doc.get("path") or doc.get("doc_id") or ""
-    content = doc.get("content") or ""
-    if not doc_key:
-        return (0, 0)
-    new_sha = _sha256_content(content)
-    existing = get_document_by_doc_key(conn, doc_key)
-    if existing is not None:
-        doc_id, existing_sha = existing
-        if existing_sha == new_sha:
-            log.info("[INGESTION] skip doc: unchanged sha doc_key=%s", doc_key[:50])
-            return (0, 0)
-        update_document_sha256(conn, doc_id, new_sha)
-        delete_chunks_by_doc_id(conn, doc_id)
-        store.delete_by_doc_id(str(doc_id))
-    else:
-        doc_id = insert_document(
-            conn,
-            doc_key=doc_key,
-            title=doc.get("title") or "",
-            doc_type=doc.get("document_type") or "general",
-            language="ru",
-            sha256=new_sha,
+    batch_size: int,
+) -> Iterator[list[dict[str, Any]]]:
+    """Батчи ровно по batch_size новых/изменённых чанков (последний — меньше) из частей документов.
+    Чанки документа режутся генератором и сразу сверяются с отпечатками по (chunk_index, sha256 текста, section):
+    неизменённые отбрасываются, в памяти — не больше одного батча. Документ, не влезший в батч, продолжается
+    в следующем. Часть несёт сохранённые chunk_id заменяемых чанков (stale), последняя часть (last) — исчезнувших
+    (removed): id берутся из Postgres, а не вычисляются — у старых строк они случайные."""
+    parts: list[dict[str, Any]] = []
+    size = 0
+    for plan in plans:
+        existing = plan["existing"]
+        part = _new_part(plan, 0)
+        seen: set[int] = set()
+        for rec in iter_document_chunks(plan["doc"], chunk_size=chunk_size, overlap=overlap):
+            seen.add(rec.chunk_index)
+            known = existing.get(rec.chunk_index)
+            if known is not None and known[:2] == (text_sha256(rec.text), rec.section):
+                part["unchanged"] += 1
+                continue
+            if known is not None:
+                part["stale"].append(str(known[2]))
+            part["chunks"].append(rec)
+            size += 1
+            if size >= batch_size:
+                yield parts + [part]
+                parts, size = [], 0
+                part = _new_part(plan, part["part"] + 1)
+        part["removed"] = [str(existing[i][2]) for i in sorted(existing) if i not in seen]
+        part["last"] = True
+        parts.append(part)
+        log.debug(
+            "[INGESTION] chunked doc_key=%s parts=%d removed=%d",
+            plan["base"]["doc_key"][:50], part["part"] + 1, len(part["removed"]),
         )
-    chunks = chunk_document(doc, chunk_size=chunk_size, overlap=overlap)
-    if not chunks:
-        return (1, 0)
-    texts = [c.text for c in chunks]
-    vectors = model.encode(texts, show_progress_bar=False).tolist()
-    title = doc.get("title") or ""
-    doc_type = doc.get("document_type") or "general"
-    language = doc.get("language") or "ru"
-    points: list[tuple[str, list[float], dict]] = []
-    for chunk, vec in zip(chunks, vectors):
-        chunk_id_uuid = insert_chunk(
-            conn,
-            doc_id=doc_id,
-            chunk_index=chunk.chunk_index,
-            section=chunk.section or None,
-            text=chunk.text,
-            embedding_ref=None,
-        )
-        payload = {
-            "doc_id": str(doc_id),
-            "doc_key": doc_key,
-            "title": title,
-            "doc_type": doc_type,
-            "language": language,
-            "chunk_id": str(chunk_id_uuid),
-            "chunk_index": chunk.chunk_index,
-            "section": chunk.section or "",
-            "text": chunk.text,
-        }
-        points.append((str(chunk_id_uuid), vec, payload))
-    store.upsert(points)
-    log.debug("[INGESTION] indexed doc_key=%s chunks=%d", doc_key[:50], len(points))
-    return (1, len(points))
+    if parts:
+        yield parts
+
+
+def _write_batch(
+    conn: Any,
+    parts: list[dict[str, Any]],
+    vectors: list[list[float]],
+    store: VectorStore,
+) -> int:
+    """Части документов с готовыми векторами: Postgres (pipeline + COPY), затем store.
+    В Postgres и store уходят только новые/изменённые чанки. Для документа из одной части здесь же обновляется sha256
+    и удаляются исчезнувшие чанки: для читателя Postgres обновление атомарно (одна транзакция); в store изменённые точки
+    перезаписываются upsert'ом по тем же chunk_id, и только после этого удаляются лишние — документ не пропадает из поиска.
+    Документ из нескольких частей завершает _finalize_document после записи всех частей (до этого sha256 — NULL,
+    и прерванный прогон повторит документ).
+    Commit делает вызывающий — после store: при сбое store документы в Postgres откатятся и переиндексируются
+    следующим прогоном; doc_id нового документа — UUIDv5(doc_key), chunk_id — UUIDv5(doc_id, index), так что повтор
+    перезапишет уже записанные в store точки, а не оставит их сиротами.
+    Строка документа пишется upsert'ом по doc_key (см. ниже, если она уже есть у «нового» документа)."""
+    # Заменяемые и исчезнувшие чанки удаляются по сохранённым chunk_id: из Postgres — до COPY (иначе конфликт
+    # по (doc_id, chunk_index)), из store — после upsert, кроме id, совпавших с записанными.
+    removed_ids: list[str] = []
+    for part in parts:
+        removed_ids.extend(part["stale"])
+        if _complete(part):
+            removed_ids.extend(part["removed"])
+    stale_ids = [UUID(cid) for cid in removed_ids]
+    actual = write_documents(
+        conn,
+        documents=[
+            (UUID(p["base"]["doc_id"]), p["base"]["doc_key"], p["base"]["title"], p["base"]["doc_type"],
+             p["base"]["language"], p["sha256"] if _complete(p) else None)
+            for p in parts
+        ],
+        changed=[],
+        stale_chunk_ids=stale_ids,
+    )
+    # Документ, запланированный как новый, уже есть в Postgres (его записало другое окно этого прогона или у него
+    # другой doc_id): первая часть переписывает его целиком под doc_id из Postgres — старые чанки удаляются
+    # из Postgres сразу, из store — после upsert новых (как исчезнувшие чанки обновлённого документа).
+    rewritten: list[UUID] = []
+    for part in parts:
+        base = part["base"]
+        doc_uuid, inserted = actual[base["doc_key"]]
+        if str(doc_uuid) != base["doc_id"]:
+            log.warning(
+                "[INGESTION] doc_key=%s is stored as doc_id=%s, planned %s",
+                base["doc_key"][:50], doc_uuid, base["doc_id"],
+            )
+            base["doc_id"] = str(doc_uuid)
+        if part["is_new"] and part["part"] == 0 and not inserted:
+            rewritten.append(doc_uuid)
+    removed_ids.extend(str(cid) for cid in delete_chunks_by_doc_ids(conn, rewritten))
+    rows: list[tuple[UUID, UUID, int, str | None, str, int, str | None]] = []
+    points: list[tuple[str, list[float], dict[str, Any]]] = []
+    all_chunks: list[ChunkRecord] = []
+    for part in parts:
+        base = part["base"]
+        doc_uuid = UUID(base["doc_id"])
+        for chunk in part["chunks"]:
+            chunk_id = make_chunk_uuid(doc_uuid, chunk.chunk_index)
+            rows.append((chunk_id, doc_uuid, chunk.chunk_index, chunk.section or None, chunk.text, chunk.tokens, None))
+            points.append((str(chunk_id), vectors[len(points)], {
+                **base,
+                "chunk_id": str(chunk_id),
+                "chunk_index": chunk.chunk_index,
+                "section": chunk.section,
+                "overlap": chunk.overlap,
+                "text": chunk.text,
+                "preview": truncate_preview(chunk.text, PREVIEW_MAX_CHARS),
+            }))
+            all_chunks.append(chunk)
+    copy_chunks(conn, rows)
+    store.upsert(points, sparse_vectors=[sparse.encode_document(c.text) for c in all_chunks])
+    written = {cid for cid, _, _ in points}
+    removed_ids = [cid for cid in dict.fromkeys(removed_ids) if cid not in written]
+    store.delete_by_ids(removed_ids)
+    log.debug("[INGESTION] written parts=%d chunks=%d removed=%d", len(parts), len(points), len(removed_ids))
+    return len(points)
+
+
+def _finalize_document(conn: Any, last: dict[str, Any], store: VectorStore) -> None:
+    """Документ из нескольких частей записан целиком: новый sha256 и удаление исчезнувших чанков.
+    Commit и сброс кэша чанков — у вызывающего."""
+    doc_uuid = UUID(last["base"]["doc_id"])
+    write_documents(
+        conn, documents=[], changed=[(doc_uuid, last["sha256"])], stale_chunk_ids=[UUID(c) for c in last["removed"]],
+    )
+    store.delete_by_ids(last["removed"])
+
+
+def _iter_source(cursor: tuple[str, int] | None, incremental: bool) -> Iterator[dict[str, Any]]:
+    """Изменения из ленты datastore; при full или старом datastore — все документы (без seq)."""
+    if incremental:
+        epoch, since = cursor if cursor is not None else (None, 0)
+        try:
+            yield from iter_changes(epoch, since)
+            return
+        except ChangeFeedUnavailable:
+            log.warning("[INGESTION] datastore has no change feed, falling back to full ingestion")
+    for doc in iter_documents():
+        yield {"deleted": False, "document": doc}
+
+
+def _delete_document(conn: Any, doc_key: str, store: VectorStore) -> str | None:
+    """Удалить документ из Postgres и store; doc_id удалённого (None — не было). Commit и сброс кэша — у вызывающего."""
+    doc_id = delete_document_by_doc_key(conn, doc_key)
+    if doc_id is None:
+        return None
+    store.delete_by_doc_id(str(doc_id))
+    log.info("[INGESTION] deleted doc_key=%s", doc_key[:50])
+    return str(doc_id)
+
+
+def _windows(
+    items: Iterator[dict[str, Any]],
+    max_docs: int,
+    max_chars: int,
+) -> Iterator[dict[str, Any]]:
+    """Нарезка потока изменений на окна: до max_docs документов или ~max_chars текста (≈ батч эмбеддингов).
+    Окно несёт курсор ленты на своём последнем элементе и doc_key своих изменений (keys); повтор doc_key
+    внутри окна заменяет прежнее изменение — писатель применяет удаления раньше документов окна."""
+
+    def new(no: int, cursor: tuple[str, int] | None) -> dict[str, Any]:
+        return {"no": no, "docs": {}, "deletes": {}, "keys": set(), "cursor": cursor, "seen": 0}
+
+    def done(w: dict[str, Any]) -> dict[str, Any]:
+        w["docs"] = list(w["docs"].values())
+        w["deletes"] = list(w["deletes"])
+        return w
+
+    window = new(0, None)
+    chars = 0
+    last_cursor: tuple[str, int] | None = None
+    for item in items:
+        window["seen"] += 1
+        doc = item.get("document")
+        key = _doc_key(doc) if doc is not None else ""
+        for k in (item.get("doc_key"), key):
+            if k:
+                window["keys"].add(k)
+                window["docs"].pop(k, None)
+                window["deletes"].pop(k, None)
+        if item["deleted"]:
+            window["deletes"][item["doc_key"]] = None
+        elif key:
+            window["docs"][key] = doc
+            chars += len(doc.get("content") or "")
+        if "seq" in item:
+            last_cursor = (item["epoch"], item["seq"])
+        window["cursor"] = last_cursor
+        if len(window["docs"]) >= max_docs or chars >= max_chars:
+            yield done(window)
+            window = new(window["no"] + 1, last_cursor)
+            chars = 0
+    if window["seen"]:
+        yield done(window)
+
+
+class _KeyGate:
+    """doc_key в работе не более чем в одном окне: окно с ключом, который ещё пишет предыдущее окно, ждёт его commit.
+    Иначе prepare спланирует документ по состоянию до записи прежней версии, а параллельные писатели
+    (окна завершаются не по порядку) могут применить удаление раньше более старой записи."""
+
+    def __init__(self, stopped: Callable[[], bool]):
+        self._stopped = stopped
+        self._busy: set[str] = set()
+        self._held: dict[int, set[str]] = {}
+        self._cond = threading.Condition()
+
+    def admit(self, windows: Iterator[dict[str, Any]]) -> Iterator[dict[str, Any]]:
+        """Выдавать окна по порядку, дожидаясь освобождения их ключей; остановка конвейера прекращает выдачу."""
+        for window in windows:
+            keys = window.pop("keys")
+            with self._cond:
+                while keys & self._busy:
+                    if self._stopped():
+                        return
+                    self._cond.wait(_GATE_POLL_S)
+                self._busy |= keys
+                self._held[window["no"]] = keys
+            yield window
+
+    def release(self, no: int) -> None:
+        with self._cond:
+            self._busy -= self._held.pop(no, set())
+            self._cond.notify_all()
+
+
+class _CursorTracker:
+    """Курсор ленты сохраняется только для непрерывного префикса записанных окон:
+    писатели работают параллельно и завершают окна не по порядку. Курсор пишется соединением писателя,
+    завершившего окно: второе соединение из пула на то же время не берётся."""
+
+    def __init__(self, source: str):
+        self._source = source
+        self._next = 0
+        self._done: dict[int, tuple[str, int] | None] = {}
+        self._lock = threading.Lock()
+
+    def done(self, conn: Any, no: int, cursor: tuple[str, int] | None) -> None:
+        with self._lock:
+            self._done[no] = cursor
+            latest: tuple[str, int] | None = None
+            while self._next in self._done:
+                latest = self._done.pop(self._next) or latest
+                self._next += 1
+            if latest is not None:
+                save_ingest_cursor(conn, self._source, *latest)
+                conn.commit()
+
+
+class IngestProgress:
+    """Счётчики прогона: обновляются стадиями конвейера, snapshot() читает статус фоновой задачи (kb_ingest_status).
+    docs_seen — элементы ленты, дошедшие до prepare; chunks_embedded — после embed; chunks_indexed — записанные в store."""
+
+    FIELDS = (
+        "docs_seen", "docs_indexed", "docs_deleted",
+        "chunks_embedded", "chunks_indexed", "chunks_unchanged", "embedding_cache_hits",
+    )
+
+    def __init__(self) -> None:
+        self._counts = dict.fromkeys(self.FIELDS, 0)
+        self._lock = threading.Lock()
+
+    def add(self, **deltas: int) -> None:
+        with self._lock:
+            for key, value in deltas.items():
+                self._counts[key] += value
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self._counts)
+
+
+class _Parts:
+    """Группы частей (батчи окна, части документа), которые пишут разные писатели в любом порядке.
+    Последняя часть группы сообщает total и value; done() возвращает (True, value) ровно одному вызову — завершающему."""
+
+    def __init__(self) -> None:
+        self._done: dict[Any, int] = {}
+        self._last: dict[Any, tuple[int, Any]] = {}
+        self._lock = threading.Lock()
+
+    def done(self, key: Any, total: int | None = None, value: Any = None) -> tuple[bool, Any]:
+        with self._lock:
+            n = self._done.get(key, 0) + 1
+            if total is not None:
+                self._last[key] = (total, value)
+            if key in self._last and self._last[key][0] == n:
+                self._done.pop(key, None)
+                return True, self._last.pop(key)[1]
+            self._done[key] = n
+            return False, None
 
 
 def run_ingestion(
     index_dir: Path | str | None = None,
     chunk_size: int | None = None,
     overlap: int | None = None,
-) -> dict[str, int | float]:
-    log.info("[INGESTION] start")
+    full: bool = False,
+    progress: IngestProgress | None = None,
+    cancel: threading.Event | None = None,
+) -> dict[str, Any]:
+    """Конвейер: fetch (лента/корпус, окна документов) -> prepare (sha256, чанкинг в батчи по rag_ingest_embed_batch чанков)
+    -> embed -> write (Postgres + store). Между стадиями — ограниченные очереди, у стадий свои потоки: память на чанки
+    ограничена размером батча и очередей, а не размером документа. full=True — пройти весь корпус
+    (sha256 по-прежнему пропускает неизменённые документы). cancel — перестать читать ленту и дописать окна,
+    уже взятые в работу (курсор сохраняется по записанным окнам), результат с cancelled=True."""
+    incremental = _settings.rag_ingest_incremental and not full
+    source = _settings.datastore_url or ""
+    log.info("[INGESTION] start incremental=%s", incremental)
     start = time.perf_counter()
     cs = chunk_size if chunk_size is not None else _settings.rag_chunk_size
     ov = overlap if overlap is not None else _settings.rag_chunk_overlap
-    docs = load_documents()
-    log.info("[INGESTION] loaded docs=%d chunk_size=%d overlap=%d", len(docs), cs, ov)
-    store = QdrantStore()
+    log.info("[INGESTION] chunker=%s chunk_size=%d overlap=%d", _settings.rag_chunker, cs, ov)
+    store = get_ingest_store()
     store.ensure_collection()
     model = get_embedding_model()
-    docs_indexed = 0
-    chunks_indexed = 0
     pool = get_pool()
-    with pool.connection() as conn:
-        for doc in docs:
-            d, c = _index_one_document(conn, doc, store, model, cs, ov)
-            docs_indexed += d
-            chunks_indexed += c
+    progress = progress if progress is not None else IngestProgress()
+    tracker = _CursorTracker(source)
+    encode_workers = resolve_workers(_settings.rag_ingest_workers)
+    # Multi-process пул SentenceTransformer не допускает параллельных encode: тогда стадия embed — один поток.
+    embed_workers = 1 if encode_workers > 1 else _settings.rag_ingest_embed_workers
+
+    batch_size = max(1, _settings.rag_ingest_embed_batch)
+    windows = _Parts()
+    docs = _Parts()
+
+    def prepare(_: Any, window: dict[str, Any]) -> Iterator[dict[str, Any]]:
+        progress.add(docs_seen=window["seen"])
+        # Соединение — только на планирование: генератор дальше ждёт места в очереди embed и держать его не должен.
+        with pool.connection() as conn:
+            plans = _plan_documents(conn, window.pop("docs"))
+            conn.commit()
+        # Удаления — в первом батче окна, курсор и счётчик — в последнем (с числом батчей окна).
+        batch: dict[str, Any] | None = None
+        count = 0
+        for parts in _iter_batches(plans, cs, ov, batch_size):
+            if batch is not None:
+                yield batch
+            batch = {"window": window["no"], "parts": parts, "deletes": [] if count else window["deletes"]}
+            count += 1
+        if batch is None:
+            batch = {"window": window["no"], "parts": [], "deletes": window["deletes"]}
+            count = 1
+        batch.update(batches=count, cursor=window["cursor"])
+        yield batch
+
+    use_cache = _settings.rag_embedding_cache_enabled
+    model_key = model_identity()
+
+    def embed(conn: Any, batch: dict[str, Any]) -> dict[str, Any]:
+        texts = [c.text for p in batch["parts"] for c in p["chunks"]]
+        if conn is None:
+            batch["vectors"] = embedder.encode(texts)
+            progress.add(chunks_embedded=len(texts))
+            return batch
+        batch["vectors"], hits = encode_with_cache(conn, model_key, texts, embedder.encode)
+        conn.commit()
+        progress.add(chunks_embedded=len(texts), embedding_cache_hits=hits)
+        return batch
+
+    def write(conn: Any, batch: dict[str, Any]) -> None:
+        deleted_ids = [d for d in (_delete_document(conn, key, store) for key in batch["deletes"]) if d]
+        chunks = _write_batch(conn, batch["parts"], batch.pop("vectors"), store) if batch["parts"] else 0
+        conn.commit()
+        # Кэш чанков — после commit: id детерминированы, иначе читатель успеет закэшировать старый текст.
+        cache = get_chunk_cache()
+        for doc_id in dict.fromkeys(deleted_ids + [p["base"]["doc_id"] for p in batch["parts"]]):
+            cache.invalidate_doc(doc_id)
+        deleted = len(deleted_ids)
+        indexed = 0
+        for part in batch["parts"]:
+            if _complete(part):
+                indexed += 1
+                continue
+            total = part["part"] + 1 if part["last"] else None
+            # doc_key, а не doc_id: _write_batch заменяет doc_id на сохранённый в Postgres.
+            complete, last = docs.done(part["base"]["doc_key"], total, part if part["last"] else None)
+            if complete:
+                _finalize_document(conn, last, store)
+                conn.commit()
+                cache.invalidate_doc(last["base"]["doc_id"])
+                indexed += 1
+        complete, cursor = windows.done(batch["window"], batch.get("batches"), batch.get("cursor"))
+        if complete:
+            gate.release(batch["window"])
+            tracker.done(conn, batch["window"], cursor)
+        progress.add(
+            docs_indexed=indexed,
+            docs_deleted=deleted,
+            chunks_indexed=chunks,
+            chunks_unchanged=sum(p["unchanged"] for p in batch["parts"]),
+        )
+
+    try:
+        with pool.connection() as conn:
+            cursor = get_ingest_cursor(conn, source) if incremental else None
+        with IngestEmbedder(
+            model,
+            workers=_settings.rag_ingest_workers,
+            batch_size=_settings.rag_ingest_encode_batch_size,
+        ) as embedder:
+            pipeline = (
+                Pipeline(queue_size=_settings.rag_ingest_queue_size)
+                .stage("prepare", prepare, workers=_settings.rag_ingest_prepare_workers, fanout=True)
+                .stage("embed", embed, workers=embed_workers, resource=pool.connection if use_cache else None)
+                .stage("write", write, workers=_settings.rag_ingest_write_workers, resource=pool.connection)
+            )
+            gate = _KeyGate(lambda: pipeline.stopped or (cancel is not None and cancel.is_set()))
+            stages = pipeline.run(
+                gate.admit(_windows(
+                    _iter_source(cursor, incremental), max(1, _settings.rag_ingest_doc_batch), batch_size * cs,
+                )),
+                cancel=cancel,
+            )
+        totals = progress.snapshot()
+        if use_cache and totals["chunks_indexed"]:
+            with pool.connection() as conn:
+                pruned = prune_embedding_cache(conn, _settings.rag_embedding_cache_max_rows)
+            if pruned:
+                log.info("[INGESTION] embedding cache pruned rows=%d", pruned)
+    finally:
+        # Локальный store копит запись в памяти: на диск — один раз за прогон, в том числе прерванный.
+        store.flush()
+        # Даже при ошибке посреди прогона часть документов уже в store: кэши результатов должны сброситься.
+        done = progress.snapshot()
+        if done["docs_indexed"] or done["docs_deleted"]:
+            bump_kb_version()
+    cancelled = cancel is not None and cancel.is_set()
     elapsed_ms = (time.perf_counter() - start) * 1000
-    log.info("[INGESTION] done docs_indexed=%d chunks_indexed=%d duration_ms=%.2f", docs_indexed, chunks_indexed, round(elapsed_ms, 2))
+    log.info(
+        "[INGESTION] %s docs_seen=%d docs_indexed=%d docs_deleted=%d chunks_indexed=%d chunks_unchanged=%d "
+        "embedding_cache_hits=%d duration_ms=%.2f stages=%s",
+        "cancelled" if cancelled else "done",
+        totals["docs_seen"], totals["docs_indexed"], totals["docs_deleted"], totals["chunks_indexed"],
+        totals["chunks_unchanged"], totals["embedding_cache_hits"], round(elapsed_ms, 2), stages,
+    )
     return {
-        "docs_indexed": docs_indexed,
-        "chunks_indexed": chunks_indexed,
+        "docs_indexed": totals["docs_indexed"],
+        "docs_deleted": totals["docs_deleted"],
+        "chunks_indexed": totals["chunks_indexed"],
+        "chunks_unchanged": totals["chunks_unchanged"],
+        "embedding_cache_hits": totals["embedding_cache_hits"],
         "duration_ms": round(elapsed_ms, 2),
+        "stages": stages,
+        "cancelled": cancelled,
     }
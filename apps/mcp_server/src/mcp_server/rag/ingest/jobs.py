@@ -0,0 +1,165 @@
+"""Фоновые задачи ingest: kb_ingest ставит задачу и сразу возвращает job_id, прогресс и отмена — по id.
+Задачи выполняет один поток по очереди (курсор ленты общий); история — последние rag_ingest_jobs_keep задач в памяти процесса."""
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable
+from uuid import uuid4
+
+from mcp_server.rag.ingest.indexer import IngestProgress, run_ingestion
+from mcp_server.settings import Settings
+
+log = logging.getLogger(__name__)
+_settings = Settings()
+
+ACTIVE_STATUSES = frozenset({"queued", "running"})
+
+
+def _iso(ts: float | None) -> str | None:
+    return datetime.fromtimestamp(ts, tz=timezone.utc).isoformat() if ts is not None else None
+
+
+class IngestJob:
+    """Задача ingest: queued -> running -> succeeded | failed | cancelled."""
+
+    def __init__(self, full: bool, run_id: str | None = None):
+        self.job_id = uuid4().hex
+        self.full = full
+        self.run_id = run_id
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at: float | None = None
+        self.finished_at: float | None = None
+        self.progress = IngestProgress()
+        self.cancel_event = threading.Event()
+        self.result: dict[str, Any] | None = None
+        self.error: str | None = None
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "full": self.full,
+            "created_at": _iso(self.created_at),
+            "started_at": _iso(self.started_at),
+            "finished_at": _iso(self.finished_at),
+            "progress": self.progress.snapshot(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class IngestJobs:
+    """Очередь и история задач. Повторный запрос, пока в очереди уже ждёт задача, покрывающая его
+    (full покрывает инкрементальный), возвращает её же: загрузки подряд не плодят прогонов."""
+
+    def __init__(self, keep: int, runner: Callable[..., dict[str, Any]] = run_ingestion):
+        self._keep = max(1, keep)
+        self._runner = runner
+        self._jobs: OrderedDict[str, IngestJob] = OrderedDict()
+        self._pending: list[IngestJob] = []
+        self._cond = threading.Condition()
+        self._worker: threading.Thread | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._on_finish: Callable[[IngestJob], None] | None = None
+
+    def on_finish(self, callback: Callable[[IngestJob], None]) -> None:
+        """Callback по завершении задачи; вызывается в event loop, из которого была поставлена задача
+        (audit_event вне loop ничего не отправляет)."""
+        self._on_finish = callback
+
+    def submit(self, full: bool = False, run_id: str | None = None) -> tuple[IngestJob, bool]:
+        """Поставить задачу. Возвращает (задача, создана ли новая)."""
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        with self._cond:
+            for job in self._pending:
+                if job.full or not full:
+                    return job, False
+            job = IngestJob(full=full, run_id=run_id)
+            self._jobs[job.job_id] = job
+            self._pending.append(job)
+            self._trim()
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="ingest-jobs", daemon=True)
+                self._worker.start()
+            self._cond.notify()
+        log.info("[INGESTION] job queued job_id=%s full=%s", job.job_id, full)
+        return job, True
+
+    def get(self, job_id: str | None = None) -> IngestJob | None:
+        """Задача по id; без id — последняя поставленная."""
+        with self._cond:
+            if job_id is None:
+                return next(reversed(self._jobs.values()), None)
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id: str) -> IngestJob | None:
+        """Отмена: ждущая задача снимается сразу, выполняющаяся дописывает окна, уже взятые в работу."""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.status not in ACTIVE_STATUSES:
+                return job
+            job.cancel_event.set()
+            if job in self._pending:
+                self._pending.remove(job)
+                job.status = "cancelled"
+                job.finished_at = time.time()
+        log.info("[INGESTION] job cancel requested job_id=%s status=%s", job_id, job.status)
+        if job.status == "cancelled":
+            self._notify(job)
+        return job
+
+    def _trim(self) -> None:
+        while len(self._jobs) > self._keep:
+            oldest = next(iter(self._jobs.values()))
+            if oldest.status in ACTIVE_STATUSES:
+                break
+            self._jobs.popitem(last=False)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._pending.pop(0)
+                job.status = "running"
+                job.started_at = time.time()
+            log.info("[INGESTION] job started job_id=%s full=%s", job.job_id, job.full)
+            try:
+                job.result = self._runner(full=job.full, progress=job.progress, cancel=job.cancel_event)
+                job.status = "cancelled" if job.result.get("cancelled") else "succeeded"
+            except Exception as e:
+                log.exception("[INGESTION] job failed job_id=%s: %s", job.job_id, e)
+                job.error = str(e)
+                job.status = "failed"
+            job.finished_at = time.time()
+            log.info("[INGESTION] job finished job_id=%s status=%s", job.job_id, job.status)
+            self._notify(job)
+
+    def _notify(self, job: IngestJob) -> None:
+        if self._on_finish is None:
+            return
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._on_finish, job)
+        else:
+            self._on_finish(job)
+
+
+_jobs: IngestJobs | None = None
+_jobs_lock = threading.Lock()
+
+
+def get_ingest_jobs() -> IngestJobs:
+    global _jobs
+    if _jobs is None:
+        with _jobs_lock:
+            if _jobs is None:
+                _jobs = IngestJobs(_settings.rag_ingest_jobs_keep)
+    return _jobs
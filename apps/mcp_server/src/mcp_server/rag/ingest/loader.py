@@ -1,7 +1,10 @@
-"""Загрузка документов из datastore (GET /read)."""
+"""Загрузка документов из datastore: постранично (GET /read/stream, NDJSON) или только изменения (GET /changes).
+Документы отдаются генератором."""
 import json
 import logging
-from typing import Any
+from typing import Any, Iterator
+from urllib.error import HTTPError
+from urllib.parse import urlencode
 from urllib.request import urlopen
 
 from mcp_server.rag.formats import normalize_text
@@ -10,6 +13,10 @@ from mcp_server.settings import Settings
 log = logging.getLogger(__name__)
 
 
+class ChangeFeedUnavailable(RuntimeError):
+    """Datastore не поддерживает GET /changes (старая версия)."""
+
+
 def _normalize_doc(d: dict[str, Any]) -> dict[str, Any] | None:
     doc_id = d.get("doc_id") or d.get("doc_key") or ""
     title = d.get("title") or ""
@@ -27,26 +34,106 @@ def _normalize_doc(d: dict[str, Any]) -> dict[str, Any] | None:
     }
 
 
-def load_documents() -> list[dict[str, Any]]:
-    """Загрузить документы из datastore (GET /read). Требуется DATASTORE_URL."""
-    s = Settings()
+def _datastore_url(s: Settings) -> str:
     if not s.datastore_url:
         raise RuntimeError(
             "DATASTORE_URL is not set. "
             "MCP server requires a running datastore to load documents for ingestion."
         )
-    url = s.datastore_url.rstrip("/") + "/read"
-    log.info("[LOADER] fetching documents from datastore: %s", url)
-    with urlopen(url, timeout=60) as resp:
-        raw = resp.read().decode("utf-8")
-    data = json.loads(raw)
+    return s.datastore_url.rstrip("/")
+
+
+def _fetch_page(url: str, timeout: float) -> tuple[list[dict[str, Any]], str | None]:
+    """Одна страница NDJSON: строки разбираются по мере чтения, в памяти — не больше страницы."""
+    docs: list[dict[str, Any]] = []
+    with urlopen(url, timeout=timeout) as resp:
+        next_cursor = resp.headers.get("X-Next-Cursor")
+        for line in resp:
+            if not line.strip():
+                continue
+            norm = _normalize_doc(json.loads(line))
+            if norm:
+                docs.append(norm)
+    return docs, next_cursor
+
+
+def _iter_legacy(base: str, timeout: float) -> Iterator[dict[str, Any]]:
+    """Старый datastore без /read/stream: весь корпус одним GET /read."""
+    with urlopen(base + "/read", timeout=timeout) as resp:
+        data = json.loads(resp.read().decode("utf-8"))
     docs = data.get("documents") if isinstance(data, dict) else data
-    if not isinstance(docs, list):
-        docs = []
-    out: list[dict[str, Any]] = []
-    for d in docs:
+    for d in docs if isinstance(docs, list) else []:
         norm = _normalize_doc(d)
         if norm:
-            out.append(norm)
-    log.info("[LOADER] loaded %d documents from datastore", len(out))
-    return out
+            yield norm
+
+
+def iter_documents(page_size: int | None = None) -> Iterator[dict[str, Any]]:
+    """Документы из datastore лениво, страница за страницей (GET /read/stream?after=&limit=).
+    Соединение закрывается до отдачи страницы потребителю, поэтому долгая индексация не держит запрос."""
+    s = Settings()
+    base = _datastore_url(s)
+    limit = page_size or s.rag_loader_page_size
+    cursor: str | None = None
+    total = 0
+    pages = 0
+    log.info("[LOADER] streaming documents from datastore: %s page_size=%d", base, limit)
+    while True:
+        params: dict[str, Any] = {"limit": limit}
+        if cursor:
+            params["after"] = cursor
+        try:
+            docs, cursor = _fetch_page(f"{base}/read/stream?{urlencode(params)}", s.rag_loader_timeout_s)
+        except HTTPError as e:
+            if e.code != 404 or pages:
+                raise
+            log.warning("[LOADER] datastore has no /read/stream, falling back to GET /read")
+            for doc in _iter_legacy(base, s.rag_loader_timeout_s):
+                total += 1
+                yield doc
+            break
+        pages += 1
+        total += len(docs)
+        yield from docs
+        if not cursor:
+            break
+    log.info("[LOADER] loaded %d documents from datastore pages=%d", total, pages)
+
+
+def iter_changes(epoch: str | None, since: int, page_size: int | None = None) -> Iterator[dict[str, Any]]:
+    """Изменения с seq > since: {"epoch", "seq", "doc_key", "deleted", "document"?} по возрастанию seq.
+    Если epoch ленты не совпал с сохранённым (состояние datastore потеряно), лента читается с начала."""
+    s = Settings()
+    base = _datastore_url(s)
+    limit = page_size or s.rag_loader_page_size
+    total = 0
+    while True:
+        url = f"{base}/changes?{urlencode({'since': since, 'limit': limit})}"
+        try:
+            with urlopen(url, timeout=s.rag_loader_timeout_s) as resp:
+                page = json.loads(resp.read().decode("utf-8"))
+        except HTTPError as e:
+            if e.code == 404:
+                raise ChangeFeedUnavailable("datastore has no /changes endpoint") from e
+            raise
+        if epoch is not None and page["epoch"] != epoch:
+            log.warning("[LOADER] change feed epoch changed %s -> %s, restarting from seq 0", epoch, page["epoch"])
+            epoch, since = page["epoch"], 0
+            continue
+        epoch = page["epoch"]
+        for change in page["changes"]:
+            item = {"epoch": epoch, "seq": change["seq"], "doc_key": change["doc_key"], "deleted": change["deleted"]}
+            if not change["deleted"]:
+                # None — документ без doc_id/content: пропускается индексатором, но seq сдвигает курсор.
+                item["document"] = _normalize_doc(change.get("document") or {})
+            total += 1
+            yield item
+        since = page["last_seq"]
+        if not page["has_more"]:
+            break
+    log.info("[LOADER] change feed: %d changes up to seq=%d", total, since)
+
+
+def load_documents() -> list[dict[str, Any]]:
+    """Все документы списком (для небольших KB и отладки); индексация использует iter_documents."""
+    return list(iter_documents())
@@ -0,0 +1,208 @@
+"""Стадийный конвейер индексации: потоки на стадию, ограниченные очереди между стадиями (backpressure),
+статистика по стадиям (элементов, занятое время, пропускная способность)."""
+import contextlib
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, ContextManager, Iterable
+
+log = logging.getLogger(__name__)
+
+_DONE = object()
+_POLL_S = 0.1
+
+
+class StageStats:
+    def __init__(self) -> None:
+        self.items = 0
+        self.busy_s = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, busy_s: float) -> None:
+        with self._lock:
+            self.items += 1
+            self.busy_s += busy_s
+
+    def as_dict(self) -> dict[str, float]:
+        """items_per_s — пропускная способность стадии на секунду занятого времени (всех её потоков)."""
+        return {
+            "items": self.items,
+            "busy_ms": round(self.busy_s * 1000, 2),
+            "items_per_s": round(self.items / self.busy_s, 2) if self.busy_s > 0 else 0.0,
+        }
+
+
+class Stage:
+    """workers потоков: item из входной очереди -> fn(resource, item) -> следующая стадия.
+    resource — контекст на элемент (например, соединение Postgres из пула), по умолчанию None: берётся на время
+    fn и возвращается до передачи результата дальше — поток, ждущий места в очереди, соединение не держит.
+    fanout=True — fn возвращает итератор, каждый его элемент уходит в следующую стадию отдельно
+    (время ожидания места в очереди в busy стадии не входит); resource у такой стадии не поддерживается —
+    итератор сам берёт соединение на нужный ему участок."""
+
+    def __init__(
+        self,
+        pipeline: "Pipeline",
+        name: str,
+        fn: Callable[[Any, Any], Any],
+        *,
+        workers: int = 1,
+        resource: Callable[[], ContextManager[Any]] | None = None,
+        fanout: bool = False,
+    ):
+        self.name = name
+        self.stats = StageStats()
+        self._pipeline = pipeline
+        self._fn = fn
+        self._workers = max(1, workers)
+        if fanout and resource is not None:
+            raise ValueError(f"stage {name}: fanout stage cannot hold a per-item resource")
+        self._resource = resource or contextlib.nullcontext
+        self._fanout = fanout
+        self._queue: queue.Queue = queue.Queue(maxsize=pipeline.queue_size)
+        self._next: "Stage | None" = None
+        self._alive = 0
+        self._lock = threading.Lock()
+        self._threads: list[threading.Thread] = []
+
+    def start(self) -> None:
+        self._alive = self._workers
+        for i in range(self._workers):
+            t = threading.Thread(target=self._run, name=f"ingest-{self.name}-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def put(self, item: Any) -> bool:
+        """Положить элемент, ожидая место в очереди (backpressure). False — конвейер остановлен."""
+        while not self._pipeline.stopped:
+            try:
+                self._queue.put(item, timeout=_POLL_S)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def close(self) -> None:
+        for _ in range(self._workers):
+            self.put(_DONE)
+
+    def join(self) -> None:
+        for t in self._threads:
+            t.join()
+
+    def _process(self, item: Any) -> bool:
+        t0 = time.perf_counter()
+        with self._resource() as resource:
+            result = self._fn(resource, item)
+        self.stats.add(time.perf_counter() - t0)
+        return self._next is None or self._next.put(result)
+
+    def _process_many(self, item: Any) -> bool:
+        busy = 0.0
+        it = iter(self._fn(None, item))
+        while True:
+            t0 = time.perf_counter()
+            try:
+                result = next(it)
+            except StopIteration:
+                break
+            finally:
+                busy += time.perf_counter() - t0
+            if self._next is not None and not self._next.put(result):
+                return False
+        self.stats.add(busy)
+        return True
+
+    def _run(self) -> None:
+        try:
+            while not self._pipeline.stopped:
+                try:
+                    item = self._queue.get(timeout=_POLL_S)
+                except queue.Empty:
+                    continue
+                if item is _DONE:
+                    break
+                if not (self._process_many if self._fanout else self._process)(item):
+                    break
+        except Exception as e:
+            self._pipeline.fail(self.name, e)
+        finally:
+            with self._lock:
+                self._alive -= 1
+                last = self._alive == 0
+            if last and self._next is not None:
+                self._next.close()
+
+
+class Pipeline:
+    """source (в вызывающем потоке) -> stage_1 -> ... -> stage_n. Ошибка в любой стадии останавливает все."""
+
+    def __init__(self, queue_size: int = 4):
+        self.queue_size = max(1, queue_size)
+        self.source_stats = StageStats()
+        self._stages: list[Stage] = []
+        self._stop = threading.Event()
+        self._error: tuple[str, BaseException] | None = None
+
+    @property
+    def stopped(self) -> bool:
+        return self._stop.is_set()
+
+    def stage(
+        self,
+        name: str,
+        fn: Callable[[Any, Any], Any],
+        *,
+        workers: int = 1,
+        resource: Callable[[], ContextManager[Any]] | None = None,
+        fanout: bool = False,
+    ) -> "Pipeline":
+        st = Stage(self, name, fn, workers=workers, resource=resource, fanout=fanout)
+        if self._stages:
+            self._stages[-1]._next = st
+        self._stages.append(st)
+        return self
+
+    def fail(self, stage: str, error: BaseException) -> None:
+        if self._error is None:
+            self._error = (stage, error)
+            log.error("[INGESTION] pipeline stage %s failed: %s", stage, error)
+        self._stop.set()
+
+    def run(
+        self,
+        source: Iterable[Any],
+        source_name: str = "fetch",
+        cancel: threading.Event | None = None,
+    ) -> dict[str, dict[str, float]]:
+        """Прогнать source через стадии; вернуть статистику {стадия: {items, busy_ms, items_per_s}}.
+        cancel — перестать читать source; элементы, уже переданные в стадии, обрабатываются до конца."""
+        for st in self._stages:
+            st.start()
+        first = self._stages[0]
+        it = iter(source)
+        try:
+            while not self.stopped:
+                if cancel is not None and cancel.is_set():
+                    log.info("[INGESTION] pipeline cancelled, draining in-flight items")
+                    break
+                t0 = time.perf_counter()
+                try:
+                    item = next(it)
+                except StopIteration:
+                    break
+                self.source_stats.add(time.perf_counter() - t0)
+                if not first.put(item):
+                    break
+        except Exception as e:
+            self.fail(source_name, e)
+        finally:
+            first.close()
+            for st in self._stages:
+                st.join()
+        if self._error is not None:
+            raise self._error[1]
+        stats = {source_name: self.source_stats.as_dict()}
+        stats.update({st.name: st.stats.as_dict() for st in self._stages})
+        return stats
@@ -0,0 +1,16 @@
+"""Глобальная версия KB в процессе: run_ingestion увеличивает её после изменений, кэши результатов сверяются с ней."""
+import threading
+
+_version = 0
+_lock = threading.Lock()
+
+
+def get_kb_version() -> int:
+    return _version
+
+
+def bump_kb_version() -> int:
+    global _version
+    with _lock:
+        _version += 1
+        return _version
@@ -0,0 +1,58 @@
+"""Потокобезопасный LRU-кэш с TTL и счётчиками попаданий (общий для кэшей RAG)."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+
+class LRUCache:
+    """Ограниченный по размеру LRU; ttl_s <= 0 — без истечения, maxsize <= 0 — кэш выключен."""
+
+    def __init__(self, maxsize: int, ttl_s: float = 0.0):
+        self._maxsize = maxsize
+        self._ttl_s = ttl_s
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Any | None:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            stored_at, value = item
+            if self._ttl_s > 0 and now - stored_at > self._ttl_s:
+                del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> list[tuple[Hashable, Any]]:
+        """Положить значение; возвращает вытесненные (key, value) — для вторичных индексов поверх кэша."""
+        if self._maxsize <= 0:
+            return []
+        evicted: list[tuple[Hashable, Any]] = []
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self._maxsize:
+                old_key, (_, old_value) = self._data.popitem(last=False)
+                evicted.append((old_key, old_value))
+        return evicted
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
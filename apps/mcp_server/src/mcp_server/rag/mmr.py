@@ -0,0 +1,48 @@
+"""Maximal Marginal Relevance: разнообразный top-k из over-fetch кандидатов по их dense-векторам.
+Соседние чанки одного документа (overlap) почти совпадают по тексту — MMR и лимит на документ их разводят."""
+from typing import Any
+
+import numpy as np
+
+from mcp_server.rag.store.qdrant_store import VECTOR_PAYLOAD_KEY
+
+Hit = tuple[str, float, dict[str, Any]]
+
+
+def mmr_select(
+    query_vector: list[float],
+    hits: list[Hit],
+    k: int,
+    lambda_mult: float = 0.7,
+    per_doc_cap: int = 0,
+) -> list[Hit]:
+    """Жадный MMR: argmax(lambda * sim(q, d) - (1 - lambda) * max sim(d, выбранные)).
+    Матрица сходств кандидатов считается одним matmul. per_doc_cap > 0 — не больше N чанков на doc_id.
+    Кандидаты без вектора -> исходный порядок. Выбранные возвращаются в порядке исходного score."""
+    if len(hits) <= 1 or any(VECTOR_PAYLOAD_KEY not in payload for _, _, payload in hits):
+        return hits[:k]
+    v = np.asarray([payload[VECTOR_PAYLOAD_KEY] for _, _, payload in hits], dtype=np.float32)
+    v /= np.maximum(np.linalg.norm(v, axis=1, keepdims=True), 1e-12)
+    q = np.asarray(query_vector, dtype=np.float32)
+    q /= max(float(np.linalg.norm(q)), 1e-12)
+    relevance = v @ q
+    similarity = v @ v.T
+    doc_ids = [str(payload.get("doc_id", "")) for _, _, payload in hits]
+    per_doc: dict[str, int] = {}
+    max_sim = np.full(len(hits), -np.inf, dtype=np.float32)
+    available = np.ones(len(hits), dtype=bool)
+    selected: list[int] = []
+    while len(selected) < k and available.any():
+        redundancy = np.where(np.isfinite(max_sim), max_sim, 0.0)
+        scores = np.where(available, lambda_mult * relevance - (1 - lambda_mult) * redundancy, -np.inf)
+        best = int(np.argmax(scores))
+        available[best] = False
+        selected.append(best)
+        max_sim = np.maximum(max_sim, similarity[best])
+        if per_doc_cap > 0:
+            doc = doc_ids[best]
+            per_doc[doc] = per_doc.get(doc, 0) + 1
+            if per_doc[doc] >= per_doc_cap:
+                available &= np.asarray([d != doc for d in doc_ids])
+    selected.sort(key=lambda i: hits[i][1], reverse=True)
+    return [hits[i] for i in selected]
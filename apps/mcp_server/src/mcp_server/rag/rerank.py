@@ -0,0 +1,126 @@
+"""Rerank кандидатов cross-encoder'ом (CPU) с бюджетом времени на запрос и кэшем оценок (query, sha256 текста чанка)."""
+import hashlib
+import logging
+import threading
+import time
+from concurrent import futures
+from typing import Any
+
+from mcp_server.rag.embedding import normalize_query
+from mcp_server.rag.lru import LRUCache
+from mcp_server.settings import Settings
+
+log = logging.getLogger(__name__)
+_settings = Settings()
+_reranker: Any = None
+_reranker_lock = threading.Lock()
+# predict идёт в отдельном потоке: запрос ждёт его не дольше остатка бюджета. Опоздавший батч досчитывается
+# в фоне и попадает в кэш оценок.
+_executor: futures.ThreadPoolExecutor | None = None
+_score_cache = LRUCache(_settings.rag_rerank_cache_size)
+# Сглаженное время одного мини-батча predict: по нему решается, успеет ли следующий батч в бюджет.
+_batch_s = 0.0
+_batch_lock = threading.Lock()
+
+Hit = tuple[str, float, dict[str, Any]]
+
+
+def get_reranker() -> Any:
+    """Единственный экземпляр CrossEncoder в процессе."""
+    global _reranker
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                from sentence_transformers import CrossEncoder
+                _reranker = CrossEncoder(_settings.rag_rerank_model, device="cpu")
+    return _reranker
+
+
+def get_score_cache() -> LRUCache:
+    return _score_cache
+
+
+def _get_executor() -> futures.ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _reranker_lock:
+            if _executor is None:
+                _executor = futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+    return _executor
+
+
+def _text_key(text: str) -> str:
+    """Ключ кэша по тексту, а не chunk_id: id детерминированы и у изменённого чанка остаются прежними."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _observe_batch(seconds: float | None) -> None:
+    """Учесть время батча; None — батч пропущен по оценке: оценка затухает, чтобы разовый медленный батч
+    не отключил rerank навсегда."""
+    global _batch_s
+    with _batch_lock:
+        if seconds is None:
+            _batch_s *= 0.5
+        else:
+            _batch_s = seconds if _batch_s == 0.0 else 0.8 * _batch_s + 0.2 * seconds
+
+
+def _score_batch(model: Any, model_name: str, q: str, batch: list[tuple[Hit, str]]) -> list[float]:
+    pairs = [(q, str(payload.get("text", ""))) for (_, _, payload), _ in batch]
+    t0 = time.perf_counter()
+    predicted = [float(s) for s in model.predict(pairs, show_progress_bar=False).tolist()]
+    _observe_batch(time.perf_counter() - t0)
+    for (_, text_key), score in zip(batch, predicted):
+        _score_cache.put((model_name, q, text_key), score)
+    return predicted
+
+
+def rerank(
+    query: str,
+    hits: list[Hit],
+    k: int,
+    budget_ms: float | None = None,
+) -> tuple[list[Hit], dict[str, Any]]:
+    """Переранжировать hits и вернуть top-k. Оценки считаются мини-батчами; бюджет — жёсткий: батч запускается,
+    только если по оценке его времени укладывается в бюджет, и ждём его не дольше остатка бюджета. Иначе —
+    исходный (fused) порядок. Загрузка модели в бюджет не входит. Возвращает (hits, meta)."""
+    budget_s = (budget_ms if budget_ms is not None else _settings.rag_rerank_budget_ms) / 1000.0
+    q = normalize_query(query)
+    model_name = _settings.rag_rerank_model
+    scores: dict[str, float] = {}
+    missing: list[tuple[Hit, str]] = []
+    for hit in hits:
+        text_key = _text_key(str(hit[2].get("text", "")))
+        cached = _score_cache.get((model_name, q, text_key))
+        if cached is None:
+            missing.append((hit, text_key))
+        else:
+            scores[hit[0]] = cached
+    meta: dict[str, Any] = {"reranked": False, "candidates": len(hits), "cached": len(scores)}
+    batch_size = max(1, _settings.rag_rerank_batch_size)
+    model = get_reranker() if missing else None
+    start = time.perf_counter()
+    for i in range(0, len(missing), batch_size):
+        elapsed = time.perf_counter() - start
+        predicted: list[float] | None = None
+        if elapsed + _batch_s > budget_s:
+            if elapsed <= budget_s:
+                _observe_batch(None)
+        else:
+            batch = missing[i:i + batch_size]
+            future = _get_executor().submit(_score_batch, model, model_name, q, batch)
+            try:
+                predicted = future.result(timeout=budget_s - elapsed)
+            except futures.TimeoutError:
+                pass
+        if predicted is None:
+            meta["fallback"] = "budget_exceeded"
+            meta["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+            log.info("[RAG] rerank budget exceeded scored=%d/%d", len(scores), len(hits))
+            return hits[:k], meta
+        for ((cid, _, _), _), score in zip(batch, predicted):
+            scores[cid] = score
+    ranked = sorted(hits, key=lambda h: scores[h[0]], reverse=True)[:k]
+    meta["reranked"] = True
+    meta["duration_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    return [(cid, scores[cid], payload) for cid, _, payload in ranked], meta
@@ -0,0 +1,120 @@
+"""Кэш результатов поиска по близости эмбеддингов запросов: перефразированный запрос с теми же filters/k
+и теми же идентификаторами (коды, числа, ключи) при cosine >= порога получает сохранённые hits.
+Сбрасывается при смене версии KB; записи живут не дольше ttl_s."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable
+
+import numpy as np
+
+from mcp_server.rag import sparse
+from mcp_server.rag.kb_version import get_kb_version
+from mcp_server.settings import Settings
+
+_settings = Settings()
+
+Hit = tuple[str, float, dict[str, Any]]
+# hits и meta поиска (cutoff_reason, candidates).
+Entry = tuple[list[Hit], dict[str, Any]]
+
+
+def make_key(filters: dict[str, Any] | None, k: int, query: str = "") -> Hashable:
+    """Ключ точного совпадения: filters, k и идентификаторы запроса; внутри ключа сравнивается cosine.
+    У e5 высокий базовый cosine — запросы про ERR-1042 и ERR-1043 без идентификаторов в ключе совпали бы."""
+    return (tuple(sorted((filters or {}).items())), k, sparse.identifier_terms(query))
+
+
+class SemanticResultCache:
+    """Ограниченный LRU записей (вектор запроса, (hits, meta)); поиск — один matvec по записям с тем же ключом.
+    Версию KB вызывающий читает до поиска (version()) и передаёт в put(): результат поиска, во время которого
+    прошёл ingest, не сохраняется. ttl_s > 0 — страховка на случай изменений KB мимо bump_kb_version."""
+
+    def __init__(self, maxsize: int, threshold: float, ttl_s: float = 0.0):
+        self._maxsize = maxsize
+        self._threshold = threshold
+        self._ttl_s = ttl_s
+        self._entries: OrderedDict[int, tuple[Hashable, np.ndarray, Entry, float]] = OrderedDict()
+        self._next_id = 0
+        self._version = get_kb_version()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _check_version(self) -> None:
+        version = get_kb_version()
+        if version != self._version:
+            self._entries.clear()
+            self._version = version
+
+    def version(self) -> int:
+        """Версия KB, которую нужно передать в put() для результата поиска, начатого после этого вызова."""
+        return get_kb_version()
+
+    @staticmethod
+    def _normalize(vector: list[float]) -> np.ndarray:
+        v = np.asarray(vector, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm > 0 else v
+
+    def get(self, key: Hashable, vector: list[float]) -> Entry | None:
+        if self._maxsize <= 0:
+            return None
+        q = self._normalize(vector)
+        with self._lock:
+            self._check_version()
+            if self._ttl_s > 0:
+                expired = time.monotonic() - self._ttl_s
+                for eid in [eid for eid, e in self._entries.items() if e[3] < expired]:
+                    del self._entries[eid]
+            ids = [eid for eid, (ekey, _, _, _) in self._entries.items() if ekey == key]
+            if ids:
+                sims = np.stack([self._entries[eid][1] for eid in ids]) @ q
+                best = int(np.argmax(sims))
+                if float(sims[best]) >= self._threshold:
+                    eid = ids[best]
+                    self._entries.move_to_end(eid)
+                    self.hits += 1
+                    return self._entries[eid][2]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, vector: list[float], entry: Entry, version: int) -> None:
+        """version — версия KB на момент начала поиска; если с тех пор она сменилась, результат не сохраняется."""
+        if self._maxsize <= 0:
+            return
+        q = self._normalize(vector)
+        with self._lock:
+            self._check_version()
+            if version != self._version:
+                return
+            self._entries[self._next_id] = (key, q, entry, time.monotonic())
+            self._next_id += 1
+            while len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "size": len(self._entries),
+                "kb_version": self._version,
+            }
+
+
+_result_cache = SemanticResultCache(
+    _settings.rag_result_cache_size if _settings.rag_result_cache_enabled else 0,
+    _settings.rag_result_cache_threshold,
+    _settings.rag_result_cache_ttl_s,
+)
+
+
+def get_result_cache() -> SemanticResultCache:
+    return _result_cache
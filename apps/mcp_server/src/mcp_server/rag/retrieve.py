@@ -1,30 +1,216 @@
-"""Retrieval: запрос -> эмбеддинг -> top-k чанков в Qdrant."""
+"""Retrieval: запрос -> эмбеддинг (+ BM25 sparse) -> top-k чанков в Qdrant, гибрид сливается через RRF.
+Порог релевантности применяется в самом запросе к store, хвост dense-выдачи после резкого падения cosine
+отрезается (adaptive k) до слияния и rerank — их оценки с cosine-правилами несравнимы."""
 import logging
 from typing import Any
 
-from mcp_server.rag.embedding import get_embedding_model
-from mcp_server.rag.store.qdrant_store import QdrantStore
+from audit import audit_event
+from mcp_server.rag import sparse
+from mcp_server.rag.embedding import encode_queries, get_query_cache
+from mcp_server.rag.formats import PREVIEW_MAX_CHARS, truncate_preview
+from mcp_server.rag.mmr import mmr_select
+from mcp_server.rag.rerank import rerank
+from mcp_server.rag.result_cache import get_result_cache, make_key
+from mcp_server.rag.store.factory import VectorStore, get_store
+from mcp_server.rag.store.qdrant_store import VECTOR_PAYLOAD_KEY
 from mcp_server.settings import Settings
 
 log = logging.getLogger(__name__)
 _settings = Settings()
 
+Hit = tuple[str, float, dict[str, Any]]
 
-def retrieve(
+# Поля payload, нужные kb_search: без text (превью посчитано при индексации) и без векторов.
+SEARCH_PAYLOAD_FIELDS = ["doc_id", "doc_key", "title", "doc_type", "language", "chunk_id", "chunk_index", "preview"]
+
+
+def rrf_fuse(result_lists: list[list[Hit]], k: int, rrf_k: int = 60) -> list[Hit]:
+    """Reciprocal Rank Fusion: score = sum(1 / (rrf_k + rank)) по спискам, rank с 1."""
+    scores: dict[str, float] = {}
+    payloads: dict[str, dict[str, Any]] = {}
+    for hits in result_lists:
+        for rank, (cid, _, payload) in enumerate(hits, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (rrf_k + rank)
+            payloads.setdefault(cid, payload)
+    ranked = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+    return [(cid, score, payloads[cid]) for cid, score in ranked]
+
+
+def adaptive_cutoff(hits: list[Hit], k: int) -> tuple[list[Hit], str]:
+    """Отрезать хвост после "локтя": score ниже доли от top-1 или скачок между соседями больше доли от top-1.
+    Только для cosine-оценок dense-выдачи (не RRF и не логитов cross-encoder'а).
+    Возвращает (hits, причина): score_ratio | score_gap | k (дошли до k) | threshold (store вернул меньше k)."""
+    exhausted = "k" if len(hits) >= k else "threshold"
+    if not _settings.rag_adaptive_k_enabled or not hits or hits[0][1] <= 0:
+        return hits, exhausted
+    top = hits[0][1]
+    min_ratio, max_gap = _settings.rag_adaptive_k_min_ratio, _settings.rag_adaptive_k_max_gap
+    for i in range(max(1, _settings.rag_adaptive_k_min), len(hits)):
+        score, prev = hits[i][1], hits[i - 1][1]
+        if min_ratio > 0 and score < top * min_ratio:
+            return hits[:i], "score_ratio"
+        if max_gap > 0 and prev - score > top * max_gap:
+            return hits[:i], "score_gap"
+    return hits, exhausted
+
+
+def _fill_missing_previews(store: Any, results: list[list[Hit]]) -> None:
+    """Точки, проиндексированные до появления поля preview: догрузить text одним retrieve и посчитать превью."""
+    missing = {cid for hits in results for cid, _, payload in hits if "preview" not in payload}
+    if not missing:
+        return
+    texts = store.get_by_ids(sorted(missing), payload_fields=["text"])
+    for hits in results:
+        for cid, _, payload in hits:
+            if "preview" not in payload:
+                payload["preview"] = truncate_preview((texts.get(cid) or {}).get("text", ""), PREVIEW_MAX_CHARS)
+
+
+def _search(
+    s: Any,
+    texts: list[str],
+    vectors: list[list[float]],
+    k_val: int,
+    filters: dict[str, Any] | None,
+) -> list[tuple[list[Hit], dict[str, Any]]]:
+    """Поиск в store (dense или hybrid + RRF), adaptive k по dense, превью, опциональные rerank и MMR.
+    Возвращает [(hits, meta)] по запросам; meta: cutoff_reason, candidates."""
+    mmr = _settings.rag_mmr_enabled
+    # MMR выбирает k из пула k * rag_mmr_overfetch; rerank (если включён) сужает over-fetch до этого пула.
+    pool_k = k_val * max(1, _settings.rag_mmr_overfetch) if mmr else k_val
+    fetch_k = pool_k * max(1, _settings.rag_rerank_overfetch) if _settings.rag_rerank_enabled else pool_k
+    fields = SEARCH_PAYLOAD_FIELDS + (["text"] if _settings.rag_rerank_enabled else [])
+    threshold = _settings.rag_relevance_threshold if _settings.rag_relevance_threshold > 0 else None
+    reasons: list[str | None] = []
+    candidates: list[int] = []
+    if _settings.rag_hybrid_enabled and s.has_sparse:
+        pool = max(fetch_k, _settings.rag_hybrid_candidates)
+        pairs = s.search_hybrid_batch(
+            vectors,
+            [sparse.encode_query(t) for t in texts],
+            k=pool,
+            filters=filters,
+            payload_fields=fields,
+            score_threshold=threshold,
+            with_vectors=mmr,
+        )
+        results = []
+        for dense, lexical in pairs:
+            # Локоть ищется по cosine dense-списка; BM25-кандидаты (точные идентификаторы) им не режутся.
+            cut, reason = adaptive_cutoff(dense, pool)
+            reasons.append(reason if len(cut) < len(dense) else None)
+            candidates.append(len({cid for cid, _, _ in dense} | {cid for cid, _, _ in lexical}))
+            results.append(rrf_fuse([cut, lexical], fetch_k, _settings.rag_rrf_k))
+    else:
+        if len(vectors) == 1:
+            dense_lists = [s.search(
+                vectors[0], k=fetch_k, filters=filters, payload_fields=fields, score_threshold=threshold, with_vectors=mmr
+            )]
+        else:
+            dense_lists = s.search_batch(
+                vectors, k=fetch_k, filters=filters, payload_fields=fields, score_threshold=threshold, with_vectors=mmr
+            )
+        results = []
+        for dense in dense_lists:
+            cut, reason = adaptive_cutoff(dense, fetch_k)
+            reasons.append(reason if len(cut) < len(dense) else None)
+            candidates.append(len(dense))
+            results.append(cut)
+    _fill_missing_previews(s, results)
+    if _settings.rag_rerank_enabled:
+        reranked = []
+        for text, hits in zip(texts, results):
+            if hits:
+                hits, rerank_meta = rerank(text, hits, pool_k)
+                audit_event("rag.rerank", **rerank_meta)
+            reranked.append(hits)
+        results = reranked
+    if mmr:
+        results = [
+            mmr_select(qv, hits, k_val, _settings.rag_mmr_lambda, _settings.rag_mmr_per_doc_cap)
+            for qv, hits in zip(vectors, results)
+        ]
+        # Векторы нужны только MMR: в кэш результатов и ответы не уходят.
+        for hits in results:
+            for _, _, payload in hits:
+                payload.pop(VECTOR_PAYLOAD_KEY, None)
+    out = []
+    for hits, reason, n in zip(results, reasons, candidates):
+        hits = hits[:k_val]
+        out.append((hits, {"cutoff_reason": reason or ("k" if len(hits) >= k_val else "threshold"), "candidates": n}))
+    return out
+
+
+def retrieve_batch_with_meta(
+    queries: list[str],
+    k: int | None = None,
+    filters: dict[str, Any] | None = None,
+    store: VectorStore | None = None,
+) -> tuple[list[list[Hit]], list[dict[str, Any]]]:
+    """Несколько запросов: один батч encode и один batch-запрос в Qdrant. Результаты в порядке queries.
+    Запросы, близкие к уже выполненным (семантический кэш результатов), в Qdrant не уходят.
+    Возвращает (hits, meta) по каждому запросу; meta["cutoff_reason"] — почему выдача короче или равна k."""
+    texts = [q.strip() for q in queries]
+    if not texts:
+        return [], []
+    k_val = k if k is not None else _settings.rag_default_k
+    log.info("[RAG] retrieve queries=%d first=%r k=%s", len(texts), texts[0][:60], k_val)
+    s: Any = store if store is not None else get_store()
+    s.ensure_collection()
+    encoded = encode_queries(texts)
+    audit_event(
+        "rag.embedding_cache",
+        queries=len(encoded),
+        cache_hits=sum(1 for _, hit in encoded if hit),
+        **get_query_cache().stats(),
+    )
+    vectors = [v for v, _ in encoded]
+    cache = get_result_cache()
+    version = cache.version()
+    cache_keys = [make_key(filters, k_val, t) for t in texts]
+    results: list[tuple[list[Hit], dict[str, Any]] | None] = [cache.get(key, v) for key, v in zip(cache_keys, vectors)]
+    todo = [i for i, r in enumerate(results) if r is None]
+    if todo:
+        found = _search(s, [texts[i] for i in todo], [vectors[i] for i in todo], k_val, filters)
+        for i, entry in zip(todo, found):
+            results[i] = entry
+            cache.put(cache_keys[i], vectors[i], entry, version)
+    audit_event("rag.result_cache", queries=len(texts), cache_hits=len(texts) - len(todo), **cache.stats())
+    out: list[list[Hit]] = [hits for hits, _ in results]
+    metas: list[dict[str, Any]] = [dict(meta) for _, meta in results]
+    log.info(
+        "[RAG] retrieve done chunks=%s cutoff=%s cached=%d",
+        [len(r) for r in out], [m["cutoff_reason"] for m in metas], len(texts) - len(todo),
+    )
+    return out, metas
+
+
+def retrieve_batch(
+    queries: list[str],
+    k: int | None = None,
+    filters: dict[str, Any] | None = None,
+    store: VectorStore | None = None,
+) -> list[list[Hit]]:
+    return retrieve_batch_with_meta(queries, k=k, filters=filters, store=store)[0]
+
+
+def retrieve_with_meta(
     query: str,
     k: int | None = None,
     filters: dict[str, Any] | None = None,
-    store: QdrantStore | None = None,
-) -> list[tuple[str, float, dict[str, Any]]]:
+    store: VectorStore | None = None,
+) -> tuple[list[Hit], dict[str, Any]]:
     if not query or not query.strip():
         log.info("[RAG] retrieve empty query -> []")
-        return []
-    k_val = k if k is not None else _settings.rag_default_k
-    log.info("[RAG] retrieve query=%r k=%s", query.strip()[:60], k_val)
-    s = store if store is not None else QdrantStore()
-    s.ensure_collection()
-    model = get_embedding_model()
-    qv = model.encode([query.strip()], show_progress_bar=False).tolist()[0]
-    results = s.search(qv, k=k_val, filters=filters)
-    log.info("[RAG] retrieve done chunks=%d", len(results))
-    return results
+        return [], {"cutoff_reason": "empty_query", "candidates": 0}
+    results, metas = retrieve_batch_with_meta([query], k=k, filters=filters, store=store)
+    return results[0], metas[0]
+
+
+def retrieve(
+    query: str,
+    k: int | None = None,
+    filters: dict[str, Any] | None = None,
+    store: VectorStore | None = None,
+) -> list[Hit]:
+    return retrieve_with_meta(query, k=k, filters=filters, store=store)[0]
@@ -0,0 +1,62 @@
+"""Sparse-векторы для лексического поиска (BM25): токены -> хэш-индексы, веса TF-части BM25.
+IDF считает Qdrant (sparse vector с modifier=IDF), поэтому корпусная статистика на клиенте не нужна."""
+import re
+import zlib
+from collections import Counter
+
+from mcp_server.settings import Settings
+
+_settings = Settings()
+
+# Идентификаторы целиком: коды ошибок, имена сервисов, ключи конфигов (max_client_conn, checkout-v2, ES_CLUSTER_RED).
+_TOKEN = re.compile(r"\w+(?:[.\-:/]\w+)*", re.UNICODE)
+_PARTS = re.compile(r"[.\-:/_]+")
+
+
+def tokenize(text: str) -> list[str]:
+    """Токены в нижнем регистре; составной идентификатор даёт и себя, и свои части."""
+    out: list[str] = []
+    for m in _TOKEN.finditer(text.lower()):
+        tok = m.group(0)
+        out.append(tok)
+        parts = [p for p in _PARTS.split(tok) if p]
+        if len(parts) > 1:
+            out.extend(parts)
+    return out
+
+
+def identifier_terms(text: str) -> frozenset[str]:
+    """Токены-идентификаторы запроса: содержат цифру или разделитель (коды ошибок, версии, ключи конфигов).
+    Запросы, различающиеся ими, — разные запросы, даже если их эмбеддинги почти совпадают."""
+    return frozenset(
+        tok for tok in (m.group(0) for m in _TOKEN.finditer(text.lower()))
+        if any(ch.isdigit() for ch in tok) or _PARTS.search(tok)
+    )
+
+
+def _index(token: str) -> int:
+    return zlib.crc32(token.encode("utf-8")) & 0x7FFFFFFF
+
+
+def _to_sparse(weights: dict[int, float]) -> tuple[list[int], list[float]]:
+    indices = sorted(weights)
+    return indices, [weights[i] for i in indices]
+
+
+def encode_document(text: str) -> tuple[list[int], list[float]]:
+    """Sparse-вектор чанка: tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl))."""
+    tokens = tokenize(text)
+    if not tokens:
+        return [], []
+    k1, b = _settings.rag_bm25_k1, _settings.rag_bm25_b
+    norm = 1 - b + b * len(tokens) / max(1.0, _settings.rag_bm25_avg_doc_tokens)
+    weights: dict[int, float] = {}
+    for tok, tf in Counter(tokens).items():
+        idx = _index(tok)
+        weights[idx] = weights.get(idx, 0.0) + tf * (k1 + 1) / (tf + k1 * norm)
+    return _to_sparse(weights)
+
+
+def encode_query(text: str) -> tuple[list[int], list[float]]:
+    """Sparse-вектор запроса: каждый уникальный токен с весом 1 (вклад терма = IDF * TF-часть документа)."""
+    return _to_sparse({_index(tok): 1.0 for tok in set(tokenize(text))})
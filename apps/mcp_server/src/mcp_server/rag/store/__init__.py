@@ -1 +1 @@
-# Store: Qdrant, models
+# Store: Qdrant, local (numpy/mmap), factory, models
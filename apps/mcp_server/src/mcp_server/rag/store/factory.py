@@ -0,0 +1,201 @@
+"""Выбор vector store по настройкам: qdrant | local, fallback на локальный store при недоступном Qdrant."""
+import logging
+import threading
+import time
+from typing import Any, Protocol
+
+from mcp_server.rag.store.local_store import LocalVectorStore
+from mcp_server.rag.store.qdrant_store import CONNECTION_ERRORS, get_qdrant_store
+from mcp_server.settings import Settings
+
+log = logging.getLogger(__name__)
+_settings = Settings()
+
+_FALLBACK_RETRY_S = 30.0
+
+Hit = tuple[str, float, dict[str, Any]]
+
+
+class VectorStore(Protocol):
+    """Общий интерфейс QdrantStore и LocalVectorStore."""
+
+    @property
+    def has_sparse(self) -> bool: ...
+
+    def ensure_collection(self) -> None: ...
+
+    def upsert(
+        self,
+        points: list[tuple[str, list[float], dict[str, Any]]],
+        sparse_vectors: list[tuple[list[int], list[float]]] | None = None,
+    ) -> None: ...
+
+    def search(
+        self,
+        query_vector: list[float],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        score_threshold: float | None = None,
+        with_vectors: bool = False,
+    ) -> list[Hit]: ...
+
+    def search_batch(
+        self,
+        query_vectors: list[list[float]],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        score_threshold: float | None = None,
+        with_vectors: bool = False,
+    ) -> list[list[Hit]]: ...
+
+    def get_by_id(self, chunk_id: str) -> dict[str, Any] | None: ...
+
+    def get_by_ids(self, chunk_ids: list[str], payload_fields: list[str] | None = None) -> dict[str, dict[str, Any]]: ...
+
+    def get_chunk_ranges(
+        self,
+        ranges: list[tuple[str, int, int]],
+        payload_fields: list[str] | None = None,
+    ) -> list[dict[str, Any]]: ...
+
+    def delete_by_doc_id(self, doc_id: str) -> None: ...
+
+    def delete_by_ids(self, chunk_ids: list[str]) -> None: ...
+
+    def flush(self) -> None: ...
+
+
+class MirrorStore:
+    """Запись в основной store и в локальную копию (для fallback); чтение — из основного.
+    Неизменённые документы ingest пропускает и в копию они не пишутся, поэтому ensure_collection сверяет копию
+    с Qdrant (коллекция и число точек) и при расхождении заполняет её заново из Qdrant."""
+
+    def __init__(self, primary: Any, mirror: LocalVectorStore):
+        self._primary = primary
+        self._mirror = mirror
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._primary, name)
+
+    def ensure_collection(self) -> None:
+        self._primary.ensure_collection()
+        self._mirror.ensure_collection()
+        source = self._primary.collection_name
+        if self._mirror.synced_with == source and self._mirror.count() == self._primary.count():
+            return
+        log.info("[STORE] seeding local mirror from Qdrant collection=%s", source)
+        self._mirror.reset()
+        for batch in self._primary.iter_points():
+            self._mirror.upsert(batch)
+        self._mirror.mark_synced(source)
+        self._mirror.flush()
+        log.info("[STORE] local mirror seeded points=%d", self._mirror.count())
+
+    def flush(self) -> None:
+        self._primary.flush()
+        self._mirror.flush()
+
+    def upsert(
+        self,
+        points: list[tuple[str, list[float], dict[str, Any]]],
+        sparse_vectors: list[tuple[list[int], list[float]]] | None = None,
+    ) -> None:
+        self._primary.upsert(points, sparse_vectors=sparse_vectors)
+        self._mirror.upsert(points)
+
+    def delete_by_doc_id(self, doc_id: str) -> None:
+        self._primary.delete_by_doc_id(doc_id)
+        self._mirror.delete_by_doc_id(doc_id)
+
+    def delete_by_ids(self, chunk_ids: list[str]) -> None:
+        self._primary.delete_by_ids(chunk_ids)
+        self._mirror.delete_by_ids(chunk_ids)
+
+
+_local: LocalVectorStore | None = None
+_lock = threading.Lock()
+_fallback_until = 0.0
+
+
+def get_local_store() -> LocalVectorStore:
+    global _local
+    if _local is None:
+        with _lock:
+            if _local is None:
+                _local = LocalVectorStore()
+    return _local
+
+
+def _fall_back(primary: Any, error: BaseException) -> LocalVectorStore:
+    """Переключить чтение на локальный store на _FALLBACK_RETRY_S секунд."""
+    global _fallback_until
+    local = get_local_store()
+    if local.synced_with != primary.collection_name:
+        log.warning(
+            "[STORE] Qdrant unreachable, falling back to local store that is not a full copy of %s "
+            "(points=%d), results may be incomplete: %s", primary.collection_name, local.count(), error,
+        )
+    else:
+        log.warning("[STORE] Qdrant unreachable, falling back to local store: %s", error)
+    _fallback_until = time.monotonic() + _FALLBACK_RETRY_S
+    return local
+
+
+class FallbackStore:
+    """Чтение из Qdrant; ошибка соединения в любом вызове (в том числе после успешных) переключает на локальный
+    store: тот же вызов повторяется локально, следующие _FALLBACK_RETRY_S секунд get_store отдаёт локальный."""
+
+    def __init__(self, primary: Any):
+        self._primary = primary
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._primary, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args: Any, **kwargs: Any) -> Any:
+            try:
+                return attr(*args, **kwargs)
+            except CONNECTION_ERRORS as e:
+                return getattr(_fall_back(self._primary, e), name)(*args, **kwargs)
+
+        return call
+
+    def search_hybrid_batch(
+        self,
+        query_vectors: list[list[float]],
+        sparse_queries: list[tuple[list[int], list[float]]],
+        **kwargs: Any,
+    ) -> list[tuple[list[Hit], list[Hit]]]:
+        """В локальном store нет sparse-векторов: при fallback — только dense-списки, BM25-списки пустые."""
+        try:
+            return self._primary.search_hybrid_batch(query_vectors, sparse_queries, **kwargs)
+        except CONNECTION_ERRORS as e:
+            dense = _fall_back(self._primary, e).search_batch(query_vectors, **kwargs)
+            return [(hits, []) for hits in dense]
+
+
+def get_store() -> Any:
+    """Store для чтения (retrieve, kb_get_chunk). rag_vector_store=local — всегда локальный;
+    qdrant + rag_local_store_fallback — Qdrant через FallbackStore, после ошибки соединения — локальный
+    (повторная попытка Qdrant через 30 с)."""
+    if _settings.rag_vector_store == "local":
+        return get_local_store()
+    store = get_qdrant_store()
+    if not _settings.rag_local_store_fallback:
+        return store
+    if time.monotonic() < _fallback_until:
+        return get_local_store()
+    return FallbackStore(store)
+
+
+def get_ingest_store() -> Any:
+    """Store для индексации: при включённом fallback пишет и в Qdrant, и в локальную копию."""
+    if _settings.rag_vector_store == "local":
+        return get_local_store()
+    store = get_qdrant_store()
+    if _settings.rag_local_store_fallback:
+        return MirrorStore(store, get_local_store())
+    return store
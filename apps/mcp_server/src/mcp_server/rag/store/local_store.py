@@ -0,0 +1,349 @@
+"""Локальный vector store в процессе: memory-mapped матрица float32 + таблица payload, точный cosine top-k.
+Для KB на тысячи чанков дешевле сетевого похода в Qdrant; тот же интерфейс, что у QdrantStore.
+Запись меняет состояние в памяти, на диск оно попадает в flush() — один раз за прогон ingest."""
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from mcp_server.rag.store.qdrant_store import VECTOR_PAYLOAD_KEY, VECTOR_SIZE, canonical_point_id
+from mcp_server.settings import Settings
+
+log = logging.getLogger(__name__)
+
+_VECTORS_FILE = "vectors.npy"
+_PAYLOADS_FILE = "payloads.json"
+_META_FILE = "meta.json"
+_FILTER_KEYS = ("doc_type", "language")
+
+
+class LocalVectorStore:
+    """Векторы хранятся нормализованными (cosine = dot), файл открывается через np.load(mmap_mode="r").
+    upsert/delete меняют строки в памяти (при первой записи mmap копируется в буфер с запасом, удалённые строки
+    помечаются свободными и переиспользуются); flush() сжимает живые строки и атомарно заменяет файлы.
+    meta.json: synced_with — коллекция Qdrant, с которой копия синхронизирована (для fallback)."""
+
+    def __init__(self, path: str | Path | None = None):
+        self._path = Path(path or Settings().rag_local_store_path)
+        self._lock = threading.RLock()
+        self._buf = np.zeros((0, VECTOR_SIZE), dtype=np.float32)
+        self._n = 0
+        self._ids: list[str | None] = []
+        self._payloads: list[dict[str, Any] | None] = []
+        self._row: dict[str, int] = {}
+        self._by_doc: dict[str, set[int]] = {}
+        self._free: list[int] = []
+        self._columns: dict[str, np.ndarray] = {}
+        self._live: np.ndarray | None = None
+        self._index_stale = True
+        self._meta: dict[str, Any] = {}
+        self._dirty = False
+        self._loaded = False
+
+    @property
+    def has_sparse(self) -> bool:
+        return False
+
+    @property
+    def synced_with(self) -> str | None:
+        """Коллекция Qdrant, полной копией которой является store (None — копия неполная или не из Qdrant)."""
+        self.ensure_collection()
+        return self._meta.get("synced_with")
+
+    def count(self) -> int:
+        self.ensure_collection()
+        return len(self._row)
+
+    def ensure_collection(self) -> None:
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._path.mkdir(parents=True, exist_ok=True)
+            vectors_path = self._path / _VECTORS_FILE
+            payloads_path = self._path / _PAYLOADS_FILE
+            meta_path = self._path / _META_FILE
+            if vectors_path.exists() and payloads_path.exists():
+                table = json.loads(payloads_path.read_text(encoding="utf-8"))
+                self._set_state(
+                    np.load(vectors_path, mmap_mode="r"),
+                    [str(r["id"]) for r in table],
+                    [r["payload"] for r in table],
+                )
+                if meta_path.exists():
+                    self._meta = json.loads(meta_path.read_text(encoding="utf-8"))
+            log.info("[LOCAL_STORE] loaded path=%s points=%d", self._path, len(self._row))
+            self._loaded = True
+
+    def close(self) -> None:
+        self.flush()
+
+    def _set_state(self, vectors: np.ndarray, ids: list[str], payloads: list[dict[str, Any]]) -> None:
+        self._buf = vectors
+        self._n = len(ids)
+        self._ids = list(ids)
+        self._payloads = list(payloads)
+        self._row = {cid: i for i, cid in enumerate(ids)}
+        self._by_doc = {}
+        for i, p in enumerate(payloads):
+            self._by_doc.setdefault(str(p.get("doc_id", "")), set()).add(i)
+        self._free = []
+        self._index_stale = True
+
+    def _index(self) -> None:
+        """Колонки фильтров и маска живых строк; пересобираются лениво после записи."""
+        if not self._index_stale:
+            return
+        payloads = self._payloads[:self._n]
+        self._columns = {
+            key: np.asarray([str(p.get(key, "")) if p is not None else "" for p in payloads], dtype=object)
+            for key in _FILTER_KEYS
+        }
+        self._live = np.asarray([p is not None for p in payloads], dtype=bool) if self._free else None
+        self._index_stale = False
+
+    def _writable(self, extra: int) -> None:
+        """Буфер, в который можно писать, с местом ещё на extra строк (mmap копируется один раз за прогон)."""
+        need = self._n + extra
+        if self._buf.flags.writeable and need <= len(self._buf):
+            return
+        cap = max(need, 2 * len(self._buf), 64)
+        buf = np.zeros((cap, VECTOR_SIZE), dtype=np.float32)
+        buf[:self._n] = self._buf[:self._n]
+        self._buf = buf
+
+    def _persist(self, vectors: np.ndarray, ids: list[str], payloads: list[dict[str, Any]]) -> None:
+        vectors_path = self._path / _VECTORS_FILE
+        payloads_path = self._path / _PAYLOADS_FILE
+        tmp_vectors = self._path / (_VECTORS_FILE + ".tmp")
+        tmp_payloads = self._path / (_PAYLOADS_FILE + ".tmp")
+        tmp_meta = self._path / (_META_FILE + ".tmp")
+        with open(tmp_vectors, "wb") as f:
+            np.save(f, vectors)
+        tmp_payloads.write_text(
+            json.dumps([{"id": cid, "payload": p} for cid, p in zip(ids, payloads)], ensure_ascii=False),
+            encoding="utf-8",
+        )
+        tmp_meta.write_text(json.dumps(self._meta), encoding="utf-8")
+        os.replace(tmp_vectors, vectors_path)
+        os.replace(tmp_payloads, payloads_path)
+        os.replace(tmp_meta, self._path / _META_FILE)
+        self._set_state(np.load(vectors_path, mmap_mode="r"), ids, payloads)
+
+    def flush(self) -> None:
+        """Записать изменения на диск: живые строки подряд, атомарная замена файлов, повторный mmap."""
+        with self._lock:
+            if not self._dirty:
+                return
+            keep = [i for i in range(self._n) if self._ids[i] is not None]
+            self._persist(
+                np.array(self._buf[keep], dtype=np.float32).reshape(len(keep), VECTOR_SIZE),
+                [self._ids[i] for i in keep],
+                [self._payloads[i] for i in keep],
+            )
+            self._dirty = False
+            log.info("[LOCAL_STORE] flushed path=%s points=%d", self._path, len(keep))
+
+    def mark_synced(self, source: str | None) -> None:
+        """Отметить копию полной (source — коллекция Qdrant) или неполной (None); на диск — с flush()."""
+        self.ensure_collection()
+        with self._lock:
+            if self._meta.get("synced_with") != source:
+                self._meta["synced_with"] = source
+                self._dirty = True
+
+    def reset(self) -> None:
+        """Очистить store (перед повторным заполнением из Qdrant)."""
+        self.ensure_collection()
+        with self._lock:
+            self._set_state(np.zeros((0, VECTOR_SIZE), dtype=np.float32), [], [])
+            self._dirty = True
+
+    def upsert(
+        self,
+        points: list[tuple[str, list[float], dict[str, Any]]],
+        sparse_vectors: list[tuple[list[int], list[float]]] | None = None,
+    ) -> None:
+        if not points:
+            return
+        self.ensure_collection()
+        with self._lock:
+            self._writable(len(points))
+            for chunk_id, vector, payload in points:
+                v = np.asarray(vector, dtype=np.float32)
+                norm = float(np.linalg.norm(v))
+                v = v / norm if norm > 0 else v
+                cid = canonical_point_id(chunk_id)
+                doc_id = str(payload.get("doc_id", ""))
+                i = self._row.get(cid)
+                if i is not None:
+                    old_doc = str((self._payloads[i] or {}).get("doc_id", ""))
+                    if old_doc != doc_id:
+                        self._by_doc.get(old_doc, set()).discard(i)
+                elif self._free:
+                    i = self._free.pop()
+                else:
+                    i = self._n
+                    self._n += 1
+                    self._ids.append(None)
+                    self._payloads.append(None)
+                self._buf[i] = v
+                self._ids[i] = cid
+                self._payloads[i] = dict(payload)
+                self._row[cid] = i
+                self._by_doc.setdefault(doc_id, set()).add(i)
+            self._dirty = True
+            self._index_stale = True
+
+    def _drop_rows(self, rows: list[int]) -> None:
+        if not rows:
+            return
+        self._writable(0)
+        for i in rows:
+            cid = self._ids[i]
+            payload = self._payloads[i] or {}
+            self._row.pop(cid, None)
+            doc_rows = self._by_doc.get(str(payload.get("doc_id", "")))
+            if doc_rows is not None:
+                doc_rows.discard(i)
+                if not doc_rows:
+                    del self._by_doc[str(payload.get("doc_id", ""))]
+            self._ids[i] = None
+            self._payloads[i] = None
+            self._buf[i] = 0.0
+            self._free.append(i)
+        self._dirty = True
+        self._index_stale = True
+
+    def _mask(self, filters: dict[str, Any] | None) -> np.ndarray | None:
+        self._index()
+        mask = self._live
+        if not filters:
+            return mask
+        for key in _FILTER_KEYS:
+            if filters.get(key):
+                m = self._columns[key] == str(filters[key])
+                mask = m if mask is None else mask & m
+        return mask
+
+    def _project(self, i: int, payload_fields: list[str] | None) -> dict[str, Any]:
+        payload = self._payloads[i] or {}
+        if payload_fields is None:
+            return dict(payload)
+        return {f: payload[f] for f in payload_fields if f in payload}
+
+    def _top_k(
+        self,
+        scores: np.ndarray,
+        k: int,
+        mask: np.ndarray | None,
+        payload_fields: list[str] | None = None,
+        score_threshold: float | None = None,
+        with_vectors: bool = False,
+    ) -> list[tuple[str, float, dict[str, Any]]]:
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+        if score_threshold is not None:
+            scores = np.where(scores >= score_threshold, scores, -np.inf)
+        n = min(k, int(np.isfinite(scores).sum()))
+        if n <= 0:
+            return []
+        top = np.argpartition(-scores, n - 1)[:n]
+        top = top[np.argsort(-scores[top])]
+        hits = [(self._ids[i], float(scores[i]), self._project(i, payload_fields)) for i in top]
+        if with_vectors:
+            for i, (_, _, payload) in zip(top, hits):
+                payload[VECTOR_PAYLOAD_KEY] = self._buf[i].tolist()
+        return hits
+
+    def search_batch(
+        self,
+        query_vectors: list[list[float]],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        score_threshold: float | None = None,
+        with_vectors: bool = False,
+    ) -> list[list[tuple[str, float, dict[str, Any]]]]:
+        """Точный cosine top-k: один matmul (Q x D) на все запросы + argpartition по строкам."""
+        self.ensure_collection()
+        with self._lock:
+            if not self._row:
+                return [[] for _ in query_vectors]
+            q = np.asarray(query_vectors, dtype=np.float32)
+            norms = np.linalg.norm(q, axis=1, keepdims=True)
+            q = q / np.where(norms > 0, norms, 1.0)
+            scores = q @ self._buf[:self._n].T
+            mask = self._mask(filters)
+            return [self._top_k(row, k, mask, payload_fields, score_threshold, with_vectors) for row in scores]
+
+    def search(
+        self,
+        query_vector: list[float],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        score_threshold: float | None = None,
+        with_vectors: bool = False,
+    ) -> list[tuple[str, float, dict[str, Any]]]:
+        return self.search_batch(
+            [query_vector],
+            k=k,
+            filters=filters,
+            payload_fields=payload_fields,
+            score_threshold=score_threshold,
+            with_vectors=with_vectors,
+        )[0]
+
+    def get_by_id(self, chunk_id: str) -> dict[str, Any] | None:
+        return self.get_by_ids([chunk_id]).get(chunk_id)
+
+    def get_by_ids(
+        self,
+        chunk_ids: list[str],
+        payload_fields: list[str] | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        self.ensure_collection()
+        with self._lock:
+            out = {}
+            for cid in map(str, chunk_ids):
+                i = self._row.get(canonical_point_id(cid))
+                if i is not None:
+                    out[cid] = self._project(i, payload_fields)
+            return out
+
+    def get_chunk_ranges(
+        self,
+        ranges: list[tuple[str, int, int]],
+        payload_fields: list[str] | None = None,
+    ) -> list[dict[str, Any]]:
+        if not ranges:
+            return []
+        self.ensure_collection()
+        wanted: dict[str, list[tuple[int, int]]] = {}
+        for doc_id, lo, hi in ranges:
+            wanted.setdefault(str(doc_id), []).append((lo, hi))
+        with self._lock:
+            out = []
+            for doc_id, spans in wanted.items():
+                for i in sorted(self._by_doc.get(doc_id, ())):
+                    idx = (self._payloads[i] or {}).get("chunk_index")
+                    if isinstance(idx, int) and any(lo <= idx <= hi for lo, hi in spans):
+                        out.append(self._project(i, payload_fields))
+            return out
+
+    def delete_by_doc_id(self, doc_id: str) -> None:
+        self.ensure_collection()
+        with self._lock:
+            self._drop_rows(sorted(self._by_doc.get(str(doc_id), ())))
+
+    def delete_by_ids(self, chunk_ids: list[str]) -> None:
+        self.ensure_collection()
+        with self._lock:
+            ids = dict.fromkeys(canonical_point_id(cid) for cid in chunk_ids)
+            self._drop_rows([self._row[cid] for cid in ids if cid in self._row])
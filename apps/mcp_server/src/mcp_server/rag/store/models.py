@@ -1,4 +1,6 @@
-"""Pydantic-модели для чанков. Формат chunk_id: doc:{doc_id}#chunk:{chunk_index}."""
+"""Pydantic-модели для чанков и компактная запись чанка для ingest. Формат chunk_id: doc:{doc_id}#chunk:{chunk_index}."""
+from dataclasses import dataclass
+
 from pydantic import BaseModel, ConfigDict
 
 
@@ -23,6 +25,18 @@ class ChunkMeta(BaseModel):
     section: str = ""
     chunk_index: int = 0
     text: str = ""
+    tokens: int = 0
+
+
+@dataclass(slots=True)
+class ChunkRecord:
+    """Чанк в потоке ingest: без валидации и без полей документа (они общие для всех чанков документа).
+    overlap — сколько первых символов text повторяют конец предыдущего чанка (для склейки соседей)."""
+    chunk_index: int
+    text: str
+    section: str = ""
+    tokens: int = 0
+    overlap: int = 0
 
 
 def make_chunk_id(doc_id: str, chunk_index: int) -> str:
@@ -1,50 +1,364 @@
-"""Qdrant vector store: коллекция 384 dim (cosine), upsert/search/get/delete по doc_id."""
-from typing import Any
+"""Qdrant vector store: коллекция 384 dim (cosine) по профилю из настроек, upsert/search/get/delete по doc_id и id. Общий клиент на процесс."""
+import logging
+import threading
+from typing import Any, Callable, Iterator, TypeVar
+from uuid import UUID
 
+import numpy as np
 from qdrant_client import QdrantClient
+from qdrant_client.http.exceptions import ResponseHandlingException, UnexpectedResponse
 from qdrant_client.models import (
+    Disabled,
     Distance,
     FieldCondition,
     Filter,
     FilterSelector,
+    HnswConfigDiff,
     MatchValue,
+    Modifier,
+    PayloadSchemaType,
+    PayloadSelectorInclude,
+    PointIdsList,
     PointStruct,
+    QuantizationSearchParams,
+    QueryRequest,
+    Range,
+    ScalarQuantization,
+    ScalarQuantizationConfig,
+    ScalarType,
+    SearchParams,
+    SparseVector,
+    SparseVectorParams,
     VectorParams,
+    VectorParamsDiff,
 )
 
 from mcp_server.settings import Settings
 
+log = logging.getLogger(__name__)
+T = TypeVar("T")
+
 VECTOR_SIZE = 384
+SPARSE_VECTOR_NAME = "bm25"
+# Ключ payload, под которым hit несёт dense-вектор при with_vectors=True (для MMR); в ответы tools не попадает.
+VECTOR_PAYLOAD_KEY = "_vector"
+# Поля с числовым индексом (range-фильтр по соседним чанкам); остальные индексируются как keyword.
+_INTEGER_PAYLOAD_FIELDS = {"chunk_index": PayloadSchemaType.INTEGER}
+
+try:
+    from grpc import RpcError
+    CONNECTION_ERRORS: tuple[type[BaseException], ...] = (ResponseHandlingException, ConnectionError, RpcError)
+except ImportError:
+    CONNECTION_ERRORS = (ResponseHandlingException, ConnectionError)
+
+
+class CollectionLost(RuntimeError):
+    """Коллекция, которую процесс уже видел, пропала из Qdrant: индекс потерян."""
+
+
+def _build_filter(filters: dict[str, Any] | None) -> Filter | None:
+    if not filters:
+        return None
+    must = []
+    if filters.get("doc_type"):
+        must.append(FieldCondition(key="doc_type", match=MatchValue(value=filters["doc_type"])))
+    if filters.get("language"):
+        must.append(FieldCondition(key="language", match=MatchValue(value=filters["language"])))
+    return Filter(must=must) if must else None
+
+
+class CollectionProfile:
+    """Декларативный профиль коллекции из настроек qdrant_*: payload-индексы, HNSW, int8-квантизация,
+    on_disk-векторы и параметры поиска (hnsw_ef, rescore)."""
+
+    def __init__(
+        self,
+        *,
+        payload_indexes: list[str],
+        hnsw_m: int,
+        hnsw_ef_construct: int,
+        quantization: str,
+        quantization_always_ram: bool,
+        quantization_rescore: bool,
+        quantization_oversampling: float,
+        on_disk_vectors: bool,
+        hnsw_ef: int,
+    ):
+        self.payload_indexes = payload_indexes
+        self.hnsw_m = hnsw_m
+        self.hnsw_ef_construct = hnsw_ef_construct
+        self.quantization = quantization
+        self.quantization_always_ram = quantization_always_ram
+        self.quantization_rescore = quantization_rescore
+        self.quantization_oversampling = quantization_oversampling
+        self.on_disk_vectors = on_disk_vectors
+        self.hnsw_ef = hnsw_ef
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "CollectionProfile":
+        return cls(
+            payload_indexes=list(settings.qdrant_payload_indexes),
+            hnsw_m=settings.qdrant_hnsw_m,
+            hnsw_ef_construct=settings.qdrant_hnsw_ef_construct,
+            quantization=settings.qdrant_quantization,
+            quantization_always_ram=settings.qdrant_quantization_always_ram,
+            quantization_rescore=settings.qdrant_quantization_rescore,
+            quantization_oversampling=settings.qdrant_quantization_oversampling,
+            on_disk_vectors=settings.qdrant_on_disk_vectors,
+            hnsw_ef=settings.qdrant_hnsw_ef,
+        )
+
+    def hnsw_config(self) -> HnswConfigDiff:
+        return HnswConfigDiff(m=self.hnsw_m, ef_construct=self.hnsw_ef_construct)
+
+    def quantization_config(self) -> ScalarQuantization | None:
+        if self.quantization != "int8":
+            return None
+        return ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, always_ram=self.quantization_always_ram)
+        )
+
+    def search_params(self) -> SearchParams | None:
+        quantization = None
+        if self.quantization == "int8":
+            quantization = QuantizationSearchParams(
+                rescore=self.quantization_rescore,
+                oversampling=self.quantization_oversampling,
+            )
+        if not self.hnsw_ef and quantization is None:
+            return None
+        return SearchParams(hnsw_ef=self.hnsw_ef or None, quantization=quantization)
+
+    def diff(self, config: Any) -> dict[str, Any]:
+        """Аргументы update_collection для расхождений текущего конфига коллекции с профилем."""
+        out: dict[str, Any] = {}
+        hnsw = config.hnsw_config
+        if hnsw.m != self.hnsw_m or hnsw.ef_construct != self.hnsw_ef_construct:
+            out["hnsw_config"] = self.hnsw_config()
+        current_int8 = isinstance(config.quantization_config, ScalarQuantization)
+        if current_int8 != (self.quantization == "int8"):
+            out["quantization_config"] = self.quantization_config() or Disabled.DISABLED
+        elif current_int8 and config.quantization_config.scalar.always_ram != self.quantization_always_ram:
+            out["quantization_config"] = self.quantization_config()
+        vectors = config.params.vectors
+        if isinstance(vectors, VectorParams) and bool(vectors.on_disk) != self.on_disk_vectors:
+            out["vectors_config"] = {"": VectorParamsDiff(on_disk=self.on_disk_vectors)}
+        return out
+
+
+def canonical_point_id(chunk_id: str) -> str:
+    """Id точки в каноническом виде, как его возвращает Qdrant (UUID в нижнем регистре с дефисами)."""
+    try:
+        return str(UUID(str(chunk_id)))
+    except ValueError:
+        return str(chunk_id)
+
+
+def _to_hit(point: Any) -> tuple[str, float, dict[str, Any]]:
+    payload = dict(point.payload or {})
+    vector = point.vector
+    if isinstance(vector, dict):
+        vector = vector.get("")
+    if vector is not None:
+        payload[VECTOR_PAYLOAD_KEY] = vector
+    return str(point.id), float(point.score), payload
+
+
+def _above_threshold(
+    query_vector: list[float],
+    hits: list[tuple[str, float, dict[str, Any]]],
+    threshold: float,
+) -> list[tuple[str, float, dict[str, Any]]]:
+    """Hits, у которых cosine dense-вектора с запросом не ниже порога (вектор — в payload[VECTOR_PAYLOAD_KEY])."""
+    if not hits:
+        return hits
+    q = np.asarray(query_vector, dtype=np.float32)
+    q /= max(float(np.linalg.norm(q)), 1e-12)
+    keep = []
+    for hit in hits:
+        vector = hit[2].get(VECTOR_PAYLOAD_KEY)
+        if vector is None:
+            continue
+        v = np.asarray(vector, dtype=np.float32)
+        if float(v @ q) / max(float(np.linalg.norm(v)), 1e-12) >= threshold:
+            keep.append(hit)
+    return keep
+
+
+def _payload_selector(payload_fields: list[str] | None) -> bool | PayloadSelectorInclude:
+    """None — весь payload, иначе только перечисленные поля."""
+    if payload_fields is None:
+        return True
+    return PayloadSelectorInclude(include=payload_fields)
 
 
 class QdrantStore:
+    """Обёртка над QdrantClient. Кэширует факт существования и конфиг коллекции,
+    при обрыве соединения подменяет клиент и повторяет операцию один раз. Пропавшая коллекция (404) — ошибка:
+    пустую коллекцию молча не создаём, иначе поиск «работает» по пустому индексу."""
+
     def __init__(
         self,
         url: str | None = None,
         collection_name: str | None = None,
         client: QdrantClient | None = None,
+        prefer_grpc: bool | None = None,
     ):
         settings = Settings()
-        self._client = client or QdrantClient(url or settings.qdrant_url)
+        self._url = url or settings.qdrant_url
+        self._prefer_grpc = settings.qdrant_prefer_grpc if prefer_grpc is None else prefer_grpc
+        self._grpc_port = settings.qdrant_grpc_port
+        self._owns_client = client is None
+        self._client = client or self._connect()
+        # Клиент, заменённый последним переподключением: на нём могут ещё идти чужие запросы. Закрывается
+        # при следующем переподключении или в close() — при «мигающем» Qdrant клиенты не копятся.
+        self._retired: QdrantClient | None = None
         self._collection = collection_name or settings.qdrant_collection
+        self._collection_info: Any = None
+        self._collection_seen = False
+        self._hybrid = settings.rag_hybrid_enabled
+        self._profile = CollectionProfile.from_settings(settings)
+        self._search_params = self._profile.search_params()
+        # RLock: ensure_collection держит его и ходит в Qdrant через _call, а тот может переподключиться.
+        self._lock = threading.RLock()
+
+    def _connect(self) -> QdrantClient:
+        return QdrantClient(url=self._url, prefer_grpc=self._prefer_grpc, grpc_port=self._grpc_port)
+
+    def _reconnect(self, failed: QdrantClient) -> None:
+        """Подменить клиент, на котором случилась ошибка. Он не закрывается сразу (на нём могут идти чужие запросы),
+        а закрывается предыдущий заменённый. Если другой поток уже переподключился — ничего не делать."""
+        with self._lock:
+            if not self._owns_client or self._client is not failed:
+                return
+            self._client = self._connect()
+            stale, self._retired = self._retired, failed
+        if stale is not None:
+            try:
+                stale.close()
+            except Exception:
+                pass
+        log.warning("[QDRANT] reconnected url=%s grpc=%s", self._url, self._prefer_grpc)
+
+    def _call(self, fn: Callable[[QdrantClient], T]) -> T:
+        """Выполнить операцию; при сетевой ошибке — переподключиться и повторить один раз."""
+        client = self._client
+        try:
+            return fn(client)
+        except CONNECTION_ERRORS as e:
+            log.warning("[QDRANT] connection error, retrying: %s", e)
+            self._reconnect(client)
+        except UnexpectedResponse as e:
+            if e.status_code == 404:
+                # Следующий ensure_collection перечитает конфиг и сообщит о потерянной коллекции (CollectionLost).
+                self._collection_info = None
+                log.error("[QDRANT] collection %s not found", self._collection)
+            raise
+        return fn(self._client)
+
+    def close(self) -> None:
+        if not self._owns_client:
+            return
+        with self._lock:
+            clients = [c for c in (self._client, self._retired) if c is not None]
+            self._retired = None
+        for client in clients:
+            try:
+                client.close()
+            except Exception:
+                pass
+
+    @property
+    def collection_info(self) -> Any:
+        """Конфиг коллекции (CollectionInfo), кэшируется после первого ensure_collection."""
+        self.ensure_collection()
+        return self._collection_info
 
     def ensure_collection(self) -> None:
-        collections = self._client.get_collections().collections
-        if any(c.name == self._collection for c in collections):
+        """Создать коллекцию, если её нет, и довести до профиля. Коллекция, пропавшая после того, как процесс её видел,
+        заново не создаётся: CollectionLost — иначе поиск молча пойдёт по пустому индексу."""
+        if self._collection_info is not None:
             return
-        self._client.create_collection(
-            collection_name=self._collection,
-            vectors_config=VectorParams(size=VECTOR_SIZE, distance=Distance.COSINE),
-        )
+        with self._lock:
+            if self._collection_info is not None:
+                return
+            profile = self._profile
+            if not self._call(lambda c: c.collection_exists(self._collection)):
+                if self._collection_seen:
+                    log.error("[QDRANT] collection %s was dropped, the index is lost", self._collection)
+                    raise CollectionLost(f"Qdrant collection {self._collection} was dropped")
+                self._call(lambda c: c.create_collection(
+                    collection_name=self._collection,
+                    vectors_config=VectorParams(
+                        size=VECTOR_SIZE, distance=Distance.COSINE, on_disk=profile.on_disk_vectors
+                    ),
+                    sparse_vectors_config=(
+                        {SPARSE_VECTOR_NAME: SparseVectorParams(modifier=Modifier.IDF)} if self._hybrid else None
+                    ),
+                    hnsw_config=profile.hnsw_config(),
+                    quantization_config=profile.quantization_config(),
+                ))
+            info = self._call(lambda c: c.get_collection(self._collection))
+            if self._apply_profile(info):
+                info = self._call(lambda c: c.get_collection(self._collection))
+            self._collection_info = info
+            self._collection_seen = True
+            if self._hybrid and not self.has_sparse:
+                log.warning(
+                    "[QDRANT] collection %s has no sparse vector %r: hybrid search disabled until it is recreated",
+                    self._collection, SPARSE_VECTOR_NAME,
+                )
+
+    def _apply_profile(self, info: Any) -> bool:
+        """Довести коллекцию до профиля: payload-индексы, HNSW, квантизация, on_disk.
+        Возвращает True, если что-то менялось (конфиг нужно перечитать)."""
+        profile = self._profile
+        changed = False
+        existing = set((info.payload_schema or {}).keys())
+        for field in profile.payload_indexes:
+            if field not in existing:
+                self._call(lambda c, field=field: c.create_payload_index(
+                    collection_name=self._collection,
+                    field_name=field,
+                    field_schema=_INTEGER_PAYLOAD_FIELDS.get(field, PayloadSchemaType.KEYWORD),
+                ))
+                log.info("[QDRANT] payload index created collection=%s field=%s", self._collection, field)
+                changed = True
+        diff = profile.diff(info.config)
+        if diff:
+            self._call(lambda c: c.update_collection(collection_name=self._collection, **diff))
+            log.info("[QDRANT] collection %s migrated to profile: %s", self._collection, sorted(diff))
+            changed = True
+        return changed
 
-    def upsert(self, points: list[tuple[str, list[float], dict[str, Any]]]) -> None:
+    @property
+    def has_sparse(self) -> bool:
+        """В коллекции есть именованный sparse-вектор для BM25 (гибридный поиск доступен)."""
+        info = self._collection_info
+        if info is None:
+            return False
+        sparse = info.config.params.sparse_vectors or {}
+        return SPARSE_VECTOR_NAME in sparse
+
+    def upsert(
+        self,
+        points: list[tuple[str, list[float], dict[str, Any]]],
+        sparse_vectors: list[tuple[list[int], list[float]]] | None = None,
+    ) -> None:
         if not points:
             return
         self.ensure_collection()
+        if sparse_vectors is not None and self.has_sparse:
+            vectors: list[Any] = [
+                {"": vector, SPARSE_VECTOR_NAME: SparseVector(indices=idx, values=vals)}
+                for (_, vector, _), (idx, vals) in zip(points, sparse_vectors)
+            ]
+        else:
+            vectors = [vector for _, vector, _ in points]
         structs = [
             PointStruct(
                 id=chunk_id,
-                vector=vector,
+                vector=vec,
                 payload={
                     "doc_id": str(p.get("doc_id", "")),
                     "doc_key": str(p.get("doc_key", "")),
@@ -54,59 +368,266 @@ class QdrantStore:
                     "chunk_id": str(p.get("chunk_id", chunk_id)),
                     "chunk_index": int(p.get("chunk_index", 0)),
                     "section": str(p.get("section", "")),
+                    "overlap": int(p.get("overlap", 0)),
                     "text": str(p.get("text", "")),
+                    "preview": str(p.get("preview", "")),
                 },
             )
-            for chunk_id, vector, p in points
+            for (chunk_id, _, p), vec in zip(points, vectors)
         ]
-        self._client.upsert(collection_name=self._collection, points=structs)
+        self._call(lambda c: c.upsert(collection_name=self._collection, points=structs))
 
     def search(
         self,
         query_vector: list[float],
         k: int = 5,
         filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        score_threshold: float | None = None,
+        with_vectors: bool = False,
     ) -> list[tuple[str, float, dict[str, Any]]]:
         self.ensure_collection()
-        query_filter = None
-        if filters:
-            must = []
-            if filters.get("doc_type"):
-                must.append(FieldCondition(key="doc_type", match=MatchValue(value=filters["doc_type"])))
-            if filters.get("language"):
-                must.append(FieldCondition(key="language", match=MatchValue(value=filters["language"])))
-            if must:
-                query_filter = Filter(must=must)
-        response = self._client.query_points(
+        response = self._call(lambda c: c.query_points(
             collection_name=self._collection,
             query=query_vector,
             limit=k,
-            query_filter=query_filter,
-        )
-        return [(str(p.id), float(p.score), p.payload or {}) for p in response.points]
+            query_filter=_build_filter(filters),
+            with_payload=_payload_selector(payload_fields),
+            search_params=self._search_params,
+            score_threshold=score_threshold,
+            with_vectors=with_vectors,
+        ))
+        return [_to_hit(p) for p in response.points]
+
+    def search_batch(
+        self,
+        query_vectors: list[list[float]],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        score_threshold: float | None = None,
+        with_vectors: bool = False,
+    ) -> list[list[tuple[str, float, dict[str, Any]]]]:
+        """Несколько dense-запросов одним batch-запросом к Qdrant. score_threshold отсекает точки на стороне Qdrant."""
+        self.ensure_collection()
+        query_filter = _build_filter(filters)
+        with_payload = _payload_selector(payload_fields)
+        requests = [
+            QueryRequest(
+                query=qv,
+                filter=query_filter,
+                limit=k,
+                with_payload=with_payload,
+                params=self._search_params,
+                score_threshold=score_threshold,
+                with_vector=with_vectors,
+            )
+            for qv in query_vectors
+        ]
+        responses = self._call(lambda c: c.query_batch_points(collection_name=self._collection, requests=requests))
+        return [[_to_hit(p) for p in r.points] for r in responses]
+
+    def search_hybrid_batch(
+        self,
+        query_vectors: list[list[float]],
+        sparse_queries: list[tuple[list[int], list[float]]],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        score_threshold: float | None = None,
+        with_vectors: bool = False,
+    ) -> list[tuple[list[tuple[str, float, dict[str, Any]]], list[tuple[str, float, dict[str, Any]]]]]:
+        """Dense и sparse (BM25) запросы для каждого query одним batch-запросом к Qdrant.
+        score_threshold — порог cosine: dense-запрос отсекает сам Qdrant, sparse-кандидаты приходят с dense-вектором
+        и отсекаются по cosine с запросом здесь (BM25-оценки с порогом несравнимы).
+        Возвращает [(dense hits, sparse hits)] в порядке запросов."""
+        self.ensure_collection()
+        sparse_vectors = with_vectors or score_threshold is not None
+        query_filter = _build_filter(filters)
+        with_payload = _payload_selector(payload_fields)
+        requests: list[QueryRequest] = []
+        for qv, (indices, values) in zip(query_vectors, sparse_queries):
+            requests.append(QueryRequest(
+                query=qv,
+                filter=query_filter,
+                limit=k,
+                with_payload=with_payload,
+                params=self._search_params,
+                score_threshold=score_threshold,
+                with_vector=with_vectors,
+            ))
+            requests.append(QueryRequest(
+                query=SparseVector(indices=indices, values=values),
+                using=SPARSE_VECTOR_NAME,
+                filter=query_filter,
+                limit=k,
+                with_payload=with_payload,
+                with_vector=[""] if sparse_vectors else False,
+            ))
+        responses = self._call(lambda c: c.query_batch_points(collection_name=self._collection, requests=requests))
+        hits = [[_to_hit(p) for p in r.points] for r in responses]
+        out = []
+        for qv, i in zip(query_vectors, range(0, len(hits), 2)):
+            lexical = hits[i + 1]
+            if score_threshold is not None:
+                lexical = _above_threshold(qv, lexical, score_threshold)
+            if not with_vectors:
+                for _, _, payload in lexical:
+                    payload.pop(VECTOR_PAYLOAD_KEY, None)
+            out.append((hits[i], lexical))
+        return out
+
+    def search_hybrid(
+        self,
+        query_vector: list[float],
+        sparse_query: tuple[list[int], list[float]],
+        k: int = 5,
+        filters: dict[str, Any] | None = None,
+        payload_fields: list[str] | None = None,
+        score_threshold: float | None = None,
+        with_vectors: bool = False,
+    ) -> tuple[list[tuple[str, float, dict[str, Any]]], list[tuple[str, float, dict[str, Any]]]]:
+        """Dense и sparse (BM25) запросы одним batch-запросом к Qdrant. Возвращает (dense hits, sparse hits)."""
+        return self.search_hybrid_batch(
+            [query_vector],
+            [sparse_query],
+            k=k,
+            filters=filters,
+            payload_fields=payload_fields,
+            score_threshold=score_threshold,
+            with_vectors=with_vectors,
+        )[0]
 
     def get_by_id(self, chunk_id: str) -> dict[str, Any] | None:
+        """Payload чанка без вектора."""
+        return self.get_by_ids([chunk_id]).get(chunk_id)
+
+    def get_by_ids(
+        self,
+        chunk_ids: list[str],
+        payload_fields: list[str] | None = None,
+    ) -> dict[str, dict[str, Any]]:
+        """Payload нескольких чанков одним retrieve (векторы не передаются). {chunk_id: payload} по id в том виде,
+        в каком их передали (UUID в любом регистре находится)."""
+        if not chunk_ids:
+            return {}
         self.ensure_collection()
-        points = self._client.retrieve(
+        wanted = {str(cid): canonical_point_id(cid) for cid in chunk_ids}
+        points = self._call(lambda c: c.retrieve(
             collection_name=self._collection,
-            ids=[chunk_id],
-            with_payload=True,
-            with_vectors=True,
-        )
-        if not points:
-            return None
-        p = points[0]
-        out = dict(p.payload or {})
-        out["vector"] = p.vector if p.vector else []
-        return out
+            ids=list(dict.fromkeys(wanted.values())),
+            with_payload=_payload_selector(payload_fields),
+            with_vectors=False,
+        ))
+        found = {str(p.id): dict(p.payload or {}) for p in points}
+        return {cid: found[key] for cid, key in wanted.items() if key in found}
+
+    def get_chunk_ranges(
+        self,
+        ranges: list[tuple[str, int, int]],
+        payload_fields: list[str] | None = None,
+    ) -> list[dict[str, Any]]:
+        """Чанки с chunk_index в [lo, hi] по каждому (doc_id, lo, hi) одним scroll с фильтром should."""
+        if not ranges:
+            return []
+        self.ensure_collection()
+        scroll_filter = Filter(should=[
+            Filter(must=[
+                FieldCondition(key="doc_id", match=MatchValue(value=str(doc_id))),
+                FieldCondition(key="chunk_index", range=Range(gte=lo, lte=hi)),
+            ])
+            for doc_id, lo, hi in ranges
+        ])
+        limit = sum(hi - lo + 1 for _, lo, hi in ranges)
+        out: list[dict[str, Any]] = []
+        offset: Any = None
+        while True:
+            points, offset = self._call(lambda c: c.scroll(
+                collection_name=self._collection,
+                scroll_filter=scroll_filter,
+                limit=limit,
+                offset=offset,
+                with_payload=_payload_selector(payload_fields),
+                with_vectors=False,
+            ))
+            out.extend(dict(p.payload or {}) for p in points)
+            if offset is None:
+                return out
+
+    @property
+    def collection_name(self) -> str:
+        return self._collection
+
+    def count(self) -> int:
+        """Точное число точек в коллекции."""
+        self.ensure_collection()
+        return self._call(lambda c: c.count(collection_name=self._collection, exact=True)).count
+
+    def iter_points(self, batch_size: int = 256) -> Iterator[list[tuple[str, list[float], dict[str, Any]]]]:
+        """Все точки коллекции (dense-вектор + payload) пачками scroll — для заполнения локальной копии."""
+        self.ensure_collection()
+        offset: Any = None
+        while True:
+            points, offset = self._call(lambda c: c.scroll(
+                collection_name=self._collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=[""] if self.has_sparse else True,
+            ))
+            batch = []
+            for p in points:
+                vector = p.vector.get("") if isinstance(p.vector, dict) else p.vector
+                if vector is not None:
+                    batch.append((str(p.id), list(vector), dict(p.payload or {})))
+            if batch:
+                yield batch
+            if offset is None:
+                return
+
+    def flush(self) -> None:
+        """Qdrant пишет сразу; метод для единообразия с LocalVectorStore."""
 
     def delete_by_doc_id(self, doc_id: str) -> None:
         doc_id_str = str(doc_id)
-        self._client.delete(
+        self._call(lambda c: c.delete(
             collection_name=self._collection,
             points_selector=FilterSelector(
                 filter=Filter(
                     must=[FieldCondition(key="doc_id", match=MatchValue(value=doc_id_str))],
                 )
             ),
-        )
+        ))
+
+    def delete_by_ids(self, chunk_ids: list[str]) -> None:
+        """Удалить точки по id (чанки, исчезнувшие из документа при обновлении)."""
+        if not chunk_ids:
+            return
+        ids = [str(cid) for cid in chunk_ids]
+        self._call(lambda c: c.delete(
+            collection_name=self._collection,
+            points_selector=PointIdsList(points=ids),
+        ))
+
+
+_store: QdrantStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_qdrant_store() -> QdrantStore:
+    """Singleton QdrantStore процесса (один клиент и кэш коллекции на все tool-вызовы)."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = QdrantStore()
+    return _store
+
+
+def close_store() -> None:
+    """Закрыть общий store (для тестов или shutdown)."""
+    global _store
+    with _store_lock:
+        if _store is not None:
+            _store.close()
+            _store = None
@@ -1,4 +1,6 @@
 """Настройки mcp_server: RAG (эмбеддинги, чанки), datastore."""
+from typing import Literal
+
 from settings import BaseAppSettings
 
 
@@ -6,9 +8,86 @@ class Settings(BaseAppSettings):
     """MCP-server-специфичные поля поверх базовых (database_url, qdrant_* из settings)."""
 
     audit_service_url: str = ""
+    qdrant_prefer_grpc: bool = False
+    qdrant_grpc_port: int = 6334
+    # Профиль коллекции: применяется при создании, существующая коллекция мигрируется при расхождении.
+    qdrant_payload_indexes: list[str] = ["doc_id", "doc_key", "doc_type", "language", "chunk_index"]
+    qdrant_hnsw_m: int = 16
+    qdrant_hnsw_ef_construct: int = 100
+    qdrant_hnsw_ef: int = 0
+    qdrant_quantization: Literal["none", "int8"] = "none"
+    qdrant_quantization_always_ram: bool = True
+    qdrant_quantization_rescore: bool = True
+    qdrant_quantization_oversampling: float = 2.0
+    qdrant_on_disk_vectors: bool = False
     datastore_url: str = ""
     rag_embedding_model: str = ""
+    rag_embedding_backend: Literal["torch", "onnx", "onnx_int8"] = "torch"
+    rag_onnx_quantization: str = "avx512_vnni"
+    rag_onnx_cache_dir: str = "/app/.cache/onnx"
     rag_chunk_size: int = 512
     rag_chunk_overlap: int = 64
+    # structured: чанки по заголовкам/абзацам/предложениям, размер в токенах токенизатора модели эмбеддингов
+    # (0 — max_seq_length модели); chars — окна по rag_chunk_size символов.
+    rag_chunker: Literal["chars", "structured"] = "chars"
+    rag_chunk_max_tokens: int = 0
+    rag_chunk_min_tokens: int = 48
+    rag_chunk_overlap_tokens: int = 0
     rag_default_k: int = 5
     rag_relevance_threshold: float = 0.3
+    # Adaptive k: доли от score top-1 (0 — проверка выключена).
+    rag_adaptive_k_enabled: bool = True
+    rag_adaptive_k_min: int = 1
+    rag_adaptive_k_min_ratio: float = 0.5
+    rag_adaptive_k_max_gap: float = 0.25
+    rag_vector_store: Literal["qdrant", "local"] = "qdrant"
+    rag_local_store_path: str = "/app/data/vector_store"
+    rag_local_store_fallback: bool = False
+    rag_hybrid_enabled: bool = True
+    rag_hybrid_candidates: int = 20
+    rag_rrf_k: int = 60
+    rag_bm25_k1: float = 1.2
+    rag_bm25_b: float = 0.75
+    rag_bm25_avg_doc_tokens: float = 90.0
+    # MMR: разнообразие top-k (lambda=1 — чистая релевантность), не больше per_doc_cap чанков на документ (0 — без лимита).
+    rag_mmr_enabled: bool = False
+    rag_mmr_lambda: float = 0.7
+    rag_mmr_overfetch: int = 3
+    rag_mmr_per_doc_cap: int = 2
+    # Расширение hits соседними чанками (kb_search expand=N): общий бюджет символов склеенных фрагментов.
+    rag_expand_max_chars: int = 6000
+    rag_rerank_enabled: bool = False
+    rag_rerank_model: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"
+    rag_rerank_overfetch: int = 4
+    rag_rerank_budget_ms: float = 150.0
+    rag_rerank_batch_size: int = 8
+    rag_rerank_cache_size: int = 4096
+    rag_query_cache_size: int = 1024
+    rag_chunk_cache_size: int = 2048
+    rag_result_cache_enabled: bool = True
+    rag_result_cache_size: int = 512
+    rag_result_cache_threshold: float = 0.95
+    rag_result_cache_ttl_s: float = 600.0
+    rag_query_cache_ttl_s: float = 3600.0
+    rag_embed_batching: bool = True
+    rag_embed_batch_max_size: int = 32
+    rag_embed_batch_max_wait_ms: float = 5.0
+    rag_embed_torch_threads: int = 0
+    rag_ingest_incremental: bool = True
+    rag_loader_page_size: int = 100
+    rag_loader_timeout_s: float = 60.0
+    # Процессы пула эмбеддингов ingest (0 — все ядра; каждый процесс грузит свою копию модели).
+    rag_ingest_workers: int = 1
+    rag_ingest_doc_batch: int = 64
+    rag_ingest_embed_batch: int = 256
+    rag_ingest_encode_batch_size: int = 64
+    # Персистентный кэш эмбеддингов чанков в Postgres (sha256 текста + модель), LRU-обрезка после ingest.
+    rag_embedding_cache_enabled: bool = True
+    rag_embedding_cache_max_rows: int = 1_000_000
+    # Конвейер ingest: потоки стадий и размер очередей между ними (в окнах документов).
+    rag_ingest_prepare_workers: int = 2
+    rag_ingest_embed_workers: int = 1
+    rag_ingest_write_workers: int = 2
+    rag_ingest_queue_size: int = 4
+    # Фоновые задачи kb_ingest: сколько завершённых задач хранить для kb_ingest_status.
+    rag_ingest_jobs_keep: int = 50
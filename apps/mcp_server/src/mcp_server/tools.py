@@ -1,4 +1,4 @@
-"""Четыре MCP-инструмента: kb_search, kb_get_chunk, sql_read, kb_ingest."""
+"""MCP-инструменты: kb_search, kb_search_batch, kb_get_chunk, kb_get_chunks, sql_read, kb_ingest, kb_ingest_status, kb_ingest_cancel."""
 import logging
 import re
 import time
@@ -10,17 +10,22 @@ from uuid import UUID
 from audit import audit_event, audited_span
 from db.connection import get_pool
 from db.queries import execute_readonly_sql, get_sql_allowlist
-from mcp_server.rag.formats import truncate_preview
-from mcp_server.rag.ingest.indexer import run_ingestion
-from mcp_server.rag.retrieve import retrieve
-from mcp_server.rag.store.qdrant_store import QdrantStore
+from mcp_server.rag.chunk_cache import get_chunks
+from mcp_server.rag.expand import expand_hits
+from mcp_server.rag.ingest.jobs import IngestJob, get_ingest_jobs
+from mcp_server.rag.retrieve import retrieve_batch_with_meta, retrieve_with_meta
+from mcp_server.rag.store.factory import get_store
 from mcp_server.app import mcp
 from mcp_server.audit import log_tool_call as audit_log
 from mcp_server.policy import (
     PolicyError,
     SQL_MAX_ROWS,
+    validate_chunk_ids,
+    validate_expand,
     validate_filters,
+    validate_job_id,
     validate_k,
+    validate_queries,
     validate_query,
     validate_sql,
 )
@@ -54,41 +59,50 @@ def _serialize_cell(x: Any) -> Any:
     return str(x)
 
 
+def _chunk_preview(cid: str, score: float, meta: dict[str, Any]) -> dict[str, Any]:
+    return {
+        "id": cid,
+        "score": round(score, 4),
+        "doc_meta": {
+            "doc_id": meta.get("doc_id"),
+            "doc_key": meta.get("doc_key"),
+            "title": meta.get("title"),
+            "doc_type": meta.get("doc_type"),
+        },
+        "preview": meta.get("preview", ""),
+    }
+
+
 @mcp.tool()
 @audited_span("kb_search", kind="tool.call", attrs={"tool_name": "kb_search"})
 def kb_search(
     query: str,
     k: int = 5,
     filters: dict[str, Any] | None = None,
+    expand: int = 0,
     run_id: str | None = None,
 ) -> dict[str, Any]:
-    log.info("[MCP] kb_search query=%r k=%s", query[:80] + "..." if len(query) > 80 else query, k)
+    """expand=N (1..3): дополнительно passages — найденные чанки с соседями ±N того же документа,
+    склеенные в сплошной текст (вместо отдельных вызовов kb_get_chunk по соседям)."""
+    log.info("[MCP] kb_search query=%r k=%s expand=%s", query[:80] + "..." if len(query) > 80 else query, k, expand)
     start = time.perf_counter()
-    args = {"query": query, "k": k, "filters": filters}
+    args = {"query": query, "k": k, "filters": filters, "expand": expand}
     result_meta: dict[str, Any] = {}
     try:
         validate_query(query)
         validate_k(k)
+        validate_expand(expand)
         safe_filters = validate_filters(filters)
-        chunks_raw = retrieve(query.strip(), k=k, filters=safe_filters or None)
-        previews = [
-            {
-                "id": cid,
-                "score": round(score, 4),
-                "doc_meta": {
-                    "doc_id": meta.get("doc_id"),
-                    "doc_key": meta.get("doc_key"),
-                    "title": meta.get("title"),
-                    "doc_type": meta.get("doc_type"),
-                },
-                "preview": truncate_preview(meta.get("text", ""), 300),
-            }
-            for cid, score, meta in chunks_raw
-        ]
-        result_meta = {"chunk_count": len(previews)}
+        chunks_raw, search_meta = retrieve_with_meta(query.strip(), k=k, filters=safe_filters or None)
+        previews = [_chunk_preview(cid, score, meta) for cid, score, meta in chunks_raw]
+        result: dict[str, Any] = {"chunks": previews, "meta": search_meta}
+        result_meta = {"chunk_count": len(previews), "cutoff_reason": search_meta["cutoff_reason"]}
+        if expand:
+            result["passages"] = expand_hits(get_store(), chunks_raw, expand)
+            result_meta["passage_count"] = len(result["passages"])
         duration_ms = int((time.perf_counter() - start) * 1000)
         audit_log("kb_search", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
-        return {"chunks": previews}
+        return result
     except PolicyError as e:
         duration_ms = int((time.perf_counter() - start) * 1000)
         audit_log("kb_search", args=args, result_meta=result_meta, status="blocked", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
@@ -100,6 +114,50 @@ def kb_search(
         raise
 
 
+@mcp.tool()
+@audited_span("kb_search_batch", kind="tool.call", attrs={"tool_name": "kb_search_batch"})
+def kb_search_batch(
+    queries: list[str],
+    k: int = 5,
+    filters: dict[str, Any] | None = None,
+    run_id: str | None = None,
+) -> dict[str, Any]:
+    """Несколько переформулировок за один вызов. Чанк, найденный несколькими запросами,
+    возвращается один раз — в запросе с лучшим score; в остальных он указан в duplicate_ids."""
+    log.info("[MCP] kb_search_batch queries=%d k=%s", len(queries) if isinstance(queries, list) else 0, k)
+    start = time.perf_counter()
+    args = {"queries": queries, "k": k, "filters": filters}
+    result_meta: dict[str, Any] = {}
+    try:
+        validate_queries(queries)
+        validate_k(k)
+        safe_filters = validate_filters(filters)
+        per_query, metas = retrieve_batch_with_meta([q.strip() for q in queries], k=k, filters=safe_filters or None)
+        best: dict[str, tuple[float, int]] = {}
+        for qi, hits in enumerate(per_query):
+            for cid, score, _ in hits:
+                if cid not in best or score > best[cid][0]:
+                    best[cid] = (score, qi)
+        results = []
+        for qi, (query, hits, search_meta) in enumerate(zip(queries, per_query, metas)):
+            chunks = [_chunk_preview(cid, score, meta) for cid, score, meta in hits if best[cid][1] == qi]
+            duplicate_ids = [cid for cid, _, _ in hits if best[cid][1] != qi]
+            results.append({"query": query, "chunks": chunks, "duplicate_ids": duplicate_ids, "meta": search_meta})
+        result_meta = {"query_count": len(queries), "chunk_count": len(best)}
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_search_batch", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
+        return {"results": results, "unique_chunk_count": len(best)}
+    except PolicyError as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_search_batch", args=args, result_meta=result_meta, status="blocked", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+    except Exception as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        log.exception("[MCP] kb_search_batch error: %s", e)
+        audit_log("kb_search_batch", args=args, result_meta=result_meta, status="error", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+
+
 @mcp.tool()
 @audited_span("kb_get_chunk", kind="tool.call", attrs={"tool_name": "kb_get_chunk"})
 def kb_get_chunk(chunk_id: str, run_id: str | None = None) -> dict[str, Any]:
@@ -111,14 +169,12 @@ def kb_get_chunk(chunk_id: str, run_id: str | None = None) -> dict[str, Any]:
         if not chunk_id or not isinstance(chunk_id, str) or not chunk_id.strip():
             audit_event("policy.blocked", reason="chunk_id is required and must be non-empty string", validator="kb_get_chunk")
             raise PolicyError("chunk_id is required and must be non-empty string")
-        store = QdrantStore()
-        data = store.get_by_id(chunk_id.strip())
+        data = get_chunks(get_store(), [chunk_id.strip()]).get(chunk_id.strip())
         if data is None:
             result_meta = {"found": False}
             duration_ms = int((time.perf_counter() - start) * 1000)
             audit_log("kb_get_chunk", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
             return {"chunk_id": chunk_id, "text": "", "meta": {}, "found": False}
-        data.pop("vector", None)
         text = data.get("text", "")
         result_meta = {"found": True, "text_len": len(text)}
         duration_ms = int((time.perf_counter() - start) * 1000)
@@ -135,6 +191,43 @@ def kb_get_chunk(chunk_id: str, run_id: str | None = None) -> dict[str, Any]:
         raise
 
 
+@mcp.tool()
+@audited_span("kb_get_chunks", kind="tool.call", attrs={"tool_name": "kb_get_chunks"})
+def kb_get_chunks(chunk_ids: list[str], run_id: str | None = None) -> dict[str, Any]:
+    """Полный текст нескольких чанков за один вызов (один retrieve в Qdrant на промахи кэша)."""
+    log.info("[MCP] kb_get_chunks count=%s", len(chunk_ids) if isinstance(chunk_ids, list) else 0)
+    start = time.perf_counter()
+    args = {"chunk_ids": chunk_ids}
+    result_meta: dict[str, Any] = {}
+    try:
+        validate_chunk_ids(chunk_ids)
+        ids = [cid.strip() for cid in chunk_ids]
+        found = get_chunks(get_store(), ids)
+        chunks = [
+            {"chunk_id": cid, "text": found[cid].get("text", ""), "meta": found[cid], "found": True}
+            if cid in found
+            else {"chunk_id": cid, "text": "", "meta": {}, "found": False}
+            for cid in ids
+        ]
+        result_meta = {
+            "requested": len(ids),
+            "found": sum(1 for c in chunks if c["found"]),
+            "text_len": sum(len(c["text"]) for c in chunks),
+        }
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_get_chunks", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
+        return {"chunks": chunks}
+    except PolicyError as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_get_chunks", args=args, result_meta=result_meta, status="blocked", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+    except Exception as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        log.exception("[MCP] kb_get_chunks error: %s", e)
+        audit_log("kb_get_chunks", args=args, result_meta=result_meta, status="error", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+
+
 @mcp.tool()
 @audited_span("sql_read", kind="tool.call", attrs={"tool_name": "sql_read"})
 def sql_read(query: str, run_id: str | None = None) -> dict[str, Any]:
@@ -164,21 +257,102 @@ def sql_read(query: str, run_id: str | None = None) -> dict[str, Any]:
         raise
 
 
+def _audit_ingest_job(job: IngestJob) -> None:
+    """Итог фоновой задачи ingest (вызов kb_ingest к этому моменту давно завершён)."""
+    duration_ms = int(((job.finished_at or 0) - (job.started_at or job.created_at)) * 1000)
+    counts = {k: v for k, v in (job.result or job.progress.snapshot()).items() if isinstance(v, (int, float))}
+    audit_event(
+        "rag.ingest_job",
+        severity="error" if job.status == "failed" else "info",
+        job_id=job.job_id,
+        status=job.status,
+        full=job.full,
+        duration_ms=duration_ms,
+        error_message=job.error,
+        run_id=job.run_id,
+        **counts,
+    )
+
+
+get_ingest_jobs().on_finish(_audit_ingest_job)
+
+
 @mcp.tool()
 @audited_span("kb_ingest", kind="tool.call", attrs={"tool_name": "kb_ingest"})
-def kb_ingest(run_id: str | None = None) -> dict[str, Any]:
-    log.info("[MCP] kb_ingest start")
+def kb_ingest(full: bool = False, run_id: str | None = None) -> dict[str, Any]:
+    """Поставить индексацию в фон: изменения datastore; full=True — весь корпус. Возвращает задачу (job_id, status)
+    сразу; прогресс — kb_ingest_status, отмена — kb_ingest_cancel. Если такая задача уже ждёт в очереди, возвращается она."""
+    log.info("[MCP] kb_ingest submit full=%s", full)
     start = time.perf_counter()
-    args: dict[str, Any] = {}
+    args: dict[str, Any] = {"full": full}
     result_meta: dict[str, Any] = {}
     try:
-        result = run_ingestion()
-        result_meta = result
+        job, created = get_ingest_jobs().submit(full=full, run_id=run_id)
+        result_meta = {"job_id": job.job_id, "created": created, "status": job.status}
         duration_ms = int((time.perf_counter() - start) * 1000)
         audit_log("kb_ingest", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
-        return result
+        return job.as_dict()
     except Exception as e:
         duration_ms = int((time.perf_counter() - start) * 1000)
         log.exception("[MCP] kb_ingest error: %s", e)
         audit_log("kb_ingest", args=args, result_meta=result_meta, status="error", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
         raise
+
+
+@mcp.tool()
+@audited_span("kb_ingest_status", kind="tool.call", attrs={"tool_name": "kb_ingest_status"})
+def kb_ingest_status(job_id: str | None = None, run_id: str | None = None) -> dict[str, Any]:
+    """Статус задачи ingest: status, progress (docs_seen, chunks_embedded, chunks_indexed, ...), result по завершении.
+    Без job_id — последняя задача."""
+    start = time.perf_counter()
+    args: dict[str, Any] = {"job_id": job_id}
+    result_meta: dict[str, Any] = {}
+    try:
+        if job_id is not None:
+            validate_job_id(job_id)
+            job_id = job_id.strip()
+        job = get_ingest_jobs().get(job_id)
+        result_meta = {"found": job is not None, "status": job.status if job is not None else None}
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_ingest_status", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
+        if job is None:
+            return {"job_id": job_id, "status": "not_found"}
+        return job.as_dict()
+    except PolicyError as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_ingest_status", args=args, result_meta=result_meta, status="blocked", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+    except Exception as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        log.exception("[MCP] kb_ingest_status error: %s", e)
+        audit_log("kb_ingest_status", args=args, result_meta=result_meta, status="error", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+
+
+@mcp.tool()
+@audited_span("kb_ingest_cancel", kind="tool.call", attrs={"tool_name": "kb_ingest_cancel"})
+def kb_ingest_cancel(job_id: str, run_id: str | None = None) -> dict[str, Any]:
+    """Отменить задачу ingest: ждущая снимается сразу, выполняющаяся перестаёт читать ленту и дописывает начатые окна
+    (статус cancelled — по завершении, см. kb_ingest_status). Завершённая задача не меняется."""
+    log.info("[MCP] kb_ingest_cancel job_id=%s", job_id)
+    start = time.perf_counter()
+    args: dict[str, Any] = {"job_id": job_id}
+    result_meta: dict[str, Any] = {}
+    try:
+        validate_job_id(job_id)
+        job = get_ingest_jobs().cancel(job_id.strip())
+        result_meta = {"found": job is not None, "status": job.status if job is not None else None}
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_ingest_cancel", args=args, result_meta=result_meta, status="ok", duration_ms=duration_ms, run_id=run_id)
+        if job is None:
+            return {"job_id": job_id, "status": "not_found"}
+        return {**job.as_dict(), "cancel_requested": job.cancel_event.is_set()}
+    except PolicyError as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        audit_log("kb_ingest_cancel", args=args, result_meta=result_meta, status="blocked", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
+    except Exception as e:
+        duration_ms = int((time.perf_counter() - start) * 1000)
+        log.exception("[MCP] kb_ingest_cancel error: %s", e)
+        audit_log("kb_ingest_cancel", args=args, result_meta=result_meta, status="error", error_message=str(e), duration_ms=duration_ms, run_id=run_id)
+        raise
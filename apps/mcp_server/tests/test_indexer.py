@@ -0,0 +1,85 @@
+"""Индексатор: запись изменённого документа, чанки которого записаны до детерминированных chunk_id."""
+from uuid import UUID, uuid4
+
+from mcp_server.rag.ingest import indexer
+from mcp_server.rag.ingest.chunker import iter_document_chunks
+from mcp_server.rag.ingest.embedding_cache import text_sha256
+
+
+class _Store:
+    def __init__(self) -> None:
+        self.upserted: list[str] = []
+        self.deleted: list[str] = []
+
+    def upsert(self, points, sparse_vectors=None) -> None:
+        self.upserted.extend(p[0] for p in points)
+
+    def delete_by_ids(self, ids) -> None:
+        self.deleted.extend(ids)
+
+
+def _legacy_plan(doc: dict, chunk_size: int) -> tuple[dict, dict[int, UUID]]:
+    """План обновлённого документа: в Postgres чанки 0..4 со случайными chunk_id; 0 и 3 не изменились, 1 и 2
+    изменились, 4 исчез (в новой версии документа четыре чанка)."""
+    recs = list(iter_document_chunks(doc, chunk_size=chunk_size, overlap=0))
+    assert len(recs) == 4
+    legacy = {i: uuid4() for i in range(5)}
+    existing = {i: (text_sha256(r.text), r.section, legacy[i]) for i, r in enumerate(recs)}
+    existing[1] = ("old", recs[1].section, legacy[1])
+    existing[2] = ("old", recs[2].section, legacy[2])
+    existing[4] = ("gone", "", legacy[4])
+    doc_id = uuid4()
+    plan = {
+        "base": {"doc_id": str(doc_id), "doc_key": "legacy.md", "title": "", "doc_type": "general", "language": "ru"},
+        "sha256": "new",
+        "is_new": False,
+        "doc": doc,
+        "existing": existing,
+    }
+    return plan, legacy
+
+
+def test_write_batch_deletes_legacy_chunks_by_stored_id(monkeypatch):
+    doc = {"doc_id": "legacy.md", "path": "legacy.md", "content": "Первый абзац текста. " * 20 + "\n\n" + "Второй абзац. " * 20}
+    plan, legacy = _legacy_plan(doc, chunk_size=200)
+    calls: dict = {}
+
+    def write_documents(conn, *, documents, changed, stale_chunk_ids=None):
+        calls["stale"] = list(stale_chunk_ids or [])
+        return {d[1]: (d[0], False) for d in documents}
+
+    monkeypatch.setattr(indexer, "write_documents", write_documents)
+    monkeypatch.setattr(indexer, "delete_chunks_by_doc_ids", lambda conn, ids: [])
+    monkeypatch.setattr(indexer, "copy_chunks", lambda conn, rows: calls.setdefault("rows", rows))
+    store = _Store()
+
+    [parts] = list(indexer._iter_batches([plan], 200, 0, 100))
+    written = indexer._write_batch(None, parts, [[0.0] * 4] * 2, store)
+
+    assert written == 2
+    assert sorted(calls["stale"]) == sorted([legacy[1], legacy[2], legacy[4]])
+    doc_id = UUID(plan["base"]["doc_id"])
+    assert [r[2] for r in calls["rows"]] == [1, 2]
+    assert [r[0] for r in calls["rows"]] == [indexer.make_chunk_uuid(doc_id, i) for i in (1, 2)]
+    # Старые точки store удаляются после upsert новых; неизменённые чанки не трогаются.
+    assert sorted(store.deleted) == sorted([str(legacy[1]), str(legacy[2]), str(legacy[4])])
+    assert {str(legacy[0]), str(legacy[3])}.isdisjoint(store.upserted + store.deleted)
+
+
+def test_finalize_deletes_removed_legacy_chunks(monkeypatch):
+    doc = {"doc_id": "legacy.md", "path": "legacy.md", "content": "Первый абзац текста. " * 20 + "\n\n" + "Второй абзац. " * 20}
+    plan, legacy = _legacy_plan(doc, chunk_size=200)
+    calls: dict = {}
+    monkeypatch.setattr(
+        indexer, "write_documents",
+        lambda conn, *, documents, changed, stale_chunk_ids=None: calls.update(changed=changed, stale=stale_chunk_ids),
+    )
+    store = _Store()
+
+    batches = list(indexer._iter_batches([plan], 200, 0, 1))
+    last = batches[-1][-1]
+    assert last["last"] and not indexer._complete(last)
+    indexer._finalize_document(None, last, store)
+
+    assert calls["stale"] == [legacy[4]]
+    assert store.deleted == [str(legacy[4])]
@@ -0,0 +1,40 @@
+"""Конвейер ingest: соединения берутся на элемент, а не на весь срок жизни потока стадии."""
+import contextlib
+import threading
+
+import pytest
+
+from mcp_server.rag.ingest.pipeline import Pipeline
+
+
+def _pool(size: int):
+    """Пул из size соединений; пустой пул дольше секунды — ошибка (вместо зависания теста)."""
+    slots = threading.BoundedSemaphore(size)
+
+    @contextlib.contextmanager
+    def connection():
+        if not slots.acquire(timeout=1.0):
+            raise TimeoutError("pool exhausted")
+        try:
+            yield object()
+        finally:
+            slots.release()
+
+    return connection
+
+
+def test_stages_share_a_single_connection_pool():
+    connection = _pool(1)
+    out: list[int] = []
+    pipeline = (
+        Pipeline(queue_size=1)
+        .stage("double", lambda conn, x: x * 2, workers=2, resource=connection)
+        .stage("collect", lambda conn, x: out.append(x), workers=2, resource=connection)
+    )
+    pipeline.run(range(20))
+    assert sorted(out) == [x * 2 for x in range(20)]
+
+
+def test_fanout_stage_rejects_per_item_resource():
+    with pytest.raises(ValueError):
+        Pipeline().stage("prepare", lambda conn, x: iter([x]), resource=_pool(1), fanout=True)
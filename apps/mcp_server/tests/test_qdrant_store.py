@@ -0,0 +1,67 @@
+"""QdrantStore: переподключение не копит клиентов, пропавшая коллекция — ошибка, а не пустой индекс."""
+from types import SimpleNamespace
+
+import pytest
+
+from mcp_server.rag.store import qdrant_store
+from mcp_server.rag.store.qdrant_store import CollectionLost, QdrantStore
+
+
+class _Client:
+    def __init__(self) -> None:
+        self.closed = False
+        self.exists = True
+        self.down = False
+
+    def close(self) -> None:
+        self.closed = True
+
+    def collection_exists(self, name):
+        if self.down:
+            raise ConnectionError("qdrant is down")
+        return self.exists
+
+    def get_collection(self, name):
+        params = SimpleNamespace(sparse_vectors={qdrant_store.SPARSE_VECTOR_NAME: object()})
+        return SimpleNamespace(payload_schema={}, config=SimpleNamespace(params=params))
+
+
+@pytest.fixture
+def store(monkeypatch):
+    clients: list[_Client] = []
+
+    def connect(self):
+        clients.append(_Client())
+        return clients[-1]
+
+    monkeypatch.setattr(QdrantStore, "_connect", connect)
+    monkeypatch.setattr(QdrantStore, "_apply_profile", lambda self, info: False)
+    return QdrantStore(collection_name="kb"), clients
+
+
+def test_reconnects_keep_at_most_one_retired_client(store):
+    s, clients = store
+    for _ in range(5):
+        s._reconnect(s._client)
+    assert len(clients) == 6
+    assert all(c.closed for c in clients[:4])
+    assert not clients[4].closed and not clients[5].closed
+    s.close()
+    assert all(c.closed for c in clients)
+
+
+def test_ensure_collection_reconnects_on_connection_error(store):
+    s, clients = store
+    clients[0].down = True
+    s.ensure_collection()
+    assert len(clients) == 2
+    assert s.collection_info is not None
+
+
+def test_dropped_collection_is_not_recreated(store):
+    s, clients = store
+    s.ensure_collection()
+    s._collection_info = None  # так его сбрасывает 404 в _call
+    clients[-1].exists = False
+    with pytest.raises(CollectionLost):
+        s.ensure_collection()
@@ -0,0 +1,42 @@
+"""Rerank: бюджет времени — жёсткий, медленный батч не задерживает ответ."""
+import time
+
+import numpy as np
+import pytest
+
+from mcp_server.rag import rerank as rr
+
+
+class _Model:
+    def __init__(self, delay_s: float) -> None:
+        self.delay_s = delay_s
+
+    def predict(self, pairs, show_progress_bar=False):
+        time.sleep(self.delay_s)
+        return np.array([float(len(text)) for _, text in pairs])
+
+
+def _hits() -> list[rr.Hit]:
+    return [(f"c{i}", 1.0 - i / 10, {"text": "x" * (i + 1)}) for i in range(4)]
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(rr, "_batch_s", 0.0)
+    monkeypatch.setattr(rr, "_score_cache", rr.LRUCache(64))
+
+
+def test_fast_model_reranks(monkeypatch):
+    monkeypatch.setattr(rr, "get_reranker", lambda: _Model(0.0))
+    hits, meta = rr.rerank("запрос", _hits(), 2, budget_ms=1000)
+    assert meta["reranked"]
+    assert [cid for cid, _, _ in hits] == ["c3", "c2"]
+
+
+def test_slow_batch_is_cut_at_budget(monkeypatch):
+    monkeypatch.setattr(rr, "get_reranker", lambda: _Model(0.5))
+    t0 = time.perf_counter()
+    hits, meta = rr.rerank("запрос", _hits(), 2, budget_ms=50)
+    assert time.perf_counter() - t0 < 0.3
+    assert meta["fallback"] == "budget_exceeded"
+    assert [cid for cid, _, _ in hits] == ["c0", "c1"]
@@ -0,0 +1,30 @@
+"""Кэш результатов: результат поиска, во время которого сменилась версия KB, не сохраняется."""
+from mcp_server.rag import result_cache
+from mcp_server.rag.kb_version import bump_kb_version
+from mcp_server.rag.result_cache import SemanticResultCache, make_key
+
+_ENTRY = ([("c1", 0.9, {})], {"cutoff_reason": "k", "candidates": 1})
+
+
+def test_put_after_version_bump_is_dropped():
+    cache = SemanticResultCache(8, 0.9)
+    key = make_key(None, 5, "как настроить пул")
+    version = cache.version()
+    bump_kb_version()  # ingest завершился, пока шёл поиск
+    cache.put(key, [1.0, 0.0], _ENTRY, version)
+    assert cache.get(key, [1.0, 0.0]) is None
+
+    cache.put(key, [1.0, 0.0], _ENTRY, cache.version())
+    assert cache.get(key, [1.0, 0.0]) == _ENTRY
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(result_cache.time, "monotonic", lambda: now[0])
+    cache = SemanticResultCache(8, 0.9, ttl_s=60.0)
+    key = make_key(None, 5, "как настроить пул")
+    cache.put(key, [1.0, 0.0], _ENTRY, cache.version())
+    now[0] += 30
+    assert cache.get(key, [1.0, 0.0]) == _ENTRY
+    now[0] += 31
+    assert cache.get(key, [1.0, 0.0]) is None
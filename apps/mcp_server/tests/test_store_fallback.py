@@ -0,0 +1,67 @@
+"""Fallback чтения на локальный store, когда Qdrant пропадает после успешных запросов."""
+import pytest
+
+from mcp_server.rag.store import factory
+from mcp_server.rag.store.local_store import LocalVectorStore
+from mcp_server.rag.store.qdrant_store import VECTOR_SIZE
+
+_LOCAL_ID = "00000000-0000-0000-0000-000000000001"
+
+
+class _FlakyQdrant:
+    """ensure_collection закэширован и сеть не трогает — как у QdrantStore после первого вызова."""
+
+    collection_name = "kb"
+    has_sparse = True
+
+    def __init__(self) -> None:
+        self.up = True
+
+    def ensure_collection(self) -> None:
+        pass
+
+    def _check(self) -> None:
+        if not self.up:
+            raise ConnectionError("qdrant is down")
+
+    def search(self, query_vector, k=5, **kwargs):
+        self._check()
+        return [("remote", 1.0, {})]
+
+    def search_hybrid_batch(self, query_vectors, sparse_queries, **kwargs):
+        self._check()
+        return [([("remote", 1.0, {})], [("remote", 1.0, {})]) for _ in query_vectors]
+
+
+@pytest.fixture
+def stores(monkeypatch, tmp_path):
+    primary = _FlakyQdrant()
+    local = LocalVectorStore(tmp_path)
+    local.upsert([(_LOCAL_ID, [1.0] + [0.0] * (VECTOR_SIZE - 1), {"doc_id": "d"})])
+    monkeypatch.setattr(factory._settings, "rag_vector_store", "qdrant")
+    monkeypatch.setattr(factory._settings, "rag_local_store_fallback", True)
+    monkeypatch.setattr(factory, "get_qdrant_store", lambda: primary)
+    monkeypatch.setattr(factory, "_local", local)
+    monkeypatch.setattr(factory, "_fallback_until", 0.0)
+    return primary, local
+
+
+def test_connection_error_after_warm_up_switches_to_local(stores):
+    primary, local = stores
+    query = [1.0] + [0.0] * (VECTOR_SIZE - 1)
+    store = factory.get_store()
+    store.ensure_collection()
+    assert store.search(query)[0][0] == "remote"
+
+    primary.up = False
+    assert factory.get_store().search(query, k=1)[0][0] == _LOCAL_ID
+    assert factory.get_store() is local
+
+
+def test_hybrid_search_falls_back_to_dense_only(stores):
+    primary, _ = stores
+    primary.up = False
+    query = [1.0] + [0.0] * (VECTOR_SIZE - 1)
+    [(dense, lexical)] = factory.get_store().search_hybrid_batch([query], [([], [])], k=1)
+    assert [cid for cid, _, _ in dense] == [_LOCAL_ID]
+    assert lexical == []
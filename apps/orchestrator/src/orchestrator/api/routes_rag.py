@@ -1,8 +1,12 @@
-"""RAG API: POST /upload, POST /ingest, GET /search, POST /ask. Upload — в datastore при заданном datastore_url."""
+"""RAG API: POST /upload, POST /ingest, GET /ingest/{job_id}, POST /ingest/{job_id}/cancel, GET /search, POST /ask.
+Upload — в datastore при заданном datastore_url. Ingest — фоновая задача MCP, orchestrator опрашивает её статус."""
+import asyncio
 import logging
+import time
+from typing import Any
 
 import httpx
-from fastapi import APIRouter, File, HTTPException, Query, Request, UploadFile
+from fastapi import APIRouter, File, HTTPException, Query, Request, Response, UploadFile
 
 from contracts.api_schemas import (
     AskRequestBody,
@@ -19,10 +23,46 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 _settings = Settings()
 
+_JOB_ACTIVE = ("queued", "running")
+
+
+def _found(job: dict[str, Any]) -> dict[str, Any]:
+    """Задача, которой нет в MCP (не было или вытеснена из истории), — 404, а не 200 со статусом not_found."""
+    if job.get("status") == "not_found":
+        raise HTTPException(status_code=404, detail=f"ingest job {job.get('job_id')} not found")
+    return job
+
+
+async def _wait_ingest_job(job: dict[str, Any]) -> dict[str, Any]:
+    """Опрос kb_ingest_status до завершения задачи, но не дольше rag_ingest_wait_s. Каждый вызов MCP — короткий."""
+    deadline = time.monotonic() + _settings.rag_ingest_wait_s
+    while job.get("status") in _JOB_ACTIVE and time.monotonic() < deadline:
+        await asyncio.sleep(_settings.rag_ingest_poll_interval_s)
+        job = await mcp_call_tool_async("kb_ingest_status", {"job_id": job["job_id"]})
+    return job
+
+
+def _ingest_response(job: dict[str, Any]) -> IngestResponse:
+    """Итог задачи (result) или текущий прогресс, если задача ещё идёт."""
+    data = job.get("result") or job.get("progress") or {}
+    return IngestResponse(
+        job_id=job.get("job_id"),
+        status=job.get("status") or "unknown",
+        error=job.get("error"),
+        docs_seen=data.get("docs_seen", 0),
+        docs_indexed=data.get("docs_indexed", 0),
+        docs_deleted=data.get("docs_deleted", 0),
+        chunks_indexed=data.get("chunks_indexed", 0),
+        embedding_cache_hits=data.get("embedding_cache_hits", 0),
+        duration_ms=data.get("duration_ms", 0.0),
+    )
+
 
 @router.post("/upload", response_model=UploadStubResponse)
-async def post_upload(files: list[UploadFile] = File(...)):
-    """При заданном datastore_url — проксирует файлы в datastore POST /upload, затем запускает ingest. Иначе заглушка."""
+async def post_upload(files: list[UploadFile] = File(...), wait: bool = Query(default=False)):
+    """При заданном datastore_url — проксирует файлы в datastore POST /upload, затем ставит задачу ingest и сразу
+    возвращает её job_id (статус — GET /ingest/{job_id}); wait=true — как у /ingest: опрашивать задачу
+    не дольше RAG_INGEST_WAIT_S. Иначе заглушка."""
     count = len(files)
     base = (_settings.datastore_url or "").rstrip("/")
     if base:
@@ -56,14 +96,22 @@ async def post_upload(files: list[UploadFile] = File(...)):
             files_count=len(uploaded),
         )
         try:
-            logger.info("[RAG] POST /upload running ingest after upload")
-            result = await mcp_call_tool_async("kb_ingest", {})
-            out.ingest_docs_indexed = result.get("docs_indexed")
-            out.ingest_chunks_indexed = result.get("chunks_indexed")
-            out.ingest_duration_ms = result.get("duration_ms")
+            logger.info("[RAG] POST /upload submitting ingest job after upload")
+            job = await mcp_call_tool_async("kb_ingest", {})
+            if wait:
+                job = await _wait_ingest_job(job)
+            result = _ingest_response(job)
+            out.ingest_job_id = result.job_id
+            out.ingest_status = result.status
+            out.ingest_docs_indexed = result.docs_indexed
+            out.ingest_chunks_indexed = result.chunks_indexed
+            out.ingest_duration_ms = result.duration_ms
+            if result.status == "failed":
+                out.error = f"ingest: {result.error}"
             logger.info(
-                "[RAG] POST /upload ingest done docs=%s chunks=%s duration_ms=%s",
-                out.ingest_docs_indexed, out.ingest_chunks_indexed, out.ingest_duration_ms,
+                "[RAG] POST /upload ingest job_id=%s status=%s docs=%s chunks=%s duration_ms=%s",
+                out.ingest_job_id, out.ingest_status, out.ingest_docs_indexed, out.ingest_chunks_indexed,
+                out.ingest_duration_ms,
             )
         except MCPConnectionError as e:
             logger.error("[RAG] POST /upload ingest failed: %s", e)
@@ -77,23 +125,47 @@ async def post_upload(files: list[UploadFile] = File(...)):
 
 
 @router.post("/ingest", response_model=IngestResponse)
-async def post_ingest():
-    """Индексация через MCP (kb_ingest). Требуется запущенный MCP-сервер."""
-    logger.info("[RAG] POST /ingest start (via MCP)")
+async def post_ingest(
+    response: Response,
+    full: bool = Query(default=False),
+    wait: bool = Query(default=False),
+):
+    """Индексация через MCP (kb_ingest): только изменения datastore; full=true — весь корпус. Требуется запущенный MCP-сервер.
+    Задача выполняется в фоне: ответ сразу — 202 с job_id и текущим прогрессом; wait=true — опрашивать её
+    до завершения (200 с итогом), но не дольше RAG_INGEST_WAIT_S (меньше таймаута gateway), затем тот же 202."""
+    logger.info("[RAG] POST /ingest start (via MCP) full=%s wait=%s", full, wait)
     try:
-        result = await mcp_call_tool_async("kb_ingest", {})
+        job = await mcp_call_tool_async("kb_ingest", {"full": full})
+        if wait:
+            job = _found(await _wait_ingest_job(job))
     except MCPConnectionError as e:
         logger.error("[RAG] POST /ingest MCP unavailable: %s", e)
         raise
+    result = _ingest_response(job)
     logger.info(
-        "[RAG] POST /ingest done docs=%s chunks=%s duration_ms=%s",
-        result.get("docs_indexed"), result.get("chunks_indexed"), result.get("duration_ms"),
-    )
-    return IngestResponse(
-        docs_indexed=result["docs_indexed"],
-        chunks_indexed=result["chunks_indexed"],
-        duration_ms=result["duration_ms"],
+        "[RAG] POST /ingest job_id=%s status=%s docs=%s chunks=%s duration_ms=%s",
+        result.job_id, result.status, result.docs_indexed, result.chunks_indexed, result.duration_ms,
     )
+    if result.status == "failed":
+        raise HTTPException(status_code=500, detail=f"ingest job {result.job_id} failed: {result.error}")
+    if result.status in _JOB_ACTIVE:
+        response.status_code = 202
+    return result
+
+
+@router.get("/ingest/{job_id}", response_model=IngestResponse)
+async def get_ingest_job(job_id: str):
+    """Статус и прогресс задачи ingest (kb_ingest_status)."""
+    job = _found(await mcp_call_tool_async("kb_ingest_status", {"job_id": job_id}))
+    return _ingest_response(job)
+
+
+@router.post("/ingest/{job_id}/cancel", response_model=IngestResponse)
+async def post_ingest_cancel(job_id: str):
+    """Отмена задачи ingest (kb_ingest_cancel): выполняющаяся дописывает начатые окна и завершается со статусом cancelled."""
+    logger.info("[RAG] POST /ingest/%s/cancel", job_id)
+    job = _found(await mcp_call_tool_async("kb_ingest_cancel", {"job_id": job_id}))
+    return _ingest_response(job)
 
 
 @router.get("/search", response_model=list[SearchHit])
@@ -13,6 +13,10 @@ class Settings(BaseAppSettings):
     enable_token_meter: bool = False
     rag_default_k: int = 5
     mcp_server_url: str = ""
-    mcp_timeout: int = 600
+    mcp_timeout: int = 60
+    # /rag/ingest?wait=true: опрос фоновой задачи kb_ingest (интервал и общий лимит ожидания).
+    # Лимит меньше таймаута gateway (120 с), иначе клиент получит 504 вместо 202 с job_id.
+    rag_ingest_poll_interval_s: float = 2.0
+    rag_ingest_wait_s: float = 100.0
     datastore_url: str = ""
     audit_service_url: str = ""
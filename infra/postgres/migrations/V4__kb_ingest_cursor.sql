@@ -0,0 +1,12 @@
+-- Курсор инкрементального ingest: последний обработанный seq ленты изменений datastore (GET /changes)
+
+SET ROLE llm_gate_admin;
+
+CREATE TABLE IF NOT EXISTS llm.kb_ingest_cursor (
+  source         TEXT PRIMARY KEY,
+  epoch          TEXT NOT NULL,
+  seq            BIGINT NOT NULL DEFAULT 0,
+  updated_at     TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+RESET ROLE;
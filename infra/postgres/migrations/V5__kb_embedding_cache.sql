@@ -0,0 +1,16 @@
+-- Персистентный кэш эмбеддингов чанков: ключ (модель, sha256 текста), вектор float32 в bytea, LRU по last_used_at
+
+SET ROLE llm_gate_admin;
+
+CREATE TABLE IF NOT EXISTS llm.kb_embedding_cache (
+  model          TEXT NOT NULL,
+  text_sha256    TEXT NOT NULL,
+  vector         BYTEA NOT NULL,
+  created_at     TIMESTAMPTZ NOT NULL DEFAULT now(),
+  last_used_at   TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (model, text_sha256)
+);
+CREATE INDEX IF NOT EXISTS ix_kb_embedding_cache_last_used_at
+  ON llm.kb_embedding_cache (last_used_at);
+
+RESET ROLE;
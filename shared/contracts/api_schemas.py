@@ -9,8 +9,14 @@ class RunRequest(BaseModel):
 
 
 class IngestResponse(BaseModel):
+    job_id: str | None = None
+    status: str = "succeeded"
+    error: str | None = None
+    docs_seen: int = 0
     docs_indexed: int
+    docs_deleted: int = 0
     chunks_indexed: int
+    embedding_cache_hits: int = 0
     duration_ms: float
 
 
@@ -33,6 +39,8 @@ class UploadStubResponse(BaseModel):
     message: str
     files_count: int
     error: str | None = None
+    ingest_job_id: str | None = None
+    ingest_status: str | None = None
     ingest_docs_indexed: int | None = None
     ingest_chunks_indexed: int | None = None
     ingest_duration_ms: float | None = None
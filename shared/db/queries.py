@@ -1,12 +1,19 @@
-"""SQL-запросы: документы, чанки, аудит runs/tool_calls/retrievals, sql_allowlist, readonly SELECT."""
-from typing import Any
-from uuid import UUID
+"""SQL-запросы: документы, чанки, курсор инкрементального ingest, кэш эмбеддингов, аудит runs/tool_calls/retrievals, sql_allowlist, readonly SELECT."""
+from typing import Any, Iterable
+from uuid import UUID, uuid5
 
 from psycopg import Connection
 from psycopg.rows import dict_row
 
 _DEFAULT_ROW_LIMIT = 200
 
+# Пространство имён UUIDv5 для chunk_id: id чанка считается на клиенте и не требует RETURNING.
+CHUNK_ID_NAMESPACE = UUID("6f1c7a52-3b1e-5d8e-9a43-2c6a0f5b7e11")
+# Пространство имён UUIDv5 для doc_id новых документов: повтор прерванного ingest даёт тот же doc_id.
+DOC_ID_NAMESPACE = UUID("0b8e4d3a-6c2f-5a71-8e90-4d1f7c3a9b25")
+
+_CHUNK_COPY_COLUMNS = "chunk_id, doc_id, chunk_index, section, text, text_tokens_est, embedding_ref"
+
 
 def insert_document(
     conn: Connection,
@@ -70,6 +77,200 @@ def delete_chunks_by_doc_id(conn: Connection, doc_id: UUID) -> None:
     conn.execute("DELETE FROM llm.kb_chunks WHERE doc_id = %s", (doc_id,))
 
 
+def make_chunk_uuid(doc_id: UUID | str, chunk_index: int) -> UUID:
+    """Детерминированный chunk_id: UUIDv5(doc_id:chunk_index). Повторная индексация даёт те же id."""
+    return uuid5(CHUNK_ID_NAMESPACE, f"{doc_id}:{chunk_index}")
+
+
+def make_doc_uuid(doc_key: str) -> UUID:
+    """Детерминированный doc_id нового документа: UUIDv5(doc_key)."""
+    return uuid5(DOC_ID_NAMESPACE, doc_key)
+
+
+def get_documents_by_doc_keys(conn: Connection, doc_keys: list[str]) -> dict[str, tuple[UUID, str | None]]:
+    """Документы пачки одним запросом: {doc_key: (doc_id, sha256)}. Неактивные тоже (doc_key уникален и строка
+    занята), их sha256 — NULL: документ переиндексируется и снова становится активным."""
+    if not doc_keys:
+        return {}
+    rows = conn.execute(
+        "SELECT doc_key, doc_id, CASE WHEN is_active THEN sha256 END FROM llm.kb_documents WHERE doc_key = ANY(%s)",
+        (list(doc_keys),),
+    ).fetchall()
+    return {r[0]: (r[1], r[2]) for r in rows}
+
+
+def get_chunk_fingerprints(conn: Connection, doc_ids: list[UUID]) -> dict[UUID, dict[int, tuple[str, str, UUID]]]:
+    """Отпечатки чанков документов одним запросом: {doc_id: {chunk_index: (sha256 текста, section, chunk_id)}}.
+    sha256 считается в Postgres — текст чанков не передаётся клиенту. chunk_id — сохранённый: у строк, записанных
+    до детерминированных id, он случайный и не совпадает с make_chunk_uuid."""
+    if not doc_ids:
+        return {}
+    rows = conn.execute(
+        """
+        SELECT doc_id, chunk_index, encode(sha256(convert_to(text, 'UTF8')), 'hex'), coalesce(section, ''), chunk_id
+        FROM llm.kb_chunks
+        WHERE doc_id = ANY(%s)
+        """,
+        (list(doc_ids),),
+    ).fetchall()
+    out: dict[UUID, dict[int, tuple[str, str, UUID]]] = {}
+    for doc_id, chunk_index, sha, section, chunk_id in rows:
+        out.setdefault(doc_id, {})[chunk_index] = (sha, section, chunk_id)
+    return out
+
+
+def write_documents(
+    conn: Connection,
+    *,
+    documents: list[tuple[UUID, str, str, str, str, str | None]],
+    changed: list[tuple[UUID, str]],
+    stale_chunk_ids: list[UUID] | None = None,
+) -> dict[str, tuple[UUID, bool]]:
+    """Запись документов пачки в pipeline mode (без ожидания ответа на каждый запрос).
+    documents: (doc_id, doc_key, title, doc_type, language, sha256) — upsert по doc_key (каждая часть большого
+    документа, sha256 = NULL до завершения); строка, которой уже нет (удалена раньше в этом прогоне), создаётся заново,
+    существующая — обновляется и становится активной. changed: (doc_id, sha256) — только обновить sha256;
+    stale_chunk_ids — удалённые и изменённые чанки (изменённые затем вставляются заново тем же COPY, что и новые).
+    Возвращает {doc_key: (doc_id, вставлена ли строка)} — под этим doc_id и пишутся чанки."""
+    ids: dict[str, tuple[UUID, bool]] = {}
+    with conn.pipeline(), conn.cursor() as cur:
+        if changed:
+            cur.executemany(
+                "UPDATE llm.kb_documents SET sha256 = %s, is_active = TRUE, updated_at = now() WHERE doc_id = %s",
+                [(sha, doc_id) for doc_id, sha in changed],
+            )
+        if stale_chunk_ids:
+            cur.execute("DELETE FROM llm.kb_chunks WHERE chunk_id = ANY(%s)", (list(stale_chunk_ids),))
+        if documents:
+            cur.executemany(
+                """
+                INSERT INTO llm.kb_documents (doc_id, doc_key, title, doc_type, language, sha256)
+                VALUES (%s, %s, %s, %s, %s, %s)
+                ON CONFLICT (doc_key) DO UPDATE SET
+                    title = EXCLUDED.title,
+                    doc_type = EXCLUDED.doc_type,
+                    language = EXCLUDED.language,
+                    sha256 = EXCLUDED.sha256,
+                    is_active = TRUE,
+                    updated_at = now()
+                RETURNING doc_key, doc_id, (xmax = 0)
+                """,
+                documents,
+                returning=True,
+            )
+            while True:
+                row = cur.fetchone()
+                if row is not None:
+                    ids[row[0]] = (row[1], row[2])
+                if not cur.nextset():
+                    break
+    return ids
+
+
+def delete_chunks_by_doc_ids(conn: Connection, doc_ids: list[UUID]) -> list[UUID]:
+    """Удалить все чанки документов одним запросом. Возвращает chunk_id удалённых."""
+    if not doc_ids:
+        return []
+    rows = conn.execute(
+        "DELETE FROM llm.kb_chunks WHERE doc_id = ANY(%s) RETURNING chunk_id",
+        (list(doc_ids),),
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def copy_chunks(
+    conn: Connection,
+    rows: Iterable[tuple[UUID, UUID, int, str | None, str, int, str | None]],
+) -> int:
+    """Bulk-вставка чанков через COPY FROM STDIN.
+    rows: (chunk_id, doc_id, chunk_index, section, text, text_tokens_est, embedding_ref). Возвращает число строк."""
+    n = 0
+    with conn.cursor() as cur, cur.copy(f"COPY llm.kb_chunks ({_CHUNK_COPY_COLUMNS}) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+            n += 1
+    return n
+
+
+def delete_document_by_doc_key(conn: Connection, doc_key: str) -> UUID | None:
+    """Удалить документ (чанки удаляются каскадно). Возвращает doc_id или None, если документа не было."""
+    row = conn.execute(
+        "DELETE FROM llm.kb_documents WHERE doc_key = %s RETURNING doc_id",
+        (doc_key,),
+    ).fetchone()
+    return row[0] if row else None
+
+
+def get_ingest_cursor(conn: Connection, source: str) -> tuple[str, int] | None:
+    """Курсор ленты изменений источника: (epoch, seq) или None, если ingest из него ещё не выполнялся."""
+    row = conn.execute(
+        "SELECT epoch, seq FROM llm.kb_ingest_cursor WHERE source = %s",
+        (source,),
+    ).fetchone()
+    if row is None:
+        return None
+    return (row[0], row[1])
+
+
+def save_ingest_cursor(conn: Connection, source: str, epoch: str, seq: int) -> None:
+    """Сохранить курсор ленты изменений источника."""
+    conn.execute(
+        """
+        INSERT INTO llm.kb_ingest_cursor (source, epoch, seq)
+        VALUES (%s, %s, %s)
+        ON CONFLICT (source) DO UPDATE
+        SET epoch = EXCLUDED.epoch, seq = EXCLUDED.seq, updated_at = now()
+        """,
+        (source, epoch, seq),
+    )
+
+
+def touch_cached_embeddings(conn: Connection, model: str, text_sha256s: list[str]) -> dict[str, bytes]:
+    """Векторы из кэша эмбеддингов одним запросом; найденным обновляется last_used_at (LRU). {sha256: bytes}."""
+    if not text_sha256s:
+        return {}
+    rows = conn.execute(
+        """
+        UPDATE llm.kb_embedding_cache SET last_used_at = now()
+        WHERE model = %s AND text_sha256 = ANY(%s)
+        RETURNING text_sha256, vector
+        """,
+        (model, list(text_sha256s)),
+    ).fetchall()
+    return {r[0]: bytes(r[1]) for r in rows}
+
+
+def put_cached_embeddings(conn: Connection, model: str, rows: list[tuple[str, bytes]]) -> None:
+    """Добавить векторы в кэш эмбеддингов: rows — (sha256 текста, float32 bytes). Существующие ключи не трогаются."""
+    if not rows:
+        return
+    with conn.cursor() as cur:
+        cur.executemany(
+            """
+            INSERT INTO llm.kb_embedding_cache (model, text_sha256, vector)
+            VALUES (%s, %s, %s)
+            ON CONFLICT (model, text_sha256) DO NOTHING
+            """,
+            [(model, sha, vec) for sha, vec in rows],
+        )
+
+
+def prune_embedding_cache(conn: Connection, max_rows: int) -> int:
+    """Оставить в кэше эмбеддингов max_rows последних по last_used_at. Возвращает число удалённых строк."""
+    cur = conn.execute(
+        """
+        DELETE FROM llm.kb_embedding_cache
+        WHERE (model, text_sha256) IN (
+            SELECT model, text_sha256 FROM llm.kb_embedding_cache
+            ORDER BY last_used_at DESC
+            OFFSET %s
+        )
+        """,
+        (max_rows,),
+    )
+    return cur.rowcount
+
+
 def insert_chunk(
     conn: Connection,
     *,